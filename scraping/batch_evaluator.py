@@ -0,0 +1,134 @@
+import numpy as np
+from prerequisites_evaluator import OP_ALL, OP_ONE, PrerequisitesEvaluator, Program
+from prerequisites_tree import ReqsDict
+from typing import Sequence
+
+# an instruction of a compiled tree with its bitmask as an array of course IDs:
+# (opcode, number of child node results, IDs of the node's child courses)
+ArrayInstruction = tuple[int, int, np.ndarray]
+
+
+class BatchEvaluator:
+    """
+    Evaluates the prerequisites of every course against many transcripts at
+    once. Transcripts are encoded as a boolean matrix with a row per student
+    and a column per course code in `codes`, and `evaluate()` returns an
+    eligibility matrix with a row per student and a column per course in
+    `courses` (the courses with prerequisites).
+
+    Trees are compiled as by `PrerequisitesEvaluator`, and each program runs
+    once over the whole batch: the columns of the transcripts matrix are
+    packed into bits, 64 students to a word, so each `'all'` or `'one'` node
+    is a bitwise AND or OR reduction over the columns of its child courses,
+    and each `'two'` node is a bitwise at-least-two count over them.
+    """
+
+    def __init__(self, prereqs: dict[str, ReqsDict | str]) -> None:
+        super().__init__()
+        evaluator = PrerequisitesEvaluator(prereqs, {})
+        # course codes of the columns of a transcripts matrix
+        self.codes: list[str] = evaluator.codes
+        self.ids: dict[str, int] = evaluator.ids
+        # course codes of the columns of an eligibility matrix
+        self.courses: list[str] = sorted(evaluator.programs)
+        self.programs: list[list[ArrayInstruction]] = [
+            self._to_arrays(evaluator.programs[code]) for code in self.courses
+        ]
+
+    def encode(self, transcripts: Sequence[Sequence[str]]) -> np.ndarray:
+        """
+        Returns the transcripts matrix for a list of transcripts, each a list
+        of completed course codes. Codes which appear nowhere in the catalog's
+        prerequisites are ignored.
+        """
+        rows = []
+        columns = []
+        for student, codes in enumerate(transcripts):
+            for code in codes:
+                i = self.ids.get(code)
+                if i is not None:
+                    rows.append(student)
+                    columns.append(i)
+        completed = np.zeros((len(transcripts), len(self.codes)), dtype=bool)
+        completed[rows, columns] = True
+        return completed
+
+    def evaluate(self, completed: np.ndarray) -> np.ndarray:
+        """
+        Returns the eligibility matrix for the transcripts matrix `completed`:
+        entry `[s, c]` is whether student `s` has satisfied the prerequisites
+        of `courses[c]`.
+        """
+        students = completed.shape[0]
+        columns = _pack_columns(completed)
+        eligible = np.empty((len(self.courses), columns.shape[1]),
+                            dtype=np.uint64)
+        for k, program in enumerate(self.programs):
+            eligible[k] = _run(program, columns)
+        return np.unpackbits(eligible.view(np.uint8), axis=1, count=students,
+                             bitorder='little').T.view(bool)
+
+    def _to_arrays(self, program: Program) -> list[ArrayInstruction]:
+        instructions = []
+        for opcode, nodes, mask in program:
+            ids = []
+            while mask:
+                lowest = mask & -mask
+                ids.append(lowest.bit_length() - 1)
+                mask ^= lowest
+            instructions.append((opcode, nodes, np.array(ids, dtype=np.intp)))
+        return instructions
+
+
+def _pack_columns(completed: np.ndarray) -> np.ndarray:
+    """
+    Packs the columns of a boolean matrix into bits: returns an array with a
+    row of 64-bit words for each column, where bit `s` of a row is entry `s`
+    of the column. This is equivalent to `np.packbits(completed.T, axis=1)`
+    (padded to whole words), but works on groups of 8 rows at a time, which is
+    several times faster than packing the transposed matrix directly.
+    """
+    rows, width = completed.shape
+    full = rows - rows % 8
+    groups = np.ascontiguousarray(completed[:full]).view(np.uint8) \
+        .reshape(-1, 8, width)
+    # one byte for every 8 rows, rounded up to a multiple of 8 bytes
+    packed = np.zeros((-(-rows // 64) * 8, width), dtype=np.uint8)
+    for bit in range(8):
+        packed[:full // 8] |= groups[:, bit, :] << bit
+    for bit in range(rows - full):
+        packed[full // 8] |= completed[full + bit].view(np.uint8) << bit
+    return np.ascontiguousarray(packed.T).view(np.uint64)
+
+
+def _run(program: list[ArrayInstruction], columns: np.ndarray) -> np.ndarray:
+    """
+    Evaluates a compiled tree against every student at once, given the
+    packed columns of the transcripts matrix. Returns the packed result.
+    """
+    stack: list[np.ndarray] = []
+    for opcode, nodes, ids in program:
+        if nodes:
+            children = stack[-nodes:]
+            del stack[-nodes:]
+        else:
+            children = []
+        if opcode == OP_ALL:
+            value = np.bitwise_and.reduce(columns[ids], axis=0) if len(ids) \
+                else np.full(columns.shape[1], ~np.uint64(0))
+            for child in children:
+                value &= child
+        elif opcode == OP_ONE:
+            value = np.bitwise_or.reduce(columns[ids], axis=0) if len(ids) \
+                else np.zeros(columns.shape[1], dtype=np.uint64)
+            for child in children:
+                value |= child
+        else:
+            # bits set in at least one and at least two of the rows
+            ones = np.zeros(columns.shape[1], dtype=np.uint64)
+            value = np.zeros(columns.shape[1], dtype=np.uint64)
+            for row in [*columns[ids], *children]:
+                value |= ones & row
+                ones |= row
+        stack.append(value)
+    return stack[0]
@@ -0,0 +1,91 @@
+"""
+Benchmarks batch evaluation of prerequisites over many transcripts with NumPy,
+on the courses in the data directory written by the last scrape, against
+evaluating each transcript separately with the compiled evaluator.
+Transcripts are random sets of courses from the catalog, and the batch size
+is scaled up by factors of 10 to the given maximum.
+
+Usage, from the `scraping` directory:
+```
+python -m benchmarks.batch_evaluator [--data path/to/dir] [--max-students N]
+                                     [--courses N] [--sample N]
+```
+"""
+
+import argparse
+from batch_evaluator import BatchEvaluator
+from benchmarks.evaluator import _load_prereqs
+import numpy as np
+from prerequisites_evaluator import PrerequisitesEvaluator
+import sys
+import time
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks batch evaluation of prerequisites over many transcripts.')
+    parser.add_argument('--data', action='store', default='data',
+                        metavar='path/to/dir', dest='data_dir',
+                        help='directory of course files to read prerequisites from; defaults to data')
+    parser.add_argument('--max-students', action='store', type=int,
+                        default=100000, metavar='N', dest='max_students',
+                        help='largest number of transcripts to evaluate at once; defaults to 100000')
+    parser.add_argument('--courses', action='store', type=int, default=40,
+                        metavar='N', dest='courses',
+                        help='number of completed courses in each transcript; defaults to 40')
+    parser.add_argument('--sample', action='store', type=int, default=500,
+                        metavar='N', dest='sample',
+                        help='number of transcripts to evaluate separately, for comparison and to check results; defaults to 500')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _get_args()
+    try:
+        prereqs = _load_prereqs(args.data_dir)
+    except (OSError, ValueError, KeyError) as error:
+        print('Error while reading courses:\n%s: %s' %
+              (type(error), error), file=sys.stderr)
+        sys.exit(1)
+    if len(prereqs) == 0:
+        print('No courses with prerequisites found in %s' % args.data_dir,
+              file=sys.stderr)
+        sys.exit(1)
+
+    batch = BatchEvaluator(prereqs)
+    evaluator = PrerequisitesEvaluator(prereqs, {})
+    print('%d courses with prerequisites over %d course codes' %
+          (len(batch.courses), len(batch.codes)))
+
+    rng = np.random.default_rng(0)
+    students = 1000
+    while students <= args.max_students:
+        completed = np.zeros((students, len(batch.codes)), dtype=bool)
+        taken = rng.integers(0, len(batch.codes), (students, args.courses))
+        completed[np.arange(students)[:, None], taken] = True
+
+        start = time.perf_counter()
+        eligible = batch.evaluate(completed)
+        batch_time = time.perf_counter() - start
+
+        sample = min(args.sample, students)
+        bitsets = [
+            evaluator.bitset(batch.codes[i] for i in np.flatnonzero(row))
+            for row in completed[:sample]
+        ]
+        start = time.perf_counter()
+        results = [evaluator.unlocked(bitset) for bitset in bitsets]
+        separate_time = (time.perf_counter() - start) / sample * students
+        for row, unlocked in zip(eligible[:sample], results):
+            if row.tolist() != [code in unlocked for code in batch.courses]:
+                print('Batch and separate results differ', file=sys.stderr)
+                sys.exit(1)
+
+        print('%7d students: %8.1fms batched, ~%8.1fms separately (%.0fx), %.0f students/s' % (
+            students,
+            batch_time * 1000,
+            separate_time * 1000,
+            separate_time / batch_time,
+            students / batch_time
+        ))
+        students *= 10
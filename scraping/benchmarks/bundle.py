@@ -0,0 +1,117 @@
+"""
+Benchmarks reading courses from the bundle written by the last scrape with
+`--bundle` against reading the course files in the data directory: looking
+up random courses, decoded or as raw bytes, and listing every course code.
+
+Usage, from the `scraping` directory:
+```
+python -m benchmarks.bundle [--data path/to/dir] [--lookups N] [--repeat N]
+```
+"""
+
+import argparse
+from benchmarks.parser import _best_time
+from course_bundle import CourseBundle
+import json
+import os
+from postprocessor import BUNDLE_DIR, INDEX_FILES
+import random
+import sys
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks reading courses from the course bundle against reading course files.')
+    parser.add_argument('--data', action='store', default='data',
+                        metavar='path/to/dir', dest='data_dir',
+                        help='directory of course files and the bundle to read; defaults to data')
+    parser.add_argument('--lookups', action='store', type=int, default=1000,
+                        metavar='N', dest='lookups',
+                        help='number of random courses to look up; defaults to 1000')
+    parser.add_argument('--repeat', action='store', type=int, default=5,
+                        metavar='N', dest='repeat',
+                        help='number of times to run each benchmark, keeping the fastest; defaults to 5')
+    return parser.parse_args()
+
+
+def _course_filename(code: str) -> str:
+    return code.replace(' ', '_').replace('–', '-') + '.json'
+
+
+def _list_files(data_dir: str) -> list[str]:
+    return [filename for filename in os.listdir(data_dir)
+            if filename.endswith('.json') and filename not in INDEX_FILES]
+
+
+def _read_files(data_dir: str, codes: list[str]) -> None:
+    for code in codes:
+        with open(os.path.join(data_dir, _course_filename(code)),
+                  mode='rb') as file:
+            json.loads(file.read())
+
+
+def _read_file_bytes(data_dir: str, codes: list[str]) -> None:
+    for code in codes:
+        with open(os.path.join(data_dir, _course_filename(code)),
+                  mode='rb') as file:
+            file.read()
+
+
+def _read_bundle(path: str, codes: list[str]) -> None:
+    with CourseBundle(path) as bundle:
+        for code in codes:
+            bundle.get(code)
+
+
+def _read_bundle_bytes(path: str, codes: list[str]) -> None:
+    with CourseBundle(path) as bundle:
+        for code in codes:
+            bundle.get_bytes(code)
+
+
+def _list_bundle(path: str) -> None:
+    with CourseBundle(path) as bundle:
+        list(bundle.codes())
+
+
+if __name__ == '__main__':
+    args = _get_args()
+    path = os.path.join(args.data_dir, BUNDLE_DIR, 'courses.bin')
+    try:
+        with CourseBundle(path) as bundle:
+            all_codes = list(bundle.codes())
+            for code in all_codes:
+                with open(os.path.join(args.data_dir, _course_filename(code)),
+                          mode='rb') as file:
+                    if file.read() != bundle.get_bytes(code):
+                        print('Bundle differs from the course file for %s' %
+                              code, file=sys.stderr)
+                        sys.exit(1)
+    except (OSError, ValueError) as error:
+        print('Error while reading bundle (scrape with --bundle first):\n%s: %s' %
+              (type(error), error), file=sys.stderr)
+        sys.exit(1)
+    if len(all_codes) == 0:
+        print('No courses found in %s' % path, file=sys.stderr)
+        sys.exit(1)
+    codes = random.Random(0).choices(all_codes, k=args.lookups)
+    print('%d courses in the bundle, %d random lookups' % (
+        len(all_codes), len(codes)))
+
+    print('\n%-24s %10s %10s %8s' % ('Benchmark', 'Files', 'Bundle', 'Speedup'))
+    for name, files_run, bundle_run in (
+        ('Lookups (decoded)',
+         lambda: _read_files(args.data_dir, codes),
+         lambda: _read_bundle(path, codes)),
+        ('Lookups (bytes)',
+         lambda: _read_file_bytes(args.data_dir, codes),
+         lambda: _read_bundle_bytes(path, codes)),
+        ('List course codes',
+         lambda: _list_files(args.data_dir),
+         lambda: _list_bundle(path)),
+    ):
+        files_time = _best_time(files_run, args.repeat)
+        bundle_time = _best_time(bundle_run, args.repeat)
+        print('%-24s %8.1fms %8.1fms %7.1fx' % (
+            name, files_time * 1000, bundle_time * 1000,
+            files_time / bundle_time))
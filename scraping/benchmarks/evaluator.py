@@ -0,0 +1,148 @@
+"""
+Benchmarks the compiled prerequisites evaluator on the courses in the data
+directory written by the last scrape, against walking each course's
+prerequisites tree directly. Transcripts are random sets of courses from the
+catalog.
+
+Usage, from the `scraping` directory:
+```
+python -m benchmarks.evaluator [--data path/to/dir] [--transcripts N]
+                               [--courses N] [--repeat N]
+```
+"""
+
+import argparse
+from benchmarks.parser import _best_time
+import json
+import os
+from postprocessor import INDEX_FILES
+from prerequisites_evaluator import PrerequisitesEvaluator, Transcript
+from prerequisites_tree import ReqsDict
+import random
+import sys
+import time
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the compiled prerequisites evaluator on scraped courses.')
+    parser.add_argument('--data', action='store', default='data',
+                        metavar='path/to/dir', dest='data_dir',
+                        help='directory of course files to read prerequisites from; defaults to data')
+    parser.add_argument('--transcripts', action='store', type=int, default=200,
+                        metavar='N', dest='transcripts',
+                        help='number of random transcripts to evaluate; defaults to 200')
+    parser.add_argument('--courses', action='store', type=int, default=40,
+                        metavar='N', dest='courses',
+                        help='number of completed courses in each transcript; defaults to 40')
+    parser.add_argument('--repeat', action='store', type=int, default=5,
+                        metavar='N', dest='repeat',
+                        help='number of times to run each benchmark, keeping the fastest; defaults to 5')
+    return parser.parse_args()
+
+
+def _load_prereqs(data_dir: str) -> dict[str, ReqsDict | str]:
+    prereqs = {}
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.json') or filename in INDEX_FILES:
+            continue
+        with open(os.path.join(data_dir, filename), mode='r') as file:
+            course = json.load(file)
+        if 'prereqs' in course:
+            prereqs[course['code']] = course['prereqs']
+    return prereqs
+
+
+def _successors(prereqs: dict[str, ReqsDict | str]) -> dict[str, list[str]]:
+    """
+    Rebuilds the postprocessor's successor map, since course files only list
+    the successors of courses which are in the catalog.
+    """
+    successors: dict[str, list[str]] = {}
+
+    def visit(code: str, tree: ReqsDict | str) -> None:
+        if isinstance(tree, str):
+            successors.setdefault(tree, []).append(code)
+        else:
+            for child in tree['courses']:
+                visit(code, child)
+    for code, tree in prereqs.items():
+        visit(code, tree)
+    return successors
+
+
+def _walk(tree: ReqsDict | str, completed: set[str]) -> bool:
+    if isinstance(tree, str):
+        return tree in completed
+    satisfied = [_walk(child, completed) for child in tree['courses']]
+    match tree['type']:
+        case 'all':
+            return all(satisfied)
+        case 'one':
+            return any(satisfied)
+        case _:
+            # duplicate children only count once
+            distinct = {json.dumps(child): value for child, value
+                        in zip(tree['courses'], satisfied)}
+            return sum(distinct.values()) >= 2
+
+
+if __name__ == '__main__':
+    args = _get_args()
+    try:
+        prereqs = _load_prereqs(args.data_dir)
+    except (OSError, ValueError, KeyError) as error:
+        print('Error while reading courses:\n%s: %s' %
+              (type(error), error), file=sys.stderr)
+        sys.exit(1)
+    if len(prereqs) == 0:
+        print('No courses with prerequisites found in %s' % args.data_dir,
+              file=sys.stderr)
+        sys.exit(1)
+    successors = _successors(prereqs)
+
+    compile_time = _best_time(
+        lambda: PrerequisitesEvaluator(prereqs, successors), args.repeat)
+    evaluator = PrerequisitesEvaluator(prereqs, successors)
+    print('%d courses with prerequisites over %d course codes, compiled in %.1fms' % (
+        len(evaluator.programs), len(evaluator.codes), compile_time * 1000))
+
+    rng = random.Random(0)
+    transcripts = [
+        rng.sample(evaluator.codes, min(args.courses, len(evaluator.codes)))
+        for _ in range(args.transcripts)
+    ]
+    bitsets = [evaluator.bitset(codes) for codes in transcripts]
+    sets = [set(codes) for codes in transcripts]
+
+    for bitset, completed in zip(bitsets, sets):
+        expected = {code for code, tree in prereqs.items()
+                    if _walk(tree, completed)}
+        transcript = Transcript(evaluator)
+        for code in completed:
+            transcript.add(code)
+        if evaluator.unlocked(bitset) != expected \
+                or transcript.unlocked != expected:
+            print('Compiled and tree-walking results differ', file=sys.stderr)
+            sys.exit(1)
+
+    walk_time = _best_time(lambda: [
+        [code for code, tree in prereqs.items() if _walk(tree, completed)]
+        for completed in sets
+    ], args.repeat) / len(sets)
+    compiled_time = _best_time(
+        lambda: [evaluator.unlocked(bitset) for bitset in bitsets],
+        args.repeat) / len(bitsets)
+    print('Full evaluation:  %8.1fus compiled, %8.1fus walking trees (%.1fx)' % (
+        compiled_time * 1e6, walk_time * 1e6, walk_time / compiled_time))
+
+    add_time = float('inf')
+    for _ in range(args.repeat):
+        empty = [Transcript(evaluator) for _ in transcripts]
+        start = time.perf_counter()
+        for transcript, codes in zip(empty, transcripts):
+            for code in codes:
+                transcript.add(code)
+        add_time = min(add_time, time.perf_counter() - start)
+    add_time /= sum(len(codes) for codes in transcripts)
+    print('Incremental add:  %8.1fus per completed course' % (add_time * 1e6))
@@ -0,0 +1,80 @@
+"""
+Benchmarks the single-pass course listing extractor against the original
+selector-based one, using the department pages of a saved catalog archive (see
+`scrape.py --record`). Both extractors must produce identical listings.
+
+Usage, from the `scraping` directory:
+```
+python -m benchmarks.extract_listings path/to/archive [--repeat N]
+```
+"""
+
+import argparse
+from catalog_archive import CatalogArchive
+from listing_extractor import extract_listings, extract_listings_with_selectors
+from scrapy.http import HtmlResponse
+import sys
+import time
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks course listing extraction on saved catalog pages.')
+    parser.add_argument('archive_path', metavar='path/to/archive',
+                        help='catalog archive (a directory, or a file ending in .zip)')
+    parser.add_argument('--repeat', action='store', type=int, default=5,
+                        metavar='N', dest='repeat',
+                        help='number of times to extract each page; defaults to 5')
+    return parser.parse_args()
+
+
+def _load_pages(archive: CatalogArchive) -> list[tuple[str, HtmlResponse]]:
+    pages = []
+    for name in archive.names():
+        if not name.startswith('courses/'):
+            continue
+        url = f'https://catalog.ucsd.edu/{name}'
+        response = HtmlResponse(url=url, body=archive.read(name))
+        # parse the document up front, so only extraction is timed
+        response.selector
+        pages.append((name, response))
+    return pages
+
+
+def _time_extractor(extractor, pages, repeat: int) -> tuple[float, int]:
+    listings_count = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, response in pages:
+            listings_count += sum(1 for _ in extractor(response.selector))
+    return (time.perf_counter() - start, listings_count)
+
+
+if __name__ == '__main__':
+    args = _get_args()
+    archive = CatalogArchive(args.archive_path, mode='r')
+    pages = _load_pages(archive)
+    archive.close()
+    if len(pages) == 0:
+        print('No department pages found in archive', file=sys.stderr)
+        sys.exit(1)
+
+    mismatches = 0
+    for name, response in pages:
+        expected = list(extract_listings_with_selectors(response.selector))
+        if list(extract_listings(response.selector)) != expected:
+            print('Extractors disagree on %s' % name, file=sys.stderr)
+            mismatches += 1
+
+    results = []
+    for label, extractor in (('selectors', extract_listings_with_selectors),
+                             ('single pass', extract_listings)):
+        elapsed, listings_count = _time_extractor(extractor, pages, args.repeat)
+        results.append(elapsed)
+        print('%-12s %8.3f s  %10.0f listings/s' %
+              (label, elapsed, listings_count / elapsed))
+    print('%d pages, %d repetitions, speedup %.1fx' %
+          (len(pages), args.repeat, results[0] / results[1]))
+    if mismatches > 0:
+        print('%d pages had mismatched listings' % mismatches, file=sys.stderr)
+        sys.exit(1)
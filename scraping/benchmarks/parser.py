@@ -0,0 +1,211 @@
+"""
+Benchmarks the course listing parser on the courses in the data directory
+written by the last scrape, plus a set of synthetic worst-case requirements
+strings. Reports courses per second, the cost of each parser stage, and peak
+memory use. Results can be saved as a baseline, and later runs compared
+against it: the run fails if any result is worse than the baseline by more
+than the threshold.
+
+Title lines are rebuilt from each course's code, title, and units, so they may
+differ slightly from the catalog's (for example, crosslistings are lost).
+
+Usage, from the `scraping` directory:
+```
+python -m benchmarks.parser [--data path/to/dir] [--repeat N]
+                            [--save path/to/baseline.json]
+                            [--compare path/to/baseline.json] [--threshold X]
+```
+"""
+
+import argparse
+from course_parser import CourseInfoParser, ListingText
+from instrumentation import instrument_parser
+import json
+import logging
+from metrics import ScrapingMetrics
+import os
+from postprocessor import INDEX_FILES
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the course listing parser on scraped courses and synthetic worst cases.')
+    parser.add_argument('--data', action='store', default='data',
+                        metavar='path/to/dir', dest='data_dir',
+                        help='directory of course files to read descriptions from; defaults to data')
+    parser.add_argument('--repeat', action='store', type=int, default=5,
+                        metavar='N', dest='repeat',
+                        help='number of times to run each benchmark, keeping the fastest; defaults to 5')
+    parser.add_argument('--save', action='store', metavar='path/to/baseline.json',
+                        dest='save_path', help='write the results to this file as a new baseline')
+    parser.add_argument('--compare', action='store', metavar='path/to/baseline.json',
+                        dest='compare_path', help='compare the results against this baseline and fail if any have regressed')
+    parser.add_argument('--threshold', action='store', type=float, default=0.2,
+                        metavar='X', dest='threshold',
+                        help='fraction by which a result may be worse than the baseline before it counts as a regression; defaults to 0.2')
+    return parser.parse_args()
+
+
+def _load_listings(data_dir: str) -> list[ListingText]:
+    listings = []
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.json') or filename in INDEX_FILES:
+            continue
+        with open(os.path.join(data_dir, filename), mode='r') as file:
+            course = json.load(file)
+        title_line = f"{course['code']}. {course['title']} ({course['units']})"
+        listings.append((title_line, course.get('description')))
+    return listings
+
+
+def _synthetic_cases() -> dict[str, str]:
+    """
+    Returns descriptions built to exercise the slowest paths through the
+    parser, by name. The first few are long but within the parser's limits;
+    the rest are malformed enough that they are quarantined.
+    """
+    letters = [chr(ord('A') + i) for i in range(26)]
+    return {
+        'long sequence': 'Prerequisites: MATH 20' + '-'.join(letters) + '.',
+        'long numeric sequence': 'Prerequisites: MATH 1-400.',
+        'long shorthand list': 'Prerequisites: CSE 10, '
+        + ', '.join(str(n) for n in range(11, 311)) + '.',
+        'many semicolons': 'Prerequisites: '
+        + '; '.join(f'CSE {n} or MATH {n}' for n in range(1, 81)) + '.',
+        'deep parentheses': 'Prerequisites: ' + '(' * 60
+        + 'CSE 11 or CSE 12' + ' and CSE 13)' * 60 + '.',
+        'long one of': 'Prerequisites: one of '
+        + ', '.join(f'PHYS {n}A' for n in range(1, 171)) + '.',
+        'filler text': 'Prerequisites: CSE 11 '
+        + 'with a grade of C or better in any course ' * 40 + 'or CSE 8B.',
+        # adversarial inputs, which used to take quadratic time or crash and
+        # should now be parsed or quarantined quickly
+        'no course codes': 'Prerequisites: one of ' + 'the following ' * 1000,
+        'line breaks': 'Prerequisites: CSE 11 and\n' * 1000,
+        'uppercase run': 'Prerequisites: ' + 'A' * 10000,
+        'unclosed grades': 'Prerequisites: CSE 11 ' + 'grade of C ' * 1000,
+        'too deep parentheses': 'Prerequisites: ' + '(' * 400 + 'CSE 11'
+        + ')' * 400 + '.',
+        'unclosed parentheses': 'Prerequisites: MATH 20A or ' + '(' * 1900
+        + 'MATH 20B.',
+        'huge numeric sequence': 'Prerequisites: MATH 1-99999999.',
+        'many sections': ('Prerequisites: CSE 11 ' + 'grade of C ' * 150
+                          + '. ') * 1000
+    }
+
+
+def _best_time(function: Callable[[], object], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _run(listings: list[ListingText], repeat: int) -> dict:
+    logger = logging.getLogger('benchmark')
+    logger.disabled = True
+    parser = CourseInfoParser(logger, ScrapingMetrics())
+
+    elapsed = _best_time(lambda: list(parser.parse_many(listings)), repeat)
+    results = {
+        'courses': len(listings),
+        'coursesPerSecond': len(listings) / elapsed
+    }
+
+    tracemalloc.start()
+    list(parser.parse_many(listings))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['peakMemoryKiB'] = peak / 1024
+
+    # time stages separately, since instrumentation adds overhead
+    metrics = ScrapingMetrics()
+    metrics.enable_stage_timings()
+    instrumented = CourseInfoParser(logger, metrics)
+    instrument_parser(instrumented)
+    list(instrumented.parse_many(listings))
+    results['stages'] = metrics.get_stage_timings()['stages']
+
+    results['syntheticMs'] = {
+        name: _best_time(
+            lambda: parser.parse_requirements(description), repeat) * 1000
+        for name, description in _synthetic_cases().items()
+    }
+    return results
+
+
+def _print_results(results: dict) -> None:
+    print('%d courses, %.0f courses/s, peak memory %.0f KiB' % (
+        results['courses'],
+        results['coursesPerSecond'],
+        results['peakMemoryKiB']
+    ))
+    print('%-24s %7s %10s %9s %9s %9s' %
+          ('stage', 'calls', 'total', 'p50', 'p99', 'max'))
+    for stage, stats in results['stages'].items():
+        print('%-24s %7d %8.1fms %7.3fms %7.3fms %7.3fms' % (
+            stage,
+            stats['count'],
+            stats['totalMs'],
+            stats['p50Ms'],
+            stats['p99Ms'],
+            stats['maxMs']
+        ))
+    print('%-24s %10s' % ('synthetic case', 'time'))
+    for name, ms in results['syntheticMs'].items():
+        print('%-24s %8.3fms' % (name, ms))
+
+
+def _find_regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Returns a description of each result which is worse than `baseline` by
+    more than `threshold`.
+    """
+    regressions = []
+    expected = baseline['coursesPerSecond']
+    if results['coursesPerSecond'] < expected * (1 - threshold):
+        regressions.append('courses/s: %.0f, baseline %.0f' %
+                           (results['coursesPerSecond'], expected))
+    for name, expected in baseline['syntheticMs'].items():
+        ms = results['syntheticMs'].get(name)
+        if ms is not None and ms > expected * (1 + threshold):
+            regressions.append('%s: %.3fms, baseline %.3fms' %
+                               (name, ms, expected))
+    return regressions
+
+
+if __name__ == '__main__':
+    args = _get_args()
+    try:
+        listings = _load_listings(args.data_dir)
+    except (OSError, ValueError, KeyError) as error:
+        print('Error while reading courses:\n%s: %s' %
+              (type(error), error), file=sys.stderr)
+        sys.exit(1)
+    if len(listings) == 0:
+        print('No courses found in %s' % args.data_dir, file=sys.stderr)
+        sys.exit(1)
+
+    results = _run(listings, args.repeat)
+    _print_results(results)
+
+    if args.save_path is not None:
+        with open(args.save_path, mode='w') as file:
+            json.dump(results, file, indent=2)
+        print('Saved baseline to %s' % args.save_path)
+    if args.compare_path is not None:
+        with open(args.compare_path, mode='r') as file:
+            baseline = json.load(file)
+        regressions = _find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print('Regression: %s' % regression, file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+        print('No regressions beyond %.0f%% of baseline' %
+              (args.threshold * 100))
@@ -0,0 +1,127 @@
+"""
+Benchmarks the term planner on the courses in the data directory written by
+the last scrape. Goals are the courses with the longest chains of
+prerequisites in the catalog, planned one at a time and then all together.
+
+Usage, from the `scraping` directory:
+```
+python -m benchmarks.planner [--data path/to/dir] [--goals N]
+                             [--max-units N] [--repeat N]
+```
+"""
+
+import argparse
+from benchmarks.parser import _best_time
+import json
+import math
+import os
+from postprocessor import INDEX_FILES
+from prerequisite_solver import parse_units
+from prerequisites_tree import ReqsDict
+import sys
+from term_planner import DEFAULT_MAX_UNITS, Plan, TermPlanner
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the term planner on scraped courses.')
+    parser.add_argument('--data', action='store', default='data',
+                        metavar='path/to/dir', dest='data_dir',
+                        help='directory of course files to read requirements from; defaults to data')
+    parser.add_argument('--goals', action='store', type=int, default=20,
+                        metavar='N', dest='goals',
+                        help='number of courses with the longest chains of prerequisites to plan for; defaults to 20')
+    parser.add_argument('--max-units', action='store', type=float,
+                        default=DEFAULT_MAX_UNITS, metavar='N', dest='max_units',
+                        help='cap on the units taken in one term; defaults to %g' % DEFAULT_MAX_UNITS)
+    parser.add_argument('--repeat', action='store', type=int, default=5,
+                        metavar='N', dest='repeat',
+                        help='number of times to run each benchmark, keeping the fastest; defaults to 5')
+    return parser.parse_args()
+
+
+def _load_courses(data_dir: str) -> tuple[dict[str, ReqsDict | str],
+                                          dict[str, ReqsDict | str],
+                                          dict[str, float]]:
+    prereqs = {}
+    coreqs = {}
+    units = {}
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.json') or filename in INDEX_FILES:
+            continue
+        with open(os.path.join(data_dir, filename), mode='r') as file:
+            course = json.load(file)
+        if 'prereqs' in course:
+            prereqs[course['code']] = course['prereqs']
+        if 'coreqs' in course:
+            coreqs[course['code']] = course['coreqs']
+        units[course['code']] = parse_units(course.get('units'))
+    return prereqs, coreqs, units
+
+
+def _check(planner: TermPlanner, goals: list[str], plan: Plan,
+           max_units: float) -> bool:
+    """
+    Returns whether a plan includes every goal, satisfies every requirement,
+    and keeps to the cap.
+    """
+    taken: set[str] = set()
+    for term, units in zip(plan['terms'], plan['units']):
+        if units > max_units and len(term) > 1:
+            return False
+        for code in term:
+            if not planner._satisfied(planner.prereqs.get(code), taken) \
+                    or not planner._satisfied(planner.coreqs.get(code),
+                                              taken, set(term)):
+                return False
+        taken.update(term)
+    return taken.issuperset(goals)
+
+
+if __name__ == '__main__':
+    args = _get_args()
+    try:
+        prereqs, coreqs, units = _load_courses(args.data_dir)
+    except (OSError, ValueError, KeyError) as error:
+        print('Error while reading courses:\n%s: %s' %
+              (type(error), error), file=sys.stderr)
+        sys.exit(1)
+    if len(prereqs) == 0:
+        print('No courses with prerequisites found in %s' % args.data_dir,
+              file=sys.stderr)
+        sys.exit(1)
+
+    build_time = _best_time(lambda: TermPlanner.from_trees(
+        prereqs, coreqs, units, args.max_units), args.repeat)
+    planner = TermPlanner.from_trees(prereqs, coreqs, units, args.max_units)
+    reachable = [code for code, term in planner.earliest.items()
+                 if term < math.inf]
+    print('%d course codes, %d reachable, earliest terms precomputed in %.1fms' % (
+        len(planner.earliest), len(reachable), build_time * 1000))
+
+    goals = sorted(reachable, key=lambda code: (-planner.earliest[code], code))
+    goals = goals[:args.goals]
+    print('\n%-12s %8s %6s %6s %10s' % ('Goal', 'Earliest', 'Terms', 'Bound', 'Time'))
+    total_time = 0.0
+    for code in goals + [None]:
+        targets = goals if code is None else [code]
+        try:
+            plan = planner.plan(targets)
+        except ValueError as error:
+            print('Error while planning %s:\n%s: %s' % (
+                code or 'all goals', type(error), error), file=sys.stderr)
+            sys.exit(1)
+        if plan is None or not _check(planner, targets, plan, args.max_units):
+            print('Invalid plan for %s' % (code or 'all goals'), file=sys.stderr)
+            sys.exit(1)
+        plan_time = _best_time(lambda: planner.plan(targets), args.repeat)
+        if code is None:
+            print('%-12s %8s %6d %6d %8.1fms' % (
+                'all goals', '', len(plan['terms']), plan['minimum'],
+                plan_time * 1000))
+        else:
+            total_time += plan_time
+            print('%-12s %8d %6d %6d %8.1fms' % (
+                code, planner.earliest[code], len(plan['terms']),
+                plan['minimum'], plan_time * 1000))
+    print('\nMean time per goal: %.1fms' % (total_time / len(goals) * 1000))
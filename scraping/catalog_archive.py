@@ -0,0 +1,121 @@
+import logging
+import os
+from scrapy.http import HtmlResponse
+from urllib.parse import urlparse
+import zipfile
+
+
+class CatalogArchive:
+    """
+    A snapshot of catalog pages saved to disk, so that a crawl can be rerun
+    without network access. An archive is either a directory or a single
+    `.zip` file, in which each page is stored under its URL path (for example,
+    `front/courses.html` or `courses/CSE.html`).
+
+    Open an archive with `mode='r'` to replay it or `mode='w'` to record a new
+    one, and call `close()` when finished.
+    """
+
+    def __init__(self, path: str, mode: str = 'r') -> None:
+        super().__init__()
+        self.logger = logging.getLogger('catalogarchive')
+        self.path = path
+        self.mode = mode
+        self.zip_file: zipfile.ZipFile | None = None
+        if path.endswith('.zip'):
+            self.zip_file = zipfile.ZipFile(
+                path, mode=mode, compression=zipfile.ZIP_DEFLATED)
+        elif mode == 'w':
+            os.makedirs(path, exist_ok=True)
+        elif not os.path.isdir(path):
+            raise FileNotFoundError(f'No such archive: {path}')
+
+    def read(self, url: str) -> bytes | None:
+        """
+        Returns the saved body of the page at `url`, or `None` if the page is
+        not in the archive.
+        """
+        name = self._entry_name(url)
+        try:
+            if self.zip_file is not None:
+                return self.zip_file.read(name)
+            with open(os.path.join(self.path, name), mode='rb') as file:
+                return file.read()
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def names(self) -> list[str]:
+        """
+        Returns the entry names of all pages in the archive, in sorted order.
+        Each name can be passed to `read()` in place of a URL.
+        """
+        if self.zip_file is not None:
+            return sorted(name for name in self.zip_file.namelist()
+                          if not name.endswith('/'))
+        names = []
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                path = os.path.relpath(
+                    os.path.join(dirpath, filename), self.path)
+                names.append(path.replace(os.sep, '/'))
+        return sorted(names)
+
+    def write(self, url: str, body: bytes) -> None:
+        """
+        Saves `body` as the page at `url`.
+        """
+        name = self._entry_name(url)
+        if self.zip_file is not None:
+            self.zip_file.writestr(name, body)
+            return
+        path = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode='wb') as file:
+            file.write(body)
+
+    def close(self) -> None:
+        if self.zip_file is not None:
+            self.zip_file.close()
+            self.zip_file = None
+
+    def _entry_name(self, url: str) -> str:
+        path = urlparse(url).path.lstrip('/')
+        # prevent entries from escaping the archive directory
+        parts = [part for part in path.split('/') if part not in ('', '.', '..')]
+        return '/'.join(parts)
+
+
+class ArchiveMiddleware:
+    """
+    Downloader middleware which connects the spider to a `CatalogArchive`. If
+    the spider has an `archive` to replay, every request is answered from it
+    and nothing is downloaded. If the spider has an `archive_recorder`, every
+    successful response is saved to it.
+    """
+
+    def process_request(self, request, spider):
+        archive: CatalogArchive | None = getattr(spider, 'archive', None)
+        if archive is None:
+            return None
+        body = archive.read(request.url)
+        if body is None:
+            spider.logger.error('Page is not in the archive: %s', request.url)
+            return HtmlResponse(url=request.url, status=404, body=b'',
+                                request=request, flags=['archive'])
+        return HtmlResponse(url=request.url, body=body, request=request,
+                            flags=['archive'])
+
+    def process_response(self, request, response, spider):
+        recorder: CatalogArchive | None = getattr(
+            spider, 'archive_recorder', None)
+        if recorder is not None and response.status == 200:
+            try:
+                recorder.write(request.url, response.body)
+            except OSError as error:
+                spider.logger.error(
+                    'Error while recording %s:\n%s: %s',
+                    request.url,
+                    type(error),
+                    error
+                )
+        return response
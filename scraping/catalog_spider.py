@@ -1,7 +1,20 @@
-from course_parser import CourseInfoParser
+from catalog_archive import ArchiveMiddleware, CatalogArchive
+from course_parser import CourseInfoParser, ParseResult
+import hashlib
+from instrumentation import instrument_parser
+import json
+from listing_extractor import Listing, extract_listings
 from metrics import ScrapingMetrics
+import os
+from parse_cache import ParseCache, parser_version
+from parsing_pool import ParsingPool
 from pipeline import PerDepartmentExportPipeline
+from response_cache import ConditionalRequestMiddleware, ResponseCache
 import scrapy
+from scrapy.utils.defer import maybe_deferred_to_future
+from typing import Final, Iterable
+
+FINGERPRINTS_FILE: Final[str] = 'intermediate/fingerprints.json'
 
 
 class CatalogSpider(scrapy.Spider):
@@ -15,17 +28,63 @@ class CatalogSpider(scrapy.Spider):
     custom_settings = {
         'ITEM_PIPELINES': {
             PerDepartmentExportPipeline: 1
+        },
+        'DOWNLOADER_MIDDLEWARES': {
+            ArchiveMiddleware: 450,
+            ConditionalRequestMiddleware: 500
         }
     }
 
-    def __init__(self, dry_run=None, metrics: ScrapingMetrics = None, *args, **kwargs):
+    def __init__(self, dry_run=None, metrics: ScrapingMetrics = None,
+                 response_cache: ResponseCache = None, incremental=None,
+                 archive: CatalogArchive = None,
+                 archive_recorder: CatalogArchive = None, workers=None,
+                 parse_cache_path: str = None, timings=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if metrics is None:
             self.metrics = ScrapingMetrics()
         else:
             self.metrics = metrics
-        self.parser = CourseInfoParser(self.logger, self.metrics)
+        # if set, requirements parsed in previous runs are reused from the
+        # cache at this path
+        self.parse_cache = None
+        if parse_cache_path is not None:
+            self.parse_cache = ParseCache(parse_cache_path)
+        self.parser = CourseInfoParser(
+            self.logger, self.metrics, self.parse_cache)
+        # if set, each stage of the requirements parser is timed and the
+        # results are added to the metrics
+        if timings:
+            self.metrics.enable_stage_timings()
+            instrument_parser(self.parser)
         self.dry_run = bool(dry_run)
+        # if set, course listings are parsed in this many worker processes
+        # instead of in the reactor thread
+        self.parsing_pool = None
+        if workers:
+            self.parsing_pool = ParsingPool(
+                int(workers), self.metrics, self.logger.name, parse_cache_path)
+        # if set, pages are revalidated against this cache instead of being
+        # downloaded in full every time (see `ConditionalRequestMiddleware`)
+        self.response_cache = response_cache
+        # if set, pages are read from this archive instead of the network, or
+        # saved to this recorder as they are downloaded (see
+        # `ArchiveMiddleware`)
+        self.archive = archive
+        self.archive_recorder = archive_recorder
+        # if set, departments whose listings are unchanged since the last run
+        # keep their existing intermediate files and are not parsed again
+        self.incremental = bool(incremental)
+        # hash of the parser's source, mixed into each fingerprint so that a
+        # parser change invalidates every department
+        self.parser_version = parser_version()
+        self.fingerprints: dict[str, str] = {}
+        self.previous_fingerprints: dict[str, str] = {}
+        # departments whose intermediate files have been cleared for parsing
+        # again in this crawl
+        self.reparsed: set[str] = set()
+        if self.incremental:
+            self.previous_fingerprints = self._load_fingerprints()
         if self.dry_run:
             self.logger.info('This is a dry run! No data will be written')
 
@@ -37,7 +96,7 @@ class CatalogSpider(scrapy.Spider):
         for link in selectors.getall():
             yield response.follow(link, callback=self.parse_courses)
 
-    def parse_courses(self, response):
+    async def parse_courses(self, response):
         dept = self._department_from_url(response.url)
         dept_name = response.xpath(
             '//h1').xpath('string()').re_first(r'^[^(]*')
@@ -46,10 +105,10 @@ class CatalogSpider(scrapy.Spider):
         else:
             dept_name = dept_name.strip()
 
-        title_line_selectors = response.css('p.course-name')
+        listings = list(extract_listings(response.selector))
         self.logger.info('Found %d courses in department %s',
-                         len(title_line_selectors), dept)
-        self.metrics.add_course_listings(len(title_line_selectors))
+                         len(listings), dept)
+        self.metrics.add_course_listings(len(listings))
 
         if not self.dry_run:
             yield {
@@ -58,14 +117,27 @@ class CatalogSpider(scrapy.Spider):
                 'name': dept_name,
                 'link': response.url
             }
-        for selector in title_line_selectors:
-            title_line = selector.xpath('string()').get()
-            course_info = self.parser.parse_course(title_line)
+
+        fingerprint = self._fingerprint(dept_name, listings)
+        if self.incremental and self._is_unchanged(dept, fingerprint):
+            # the intermediate file from the last run is still accurate, so
+            # leave it in place instead of parsing everything again
+            self.logger.info('Department %s is unchanged', dept)
+            self.metrics.inc_unchanged_departments()
+            self.fingerprints[dept] = fingerprint
+            return
+
+        if not self.dry_run:
+            self._clear_intermediate_file(dept)
+        codes: set[str] = set()
+        parsed = await self._parse_listings(listings)
+        for (anchor, _, description), (course_info, reqs) in zip(listings, parsed):
             if course_info is None:
                 continue
             subject, number, title, units = course_info
             self.logger.info('%s %s', subject, number)
 
+            codes.add(f'{subject} {number}')
             result = {
                 'file': dept,
                 'code': f'{subject} {number}',
@@ -74,16 +146,12 @@ class CatalogSpider(scrapy.Spider):
                 'dept': dept
             }
 
-            anchor_selector = selector.xpath('./preceding-sibling::*[1]')
-            anchor = anchor_selector.xpath('./@id|./a/@id').get()
             if anchor is None:
                 self.logger.warning('No anchor tag for %s %s', subject, number)
                 self.metrics.inc_missing_anchors()
             else:
                 result['anchor'] = anchor
 
-            description = selector.xpath(
-                './following-sibling::p[1]').xpath('string()').get()
             if description is None:
                 self.logger.error(
                     'Missing description for %s %s', subject, number)
@@ -91,8 +159,7 @@ class CatalogSpider(scrapy.Spider):
                 result['description'] = 'Missing description'
             else:
                 result['description'] = description
-                prereqs, coreqs = self.parser.parse_requirements(
-                    description)
+                prereqs, coreqs = reqs
                 if prereqs is not None:
                     result['prereqs'] = prereqs
                 if coreqs is not None:
@@ -101,6 +168,96 @@ class CatalogSpider(scrapy.Spider):
             if not self.dry_run:
                 yield result
 
+        quarantined = {entry['code'] for entry in self.metrics.get_quarantine()}
+        if codes.isdisjoint(quarantined):
+            self.fingerprints[dept] = fingerprint
+        else:
+            # not recorded, so that the department is parsed again next time
+            # rather than keeping the quarantined results
+            self.logger.info(
+                'Department %s had quarantined descriptions', dept)
+
+    def closed(self, reason):
+        if self.parsing_pool is not None:
+            self.parsing_pool.close()
+        if self.parse_cache is not None:
+            self.parse_cache.close()
+        if self.dry_run:
+            return
+        try:
+            with open(FINGERPRINTS_FILE, mode='w') as file:
+                json.dump(self.fingerprints, file, indent=2, sort_keys=True)
+        except OSError as error:
+            self.logger.error(
+                'Error while writing fingerprints:\n%s: %s', type(error), error)
+
+    async def _parse_listings(self, listings: list[Listing]) -> Iterable[ParseResult]:
+        """
+        Parses the title line and description of each listing, in the worker
+        pool if there is one. Returns the results in catalog order; without a
+        pool, they are generated lazily as the items are built.
+        """
+        texts = [(title_line, description)
+                 for _, title_line, description in listings]
+        if self.parsing_pool is None:
+            return self.parser.parse_many(texts)
+        return await maybe_deferred_to_future(self.parsing_pool.parse(texts))
+
+    def _fingerprint(self, dept_name: str | None, listings: list[Listing]) -> str:
+        """
+        Returns a hash of the course listing content of a department page and
+        of the parser's source, which determines what is made of it.
+        """
+        digest = hashlib.sha256()
+        digest.update(self.parser_version.encode('utf-8'))
+        digest.update(repr(dept_name).encode('utf-8'))
+        for listing in listings:
+            digest.update(repr(listing).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _clear_intermediate_file(self, dept: str) -> None:
+        """
+        Empties a department's intermediate file before it is parsed again,
+        so that courses from the last run don't survive when the department
+        yields no items. Files are only cleared once per crawl, before the
+        pipeline opens them.
+        """
+        if dept in self.reparsed:
+            return
+        self.reparsed.add(dept)
+        path = f'intermediate/{dept}.jsonl'
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, mode='wb'):
+                pass
+        except OSError as error:
+            self.logger.error(
+                'Error while clearing %s:\n%s: %s', path, type(error), error)
+
+    def _is_unchanged(self, dept: str, fingerprint: str) -> bool:
+        """
+        Returns whether the department's listings match the last run and its
+        intermediate file from that run is still present.
+        """
+        return (self.previous_fingerprints.get(dept) == fingerprint
+                and os.path.exists(f'intermediate/{dept}.jsonl'))
+
+    def _load_fingerprints(self) -> dict[str, str]:
+        """
+        Reads the department fingerprints written by the last run, or returns
+        an empty dictionary if there are none.
+        """
+        try:
+            with open(FINGERPRINTS_FILE, mode='r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as error:
+            self.logger.warning(
+                'Error while reading fingerprints:\n%s: %s', type(error), error)
+            return {}
+
     def _department_from_url(self, url):
         start, end = url.rfind('/') + 1, url.rfind('.')
         return url[start:end].upper()
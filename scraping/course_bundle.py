@@ -0,0 +1,196 @@
+from __future__ import annotations
+import json
+import mmap
+import os
+import struct
+from typing import Final, Iterator
+
+# identifies a bundle file, and the version of its format
+MAGIC: Final[bytes] = b'CGB2'
+# magic, number of records, offset of the index
+_HEADER: Final[struct.Struct] = struct.Struct('<4sIQ')
+# offset and length of a key, then offset and length of its record
+_ENTRY: Final[struct.Struct] = struct.Struct('<QHQI')
+# just the offset and length of a key, from the start of an index entry
+_KEY: Final[struct.Struct] = struct.Struct('<QH')
+
+
+class BundleWriter:
+    """
+    Writes a bundle: a single file holding one record (the bytes of a course
+    file) per course code, followed by an index of the records sorted by
+    course code, so that `CourseBundle` can look up any course without
+    reading the rest.
+
+    The file starts with a header of the magic bytes `CGB2`, the number of
+    records as a 32-bit integer, and the offset of the index as a 64-bit
+    integer, all little-endian. The records follow, back to back, then the
+    index, and finally the keys, the UTF-8 encoded course codes, back to
+    back. The index has a fixed-width entry per record: the offset and
+    length of its key, as 64-bit and 16-bit integers, and the offset and
+    length of the record, as 64-bit and 32-bit integers.
+
+    Records are streamed to `path` as they are added, so only the index is
+    held in memory. Call `close()` to write the index.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self.file = open(path, mode='wb')
+        self.file.write(bytes(_HEADER.size))
+        self.offset = _HEADER.size
+        # (key, record offset, record length) of each record
+        self.entries: list[tuple[bytes, int, int]] = []
+        # keys added so far, to reject duplicates
+        self.keys: set[bytes] = set()
+
+    def add(self, code: str, record: bytes) -> None:
+        """
+        Appends the record for a course. Each course code may only be added
+        once.
+        """
+        key = code.encode('utf-8')
+        if len(key) > 0xffff:
+            raise ValueError('Course code too long for bundle: %r' % code)
+        if key in self.keys:
+            raise ValueError('Duplicate course code in bundle: %s' % code)
+        self.keys.add(key)
+        self.file.write(record)
+        self.entries.append((key, self.offset, len(record)))
+        self.offset += len(record)
+
+    def close(self) -> None:
+        """
+        Writes the index and the header, and closes the file.
+        """
+        self.entries.sort()
+        index_offset = self.offset
+        key_offset = index_offset + _ENTRY.size * len(self.entries)
+        for key, record_offset, record_length in self.entries:
+            self.file.write(_ENTRY.pack(
+                key_offset, len(key), record_offset, record_length))
+            key_offset += len(key)
+        for key, _, _ in self.entries:
+            self.file.write(key)
+        self.file.seek(0)
+        self.file.write(_HEADER.pack(MAGIC, len(self.entries), index_offset))
+        self.file.close()
+
+
+class CourseBundle:
+    """
+    Reads a bundle written by `BundleWriter`. The file is memory-mapped, and
+    courses are found by binary search over the fixed-width index entries,
+    comparing the keys they point to in place, so opening a bundle and
+    looking up a course only touch the pages they need, and only the course
+    looked up is decoded. Keys compared during a search are remembered, as
+    every search starts by comparing the same few.
+
+    Usage:
+    ```
+    with CourseBundle('data/bundle/courses.bin') as bundle:
+        course = bundle.get('CSE 100')
+    ```
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        with open(path, mode='rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < _HEADER.size:
+            self.map.close()
+            raise ValueError('Not a course bundle: %s' % path)
+        magic, self.count, self.index_offset = _HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError('Not a course bundle: %s' % path)
+        # keys read by `_find()`, by position in the index
+        self.probed: dict[int, bytes] = {}
+
+    def __enter__(self) -> CourseBundle:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, code: str) -> bool:
+        return self._find(code) is not None
+
+    def codes(self) -> list[str]:
+        """
+        Returns the course codes in the bundle, in sorted order.
+        """
+        return [self._key(i).decode('utf-8') for i in range(self.count)]
+
+    def get_bytes(self, code: str) -> bytes | None:
+        """
+        Returns the record of a course without decoding it, or `None` if the
+        course isn't in the bundle.
+        """
+        i = self._find(code)
+        if i is None:
+            return None
+        _, _, offset, length = _ENTRY.unpack_from(
+            self.map, self.index_offset + _ENTRY.size * i)
+        return self.map[offset:offset + length]
+
+    def get(self, code: str) -> dict | None:
+        """
+        Returns the decoded course object for a course code, or `None` if the
+        course isn't in the bundle.
+        """
+        record = self.get_bytes(code)
+        if record is None:
+            return None
+        return json.loads(record)
+
+    def close(self) -> None:
+        self.map.close()
+
+    def _key(self, i: int) -> bytes:
+        """
+        Returns the encoded course code of the `i`th entry of the index.
+        """
+        offset, length = _KEY.unpack_from(
+            self.map, self.index_offset + _ENTRY.size * i)
+        return self.map[offset:offset + length]
+
+    def _find(self, code: str) -> int | None:
+        """
+        Returns the position of a course code in the index, by binary search.
+        Keys are sorted as UTF-8 bytes, which is the same as sorting them by
+        code point.
+        """
+        key = code.encode('utf-8')
+        probed = self.probed
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = probed.get(middle)
+            if middle_key is None:
+                middle_key = probed[middle] = self._key(middle)
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._key(low) == key:
+            return low
+        return None
+
+
+def write_bundle(path: str, records: Iterator[tuple[str, bytes]]) -> None:
+    """
+    Writes a bundle of the given (course code, record) pairs to `path`.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    writer = BundleWriter(path)
+    try:
+        for code, record in records:
+            writer.add(code, record)
+    finally:
+        writer.close()
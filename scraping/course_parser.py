@@ -1,9 +1,37 @@
 from logging import Logger
 from metrics import ScrapingMetrics
-from prerequisites_tree import PrerequisitesTreeGenerator, ReqsDict
+from parse_cache import ParseCache, ReqsPair
+from prerequisites_tree import PrerequisitesTreeGenerator, ReqsTree
 import re
-from utils import splice
+import time
+from tree_simplifier import equivalent, simplify
+from typing import Final, Iterable, Iterator
 
+# maximum length in characters of a pre/corequisites section (which never
+# extends past the end of its sentence); longer sections are quarantined
+# instead of parsed, which bounds the time the regular expressions below can
+# take on a malformed description
+MAX_SECTION_LENGTH: Final[int] = 2000
+# maximum number of pre/corequisites sections in a description; catalog
+# descriptions have at most a couple, and each is bounded by the limits here,
+# so this bounds the work done on a whole description
+MAX_SECTIONS: Final[int] = 8
+# maximum number of course codes in a normalized requirements section, which
+# bounds the size of its tree and so the work of simplifying it and checking
+# the simplification; sections with more are quarantined
+MAX_SECTION_COURSES: Final[int] = 512
+# maximum nesting depth of parentheses in a requirements section, before and
+# after normalizing it, which bounds the recursion of the normalizer and the
+# tree generator; deeper sections are quarantined
+MAX_NESTING_DEPTH: Final[int] = 16
+# descriptions whose requirements take longer than this many seconds to parse
+# are logged as slow; the time is only measured, and never decides the result
+SLOW_PARSE_SECONDS: Final[float] = 0.25
+
+# (title line, description) of a course listing
+ListingText = tuple[str, str | None]
+# (parsed title line, (prerequisites, corequisites)) of a course listing
+ParseResult = tuple[tuple[str, str, str, str] | None, ReqsPair]
 
 # matches a basic course code in a title line from the catalog
 _course_code_matcher = re.compile(
@@ -22,6 +50,9 @@ _units_matcher = re.compile(r'.*\((?P<units>.+?)\)')
 # matches plain numbers to check unit counts
 _digits_matcher = re.compile(r'^[0-9]+$')
 
+# text which every pre/corequisites section contains, for quickly skipping
+# descriptions without one
+_REQUISITE_MARKER = 'requisite'
 # matches the beginning of the pre/corequisites section of a course description
 _start_matcher = re.compile(
     r'(?<![Rr]ecommended )(?P<type>Pre|Co)requisites?:')
@@ -34,10 +65,12 @@ _corequisites_matcher = re.compile(
 # matches potential false positives for removal from the string
 _false_positive_matcher = re.compile(
     r'(?:[Gg]rade|[Ss]core) of .*? or (?:better|higher)|[A-D][-\u2013+]? or (?:better|higher)|,? or equivalent|GPA [0-9]|ACT|MBA|\(?(?:for|prior)[^,;]*\)?')
-# matches the last course code in the pre/corequisites section, accounting for
-# potential abbreviations/shorthand
+# matches the start of a course code, to find the last one in a section
+_course_start_matcher = re.compile(r'[A-Z]{2,}\s[0-9]+')
+# matches the last course code in the pre/corequisites section from its start,
+# accounting for potential abbreviations/shorthand
 _last_course_matcher = re.compile(
-    r'.*[A-Z]{2,}\s[0-9]+[A-Z]*(?:(?:[-\u2013/]|, (?:and |or )?| (?:and|or) )(?:[0-9]+[A-Z]*|[A-Z]{1,2}(?![0-9A-z])))*\)?')
+    r'[A-Z]{2,}\s[0-9]+[A-Z]*(?:(?:[-\u2013/]|, (?:and |or )?| (?:and|or) )(?:[0-9]+[A-Z]*|[A-Z]{1,2}(?![0-9A-z])))*\)?')
 # matches "standard form", consisting only of complete course codes separated
 # by "and" or "or" and potentially with parentheses, to check whether an early
 # stop is possible
@@ -62,17 +95,35 @@ _sequence_end_matcher = re.compile(
     r'-(?:(?:[A-Z]{3,}|SE)\s)?(?P<end_digits>[0-9]*)(?P<end_letters>[A-Z]*)')
 
 
+class _QuarantineError(Exception):
+    """
+    Raised when a description cannot be parsed within the parser's limits.
+    """
+
+
 class CourseInfoParser:
     """
     Parses course listings from the catalog into usable data formats. Use the
     `parse_course()` method for title lines and `parse_prerequisites()` for
-    prerequisite information in descriptions.
+    prerequisite information in descriptions, or `parse_many()` to parse whole
+    listings at once.
+
+    Descriptions with too many requirements sections (`MAX_SECTIONS`), or
+    whose sections are too long (`MAX_SECTION_LENGTH`), mention too many
+    courses (`MAX_SECTION_COURSES`), or are nested too deeply
+    (`MAX_NESTING_DEPTH`) are quarantined: they are
+    recorded in the metrics and treated as having no requirements, so that a
+    malformed description cannot stall the crawl. These limits only depend on
+    the text, so the same description is always parsed the same way.
     """
 
-    def __init__(self, logger: Logger, metrics: ScrapingMetrics) -> None:
+    def __init__(self, logger: Logger, metrics: ScrapingMetrics,
+                 parse_cache: ParseCache | None = None) -> None:
         super().__init__()
         self.logger = logger
         self.metrics = metrics
+        # if set, requirements are looked up here before being parsed
+        self.parse_cache = parse_cache
         self.tree_generator = PrerequisitesTreeGenerator(self.logger)
 
     def parse_course(self, title_line: str) -> tuple[str, str, str, str]:
@@ -122,29 +173,87 @@ class CourseInfoParser:
         title = title_line[title_start:title_end].strip()
         return (subject, number, title, units)
 
-    def parse_requirements(
-            self, description: str) -> tuple[ReqsDict | None, ReqsDict | None]:
+    def parse_many(self, listings: Iterable[ListingText]) -> Iterator[ParseResult]:
+        """
+        Parses the title line and description of each listing in `listings`,
+        generating the results lazily in the same order. The requirements are
+        `(None, None)` if the title line could not be parsed or the description
+        is missing.
+
+        Most descriptions have no pre/corequisites section at all; these are
+        recognized with a single substring search and skip the requirements
+        parser (and the parse cache) entirely.
+        """
+        for title_line, description in listings:
+            course_info = self.parse_course(title_line)
+            if (course_info is None or description is None
+                    or _REQUISITE_MARKER not in description):
+                yield (course_info, (None, None))
+                continue
+            code = f'{course_info[0]} {course_info[1]}'
+            yield (course_info, self.parse_requirements(description, code))
+
+    def parse_requirements(self, description: str,
+                           code: str | None = None) -> ReqsPair:
         """
         Extracts prerequisite and corequisite information from a course's
-        description in the catalog. Returns a tuple whose first element is a
-        dictionary representation of the prerequisite tree graph, or `None` if
-        there are no prerequisites, and whose second element is the same for
-        corequisites.
+        description in the catalog. Returns a tuple whose first element is the
+        prerequisite tree graph, or `None` if there are no prerequisites, and
+        whose second element is the same for corequisites. Each tree is a
+        `PrerequisitesNode`, or a course code string if there is only one
+        course, whether it was parsed or came from the parse cache; use
+        `reqs_to_json()` to serialize it.
 
         These two steps are done together to reduce parsing complexity and
-        optimize performance.
+        optimize performance. If the parser has a `parse_cache`, previously
+        parsed descriptions are returned from it instead. `code` is the
+        course's code, which identifies the description if it is quarantined.
         """
+        if self.parse_cache is not None:
+            result = self.parse_cache.get(description)
+            if result is not None:
+                self.metrics.inc_parse_cache_hits()
+                return result
+        start_time = time.perf_counter()
+        try:
+            result = self._parse_requirements(description)
+        except _QuarantineError as error:
+            self.logger.error('Quarantined requirements of %s: %s',
+                              code or 'unknown course', error)
+            self.metrics.add_quarantined(code, str(error), description)
+            return (None, None)
+        elapsed = time.perf_counter() - start_time
+        if elapsed > SLOW_PARSE_SECONDS:
+            self.logger.warning('Parsing requirements of %s took %.3f seconds',
+                                code or 'unknown course', elapsed)
+        if self.parse_cache is not None:
+            self.parse_cache.put(description, result)
+        return result
+
+    def _parse_requirements(self, description: str) -> ReqsPair:
         prereqs = coreqs = None
         start = 0
+        sections = 0
         while True:
             start_match = _start_matcher.search(description, start)
             if start_match is None:
                 break
+            sections += 1
+            if sections > MAX_SECTIONS:
+                raise _QuarantineError(
+                    f'description has more than {MAX_SECTIONS} sections')
             start = start_match.end()
+            # a section never extends past the end of its sentence, so there
+            # is no need for the regular expressions to look any further
+            end = description.find('.', start)
+            end = len(description) if end == -1 else end + 1
+            if end - start > MAX_SECTION_LENGTH:
+                raise _QuarantineError(
+                    f'section is longer than {MAX_SECTION_LENGTH} characters')
             coreqs_in_prereqs = False
             if start_match.group('type') == 'Pre':
                 prereqs_match = _prerequisites_matcher.match(
-                    description, start)
+                    description, start, end)
                 if prereqs_match is None:
                     continue
                 if prereqs_match.group('coreqs_start_1'):
@@ -160,7 +269,8 @@ class CourseInfoParser:
                     else:
                         start = prereqs_match.end()
             if start_match.group('type') == 'Co' or coreqs_in_prereqs:
-                coreqs_match = _corequisites_matcher.match(description, start)
+                coreqs_match = _corequisites_matcher.match(
+                    description, start, end)
                 if coreqs_match is None:
                     continue
                 coreqs_str = coreqs_match.group('coreqs')
@@ -169,19 +279,74 @@ class CourseInfoParser:
                 start = coreqs_match.end()
         return (prereqs, coreqs)
 
-    def _generate_tree(self, reqs_str: str) -> ReqsDict | None:
+    def _generate_tree(self, reqs_str: str) -> ReqsTree | None:
         """
-        Normalizes `reqs_str` and generates a course requirements tree graph
-        from it. Returns a dictionary representation of the tree, or `None` if
-        there are no courses present.
+        Normalizes `reqs_str` and generates a simplified course requirements
+        tree graph from it. Returns the tree, or `None` if there are no courses
+        present. Raises `_QuarantineError` if the string is nested too deeply,
+        either before or after normalizing it, or if the normalized string has
+        too many courses.
         """
+        self._check_nesting(reqs_str)
         reqs_str = self._isolate_courses(reqs_str)
         if reqs_str is None:
             return None
         self.logger.info('ISOLATED  : %s', reqs_str)
         reqs_str = self._normalize_string(reqs_str)
         self.logger.info('NORMALIZED: %s', reqs_str)
-        return self.tree_generator.from_string(reqs_str)
+        self._check_limits(reqs_str)
+        tree = self.tree_generator.parse_tree(reqs_str)
+        if tree is not None:
+            tree = self._simplify_tree(tree)
+        return tree
+
+    def _simplify_tree(self, tree: ReqsTree) -> ReqsTree:
+        """
+        Removes redundant requirements from `tree` with `simplify()`, and
+        checks that the simplified tree is equivalent to the original. Returns
+        the original tree if it can't be simplified, or if the check fails.
+        """
+        simplified = simplify(tree)
+        if simplified is tree:
+            return tree
+        if not equivalent(tree, simplified):
+            self.logger.error(
+                'Simplified tree is not equivalent to the original: %s -> %s',
+                tree,
+                simplified
+            )
+            self.metrics.inc_simplification_failures()
+            return tree
+        self.logger.info('SIMPLIFIED: %s', simplified)
+        self.metrics.inc_simplified_trees()
+        return simplified
+
+    def _check_limits(self, reqs_str: str) -> None:
+        """
+        Raises `_QuarantineError` if a normalized requirements string has more
+        than `MAX_SECTION_COURSES` course codes, or parentheses nested more
+        than `MAX_NESTING_DEPTH` deep.
+        """
+        courses = sum(1 for _ in _course_start_matcher.finditer(reqs_str))
+        if courses > MAX_SECTION_COURSES:
+            raise _QuarantineError(
+                f'section has more than {MAX_SECTION_COURSES} courses')
+        self._check_nesting(reqs_str)
+
+    def _check_nesting(self, reqs_str: str) -> None:
+        """
+        Raises `_QuarantineError` if `reqs_str` has parentheses nested more
+        than `MAX_NESTING_DEPTH` deep.
+        """
+        depth = 0
+        for char in reqs_str:
+            if char == '(':
+                depth += 1
+                if depth > MAX_NESTING_DEPTH:
+                    raise _QuarantineError(
+                        f'parentheses are nested more than {MAX_NESTING_DEPTH} deep')
+            elif char == ')':
+                depth -= 1
 
     def _isolate_courses(self, reqs_str: str) -> str | None:
         """
@@ -189,10 +354,36 @@ class CourseInfoParser:
         extraneous information removed, or `None` if no codes are found.
         """
         reqs_str = _false_positive_matcher.sub('', reqs_str)
-        end_match = _last_course_matcher.search(reqs_str)
-        if end_match is None:
+        end = self._last_course_end(reqs_str)
+        if end is None:
             return None
-        return reqs_str[:end_match.end()]
+        return reqs_str[:end]
+
+    def _last_course_end(self, reqs_str: str) -> int | None:
+        """
+        Returns the index just past the last course code (and any shorthand
+        codes following it) on the first line of `reqs_str` which has a course
+        code, or `None` if there are no codes.
+
+        This is the end of the first match of `.*` followed by
+        `_last_course_matcher`, but the codes are found with a single forward
+        scan instead of by backtracking from the end of the line at every
+        starting position, which takes quadratic time when there is no code.
+        """
+        last_start = None
+        line_end = len(reqs_str)
+        for match in _course_start_matcher.finditer(reqs_str):
+            if last_start is None:
+                # `.*` cannot match a line break
+                newline = reqs_str.find('\n', match.start())
+                if newline != -1:
+                    line_end = newline
+            elif match.start() >= line_end:
+                break
+            last_start = match.start()
+        if last_start is None:
+            return None
+        return _last_course_matcher.match(reqs_str, last_start).end()
 
     def _normalize_string(self, reqs_str: str) -> str:
         """
@@ -218,14 +409,19 @@ class CourseInfoParser:
         special characters with their ASCII counterparts to simplify later
         steps.
         """
-        substitutions = [None] * len(reqs_str)
+        substitutions: dict[int, str] = {}
         i = 0
         while i < len(reqs_str):
             i = self._conjunctions_helper(reqs_str, i, substitutions)
-        for i in reversed(range(len(substitutions))):
-            if substitutions[i] is not None:
-                reqs_str = splice(reqs_str, substitutions[i], i, i + 1)
-        return reqs_str
+        # apply all substitutions in a single pass over the string
+        pieces = []
+        copied = 0
+        for i in sorted(substitutions):
+            pieces.append(reqs_str[copied:i])
+            pieces.append(substitutions[i])
+            copied = i + 1
+        pieces.append(reqs_str[copied:])
+        return ''.join(pieces)
 
     def _normalize_course_codes(self, reqs_str: str) -> str:
         """
@@ -240,11 +436,12 @@ class CourseInfoParser:
         # self.logger.info('SEQUENC> %s', reqs_str)
         return reqs_str
 
-    def _conjunctions_helper(self, s: str, i: int, subs: list[str | None]) -> int:
+    def _conjunctions_helper(self, s: str, i: int, subs: dict[int, str]) -> int:
         """
         Walks through `s` starting from index `i` and adds any newly found
-        substitutions to `subs`. Works recursively within parentheses. Returns
-        the next index after where the algorithm stops.
+        substitutions to `subs`, which maps indices in `s` to the text that
+        replaces the character there. Works recursively within parentheses.
+        Returns the next index after where the algorithm stops.
 
         To simplify later steps, also adds substitutions for en dashes and
         non-breaking spaces, replacing them with hyphens and regular spaces
@@ -269,7 +466,7 @@ class CourseInfoParser:
             elif s[i] == '/':
                 subs[i] = ' or '
             elif s[i] == '(':
-                if s[i + 1:].startswith('or'):
+                if s.startswith('or', i + 1):
                     subs[i] = ''
                     should_remove_parenthesis = True
                 else:
@@ -326,17 +523,23 @@ class CourseInfoParser:
         subject is present but not the number. Also encloses each group of
         updated course codes, including the one with the original subject, in
         parentheses.
+
+        The result is built as a list of pieces of `reqs_str` and inserted
+        text, which is joined once at the end.
         """
-        def insert_parentheses(left_pos: int, right_pos: int) -> str:
-            return splice(
-                reqs_str,
-                f'({reqs_str[left_pos:right_pos]})',
-                left_pos,
-                right_pos
-            )
+        pieces: list[str] = []
+        # index in `reqs_str` up to which it has been copied to `pieces`
+        copied = 0
+
+        def copy_until(position: int) -> None:
+            nonlocal copied
+            pieces.append(reqs_str[copied:position])
+            copied = position
         last_subject = ''
         last_digits = ''
-        left_paren_position = right_paren_position = -1
+        # index in `pieces` of the placeholder for the current group's left
+        # parenthesis, and the index in `reqs_str` of its right parenthesis
+        left_paren_piece = right_paren_position = -1
         inserted_subjects_count = 0
         i = 0
         while i < len(reqs_str):
@@ -348,41 +551,49 @@ class CourseInfoParser:
             if subject:
                 last_subject = subject
                 last_digits = match.group('digits_1')
-                if inserted_subjects_count > 0:
-                    reqs_str = insert_parentheses(
-                        left_paren_position, right_paren_position)
-                    i += 2
+                if inserted_subjects_count > 0 and left_paren_piece != -1:
+                    pieces[left_paren_piece] = '('
+                    copy_until(right_paren_position)
+                    pieces.append(')')
                 inserted_subjects_count = 0
-                left_paren_position = i
+                copy_until(i)
+                left_paren_piece = len(pieces)
+                pieces.append('')
             elif number:
                 digits = match.group('digits_2')
                 if digits:
                     last_digits = digits
-                    reqs_str = splice(reqs_str, f' {last_subject}', i)
-                    i += len(last_subject) + 1
+                    copy_until(i)
+                    pieces.append(f' {last_subject}')
                 else:
-                    reqs_str = splice(
-                        reqs_str, f'{last_subject} {last_digits}', i + 1)
-                    i += len(last_subject) + len(last_digits) + 1
+                    copy_until(i + 1)
+                    pieces.append(f'{last_subject} {last_digits}')
                 inserted_subjects_count += 1
-            i += len(match.group())
+            i = match.end()
             right_paren_position = i
-        if inserted_subjects_count > 0:
-            reqs_str = insert_parentheses(
-                left_paren_position, right_paren_position)
-        return reqs_str
+        if inserted_subjects_count > 0 and left_paren_piece != -1:
+            pieces[left_paren_piece] = '('
+            copy_until(right_paren_position)
+            pieces.append(')')
+        copy_until(len(reqs_str))
+        return ''.join(pieces)
 
     def _expand_code_sequences(self, reqs_str: str) -> str:
         """
         Replaces each course code sequence in `reqs_str` with a list of courses
         in the sequence, enclosed in parentheses, and returns the result.
+        Raises `_QuarantineError` before expanding a numeric range which would
+        take the courses in the sequences past `MAX_SECTION_COURSES`.
         """
-        i = 0
+        pieces: list[str] = []
+        # number of courses in the sequences expanded so far
+        courses = 0
+        copied = i = 0
         while i < len(reqs_str):
             start_match = _sequence_start_matcher.search(reqs_str, i)
             if start_match is None:
                 break
-            expanded = start_match.group()
+            expanded = [start_match.group()]
             subject, digits, letters = start_match.group(
                 'subject', 'digits', 'letters')
             i, j = start_match.span()
@@ -394,24 +605,35 @@ class CourseInfoParser:
                     'end_digits', 'end_letters')
                 if end_digits and end_digits != digits:
                     if letters or end_letters:
-                        expanded += f' and {subject} {end_digits}{end_letters}'
+                        expanded.append(
+                            f' and {subject} {end_digits}{end_letters}')
                     else:
                         start_number, end_number = int(digits), int(end_digits)
+                        if courses + len(expanded) + end_number - start_number \
+                                > MAX_SECTION_COURSES:
+                            raise _QuarantineError(
+                                f'section has more than {MAX_SECTION_COURSES} courses')
                         for num in range(start_number + 1, end_number + 1):
-                            expanded += f' and {subject} {num}'
+                            expanded.append(f' and {subject} {num}')
                     digits = end_digits
                     letters = end_letters
                 elif end_letters:
                     if not letters or len(end_letters) != len(letters):
-                        expanded += f' and {subject} {digits}{end_letters}'
+                        expanded.append(
+                            f' and {subject} {digits}{end_letters}')
                     else:
                         start_letter, end_letter = letters[0], end_letters[0]
                         for x in range(ord(start_letter) + 1, ord(end_letter)):
                             next_letters = f'{chr(x)}{letters[1:]}'
-                            expanded += f' and {subject} {digits}{next_letters}'
-                        expanded += f' and {subject} {digits}{end_letters}'
+                            expanded.append(
+                                f' and {subject} {digits}{next_letters}')
+                        expanded.append(
+                            f' and {subject} {digits}{end_letters}')
                     letters = end_letters
                 j = end_match.end()
-            reqs_str = splice(reqs_str, f'({expanded})', i, j)
-            i += len(expanded) + 2
-        return reqs_str
+            courses += len(expanded)
+            pieces.append(reqs_str[copied:i])
+            pieces.append(f'({"".join(expanded)})')
+            copied = i = j
+        pieces.append(reqs_str[copied:])
+        return ''.join(pieces)
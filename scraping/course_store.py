@@ -0,0 +1,69 @@
+import tempfile
+from typing import Final, IO
+
+# default number of bytes of course files to hold in memory before spilling
+# the rest to a temporary file
+DEFAULT_MEMORY_BUDGET: Final[int] = 64 * 1024 * 1024
+
+
+class CourseStore:
+    """
+    Holds the rendered output files of courses between reading and writing
+    them, so that the postprocessor only has to decode each intermediate file
+    once. Files are kept in memory until they take up `memory_budget` bytes,
+    after which further files are appended to an anonymous temporary file and
+    read back from it when needed. Call `close()` to remove the temporary
+    file.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET) -> None:
+        super().__init__()
+        self.memory_budget = memory_budget
+        # number of bytes of files held in memory
+        self.memory_used = 0
+        # each file added, either held in memory or as the (offset, length)
+        # of its encoded contents in the spill file
+        self.files: list[str | tuple[int, int]] = []
+        # temporary file holding the files over budget, created on demand
+        self.spill_file: IO[bytes] | None = None
+        # number of files in the spill file, and its size in bytes
+        self.spilled = 0
+        self.spill_size = 0
+
+    def add(self, contents: str) -> int:
+        """
+        Stores the contents of a file, and returns the index to retrieve them
+        with.
+        """
+        # the budget is in bytes, and a character may take up several
+        encoded = contents.encode('utf-8')
+        if self.memory_used + len(encoded) <= self.memory_budget:
+            self.memory_used += len(encoded)
+            self.files.append(contents)
+            return len(self.files) - 1
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(mode='w+b')
+        self.spill_file.seek(self.spill_size)
+        self.spill_file.write(encoded)
+        self.files.append((self.spill_size, len(encoded)))
+        self.spill_size += len(encoded)
+        self.spilled += 1
+        return len(self.files) - 1
+
+    def get(self, index: int) -> str:
+        """
+        Returns the contents of a stored file.
+        """
+        stored = self.files[index]
+        if isinstance(stored, str):
+            return stored
+        offset, length = stored
+        self.spill_file.seek(offset)
+        return self.spill_file.read(length).decode('utf-8')
+
+    def close(self) -> None:
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        self.files = []
+        self.memory_used = 0
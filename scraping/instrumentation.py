@@ -0,0 +1,182 @@
+from __future__ import annotations
+import functools
+import heapq
+import math
+import time
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    from course_parser import CourseInfoParser
+
+# parser methods which are timed as stages, in the order they run
+STAGES: Final[tuple[str, ...]] = (
+    'parse_requirements',
+    '_isolate_courses',
+    '_normalize_conjunctions',
+    '_fill_incomplete_codes',
+    '_expand_code_sequences',
+    'parse_tree',
+    '_simplify_tree'
+)
+# number of histogram buckets per power of two, which bounds the relative
+# error of reported percentiles to about 19%
+BUCKETS_PER_OCTAVE: Final[int] = 4
+# number of slowest descriptions to keep
+SLOWEST_COUNT: Final[int] = 10
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with logarithmically sized buckets, so that it
+    stays small no matter how many values are recorded. Histograms from
+    different processes can be combined with `merge()`. The count, total, and
+    maximum are exact; percentiles are accurate to within one bucket.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int) -> None:
+        bucket = _bucket(ns)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def merge(self, other: LatencyHistogram) -> None:
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def percentile(self, q: float) -> int:
+        """
+        Returns an upper bound on the `q`th percentile (0 to 100) of the
+        recorded latencies in nanoseconds, or 0 if nothing was recorded.
+        """
+        if self.count == 0:
+            return 0
+        rank = math.ceil(self.count * q / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(_bucket_limit(bucket), self.max_ns)
+        return self.max_ns
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'totalMs': self.total_ns / 1e6,
+            'p50Ms': self.percentile(50) / 1e6,
+            'p99Ms': self.percentile(99) / 1e6,
+            'maxMs': self.max_ns / 1e6
+        }
+
+
+class StageTimings:
+    """
+    Latency histograms for each stage of the requirements parser, plus the
+    slowest descriptions seen, identified by course code. Filled in by a
+    parser set up with `instrument_parser()`, and stored in
+    `ScrapingMetrics` when timings are enabled.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.stages: dict[str, LatencyHistogram] = {
+            stage: LatencyHistogram() for stage in STAGES}
+        # min-heap of (ns, course code, description)
+        self.slowest: list[tuple[int, str, str]] = []
+
+    def record(self, stage: str, ns: int) -> None:
+        self.stages[stage].record(ns)
+
+    def record_description(self, ns: int, code: str, description: str) -> None:
+        entry = (ns, code, description)
+        if len(self.slowest) < SLOWEST_COUNT:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def merge(self, other: StageTimings) -> None:
+        for stage, histogram in other.stages.items():
+            self.stages[stage].merge(histogram)
+        for entry in other.slowest:
+            self.record_description(*entry)
+
+    def summary(self) -> dict:
+        """
+        Returns the timings in a form which can be written to output as JSON.
+        """
+        return {
+            'stages': {
+                stage: histogram.summary()
+                for stage, histogram in self.stages.items()
+            },
+            'slowest': [
+                {'code': code, 'ms': ns / 1e6, 'description': description}
+                for ns, code, description in sorted(self.slowest, reverse=True)
+            ]
+        }
+
+
+def instrument_parser(parser: CourseInfoParser) -> None:
+    """
+    Wraps the stage methods of `parser` (and its tree generator) so that each
+    call is timed and recorded in `parser.metrics.stage_timings`, which must
+    be enabled. Only this instance is affected; uninstrumented parsers run the
+    original methods with no overhead.
+    """
+    def timed(owner: object, stage: str) -> None:
+        method = getattr(owner, stage)
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                parser.metrics.stage_timings.record(
+                    stage, time.perf_counter_ns() - start)
+        setattr(owner, stage, wrapper)
+
+    for stage in STAGES:
+        if stage == 'parse_tree':
+            timed(parser.tree_generator, stage)
+        elif stage != 'parse_requirements':
+            timed(parser, stage)
+
+    parse_requirements = parser.parse_requirements
+
+    @functools.wraps(parse_requirements)
+    def parse_requirements_wrapper(description: str, code: str | None = None):
+        start = time.perf_counter_ns()
+        try:
+            return parse_requirements(description, code)
+        finally:
+            ns = time.perf_counter_ns() - start
+            timings = parser.metrics.stage_timings
+            timings.record('parse_requirements', ns)
+            timings.record_description(ns, code or '?', description)
+
+    parser.parse_requirements = parse_requirements_wrapper
+
+
+def _bucket(ns: int) -> int:
+    if ns <= 1:
+        return 0
+    return int(math.log2(ns) * BUCKETS_PER_OCTAVE)
+
+
+def _bucket_limit(bucket: int) -> int:
+    """
+    Returns the largest latency in nanoseconds which falls in `bucket`.
+    """
+    return math.ceil(2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE))
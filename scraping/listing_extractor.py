@@ -0,0 +1,76 @@
+from lxml.etree import _Element
+from parsel import Selector
+from typing import Iterator
+
+# (anchor, title line, description) of a course listing on a department page
+Listing = tuple[str | None, str, str | None]
+
+
+def extract_listings(selector: Selector) -> Iterator[Listing]:
+    """
+    Generates the anchor, title line, and description of each course listing
+    on a department page, in catalog order. The anchor and description are
+    `None` if they are missing.
+
+    This walks the page's `<p>` elements once, working directly on the
+    underlying lxml tree. For each title line, the anchor is taken from the
+    element just before it and the description from the next `<p>` after it,
+    the same as `extract_listings_with_selectors()` but without evaluating any
+    further XPath expressions or allocating a selector per element.
+    """
+    for element in selector.root.iter('p'):
+        if 'course-name' not in (element.get('class') or '').split():
+            continue
+        title_line = _string_value(element)
+        anchor = _anchor(element)
+        description = None
+        sibling = element.getnext()
+        while sibling is not None:
+            if sibling.tag == 'p':
+                description = _string_value(sibling)
+                break
+            sibling = sibling.getnext()
+        yield (anchor, title_line, description)
+
+
+def extract_listings_with_selectors(selector: Selector) -> Iterator[Listing]:
+    """
+    Generates the same listings as `extract_listings()` by evaluating XPath
+    expressions relative to each title line. This is the original, slower
+    implementation, which is kept as a reference for benchmarking.
+    """
+    for title_selector in selector.css('p.course-name'):
+        title_line = title_selector.xpath('string()').get()
+        anchor_selector = title_selector.xpath('./preceding-sibling::*[1]')
+        anchor = anchor_selector.xpath('./@id|./a/@id').get()
+        description = title_selector.xpath(
+            './following-sibling::p[1]').xpath('string()').get()
+        yield (anchor, title_line, description)
+
+
+def _anchor(element: _Element) -> str | None:
+    """
+    Returns the anchor ID on the element preceding `element` (or on a link
+    inside it), or `None` if there is none.
+    """
+    previous = element.getprevious()
+    # skip comments and processing instructions, which are not elements
+    while previous is not None and not isinstance(previous.tag, str):
+        previous = previous.getprevious()
+    if previous is None:
+        return None
+    anchor = previous.get('id')
+    if anchor is not None:
+        return anchor
+    for child in previous.iterchildren('a'):
+        anchor = child.get('id')
+        if anchor is not None:
+            return anchor
+    return None
+
+
+def _string_value(element: _Element) -> str:
+    """
+    Returns the text content of `element`, like the XPath `string()` function.
+    """
+    return ''.join(element.itertext())
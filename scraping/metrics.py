@@ -1,8 +1,17 @@
+from instrumentation import StageTimings
+from typing import Final
+
+# number of characters of each quarantined description to keep
+QUARANTINE_EXCERPT_LENGTH: Final[int] = 200
+
+
 class ScrapingMetrics:
     def __init__(self):
         super().__init__()
         self.metrics = {
             'departments': 0,
+            'not_modified_pages': 0,
+            'unchanged_departments': 0,
             'courses': 0,
             'course_listings': 0,
             'sequence_listings': 0,
@@ -12,14 +21,73 @@ class ScrapingMetrics:
             'nonstandard_units': 0,
             'missing_anchors': 0,
             'missing_descriptions': 0,
+            'parse_cache_hits': 0,
+            'quarantined_descriptions': 0,
+            'simplified_trees': 0,
+            'simplification_failures': 0,
             'with_prerequisites': 0,
             'with_corequisites': 0,
-            'with_successors': 0
+            'with_successors': 0,
+            'requirement_nodes': 0,
+            'unique_requirement_nodes': 0,
+            'written_files': 0,
+            'skipped_files': 0,
+            'deleted_files': 0,
+            'output_bytes': 0,
+            'compressed_bytes': 0
         }
+        # per-stage parser timings, only collected if enabled
+        self.stage_timings: StageTimings | None = None
+        # descriptions which the parser gave up on
+        self.quarantine: list[dict] = []
+
+    def enable_stage_timings(self):
+        self.stage_timings = StageTimings()
+
+    def add_stage_timings(self, timings: StageTimings):
+        """
+        Merges parser timings collected by another instance into this one's,
+        if timings are enabled.
+        """
+        if self.stage_timings is not None and timings is not None:
+            self.stage_timings.merge(timings)
 
     def set_departments(self, n):
         self.metrics['departments'] = n
 
+    def set_requirement_nodes(self, n):
+        self.metrics['requirement_nodes'] = n
+
+    def set_unique_requirement_nodes(self, n):
+        self.metrics['unique_requirement_nodes'] = n
+
+    def set_written_files(self, n):
+        self.metrics['written_files'] = n
+
+    def set_skipped_files(self, n):
+        self.metrics['skipped_files'] = n
+
+    def set_deleted_files(self, n):
+        self.metrics['deleted_files'] = n
+
+    def add_output_bytes(self, n):
+        self.metrics['output_bytes'] += n
+
+    def add_compressed_bytes(self, n):
+        self.metrics['compressed_bytes'] += n
+
+    def inc_simplified_trees(self):
+        self.metrics['simplified_trees'] += 1
+
+    def inc_simplification_failures(self):
+        self.metrics['simplification_failures'] += 1
+
+    def inc_not_modified_pages(self):
+        self.metrics['not_modified_pages'] += 1
+
+    def inc_unchanged_departments(self):
+        self.metrics['unchanged_departments'] += 1
+
     def inc_courses(self):
         self.metrics['courses'] += 1
 
@@ -47,6 +115,17 @@ class ScrapingMetrics:
     def inc_missing_descriptions(self):
         self.metrics['missing_descriptions'] += 1
 
+    def inc_parse_cache_hits(self):
+        self.metrics['parse_cache_hits'] += 1
+
+    def add_quarantined(self, code, reason, description):
+        self.metrics['quarantined_descriptions'] += 1
+        self.quarantine.append({
+            'code': code,
+            'reason': reason,
+            'description': description[:QUARANTINE_EXCERPT_LENGTH]
+        })
+
     def inc_with_prerequisites(self):
         self.metrics['with_prerequisites'] += 1
 
@@ -59,6 +138,12 @@ class ScrapingMetrics:
     def get_departments(self):
         return self.metrics['departments']
 
+    def get_not_modified_pages(self):
+        return self.metrics['not_modified_pages']
+
+    def get_unchanged_departments(self):
+        return self.metrics['unchanged_departments']
+
     def get_courses(self):
         return self.metrics['courses']
 
@@ -86,22 +171,84 @@ class ScrapingMetrics:
     def get_missing_descriptions(self):
         return self.metrics['missing_descriptions']
 
+    def get_parse_cache_hits(self):
+        return self.metrics['parse_cache_hits']
+
+    def get_quarantined_descriptions(self):
+        return self.metrics['quarantined_descriptions']
+
+    def get_quarantine(self):
+        return list(self.quarantine)
+
     def get_with_prerequisites(self):
         return self.metrics['with_prerequisites']
 
     def get_with_corequisites(self):
         return self.metrics['with_corequisites']
 
+    def get_simplified_trees(self):
+        return self.metrics['simplified_trees']
+
+    def get_simplification_failures(self):
+        return self.metrics['simplification_failures']
+
     def get_with_successors(self):
         return self.metrics['with_successors']
 
+    def get_requirement_nodes(self):
+        return self.metrics['requirement_nodes']
+
+    def get_unique_requirement_nodes(self):
+        return self.metrics['unique_requirement_nodes']
+
+    def get_written_files(self):
+        return self.metrics['written_files']
+
+    def get_skipped_files(self):
+        return self.metrics['skipped_files']
+
+    def get_deleted_files(self):
+        return self.metrics['deleted_files']
+
+    def get_output_bytes(self):
+        return self.metrics['output_bytes']
+
+    def get_compressed_bytes(self):
+        return self.metrics['compressed_bytes']
+
+    def add_all(self, counts: dict):
+        """
+        Adds each count in `counts` (as returned by another instance's
+        `get_all()`) to the corresponding metric.
+        """
+        for key, value in counts.items():
+            self.metrics[key] += value
+
+    def merge(self, other: 'ScrapingMetrics'):
+        """
+        Adds everything recorded by `other` (for example, in a worker process)
+        to this instance.
+        """
+        self.add_all(other.get_all())
+        self.add_stage_timings(other.stage_timings)
+        self.quarantine.extend(other.quarantine)
+
     def get_all(self):
         return dict(self.metrics)
 
+    def get_stage_timings(self):
+        if self.stage_timings is None:
+            return None
+        return self.stage_timings.summary()
+
     def pretty_print(self):
         print('Scraping statistics:')
         print('Found %d departments, %d course listings.' %
               (self.get_departments(), self.get_course_listings()))
+        print('%d pages were unchanged since the last crawl.' %
+              self.get_not_modified_pages())
+        print('%d departments were unchanged since the last run.' %
+              self.get_unchanged_departments())
         print('%d courses were crosslisted (instances besides the first were skipped).' %
               self.get_ignored_crosslistings())
         print('%d courses were sequence listings.' %
@@ -114,7 +261,37 @@ class ScrapingMetrics:
         print('Anchor tag was missing %d times' % self.get_missing_anchors())
         print('Failed to find a description for %d courses' %
               self.get_missing_descriptions())
+        print('Reused %d cached requirements parses' %
+              self.get_parse_cache_hits())
+        print('Quarantined %d descriptions' %
+              self.get_quarantined_descriptions())
+        for entry in self.quarantine:
+            print('  %s: %s' % (entry['code'], entry['reason']))
+        print('Simplified %d requirement trees (%d failed the equivalence check)' %
+              (self.get_simplified_trees(), self.get_simplification_failures()))
         print('Wrote %d courses' % self.get_courses())
         print('%d courses had prerequisites' % self.get_with_prerequisites())
         print('%d courses had corequisites' % self.get_with_corequisites())
         print('%d courses had successors' % self.get_with_successors())
+        print('Requirement trees had %d nodes, %d of them distinct' %
+              (self.get_requirement_nodes(), self.get_unique_requirement_nodes()))
+        print('Wrote %d output files, skipped %d unchanged, deleted %d stale' %
+              (self.get_written_files(), self.get_skipped_files(),
+               self.get_deleted_files()))
+        print('Output files took %d bytes (%d bytes precompressed)' %
+              (self.get_output_bytes(), self.get_compressed_bytes()))
+        timings = self.get_stage_timings()
+        if timings is not None:
+            print('Parser stage timings (calls, total, p50, p99, max):')
+            for stage, stats in timings['stages'].items():
+                print('  %-24s %7d %9.1fms %7.3fms %7.3fms %7.3fms' % (
+                    stage,
+                    stats['count'],
+                    stats['totalMs'],
+                    stats['p50Ms'],
+                    stats['p99Ms'],
+                    stats['maxMs']
+                ))
+            print('Slowest requirements parses:')
+            for entry in timings['slowest']:
+                print('  %-12s %7.3fms' % (entry['code'], entry['ms']))
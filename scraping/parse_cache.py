@@ -0,0 +1,131 @@
+from __future__ import annotations
+from collections import OrderedDict
+import hashlib
+import importlib.util
+import json
+import logging
+from prerequisites_tree import ReqsTree, reqs_from_dict, reqs_to_json
+import sqlite3
+from typing import Final
+
+# (prerequisites, corequisites) as returned by `parse_requirements()`; cached
+# results are stored as JSON and turned back into trees when read
+ReqsPair = tuple[ReqsTree | None, ReqsTree | None]
+
+# modules whose source determines the output of `parse_requirements()`; any
+# change to them invalidates the cache
+PARSER_MODULES: Final[tuple[str, ...]] = (
+    'course_parser', 'prerequisites_tree', 'tree_simplifier')
+
+
+def parser_version() -> str:
+    """
+    Returns a hash of the source code of the requirements parser.
+    """
+    digest = hashlib.sha256()
+    for name in PARSER_MODULES:
+        spec = importlib.util.find_spec(name)
+        with open(spec.origin, mode='rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    Content-addressed cache of `CourseInfoParser.parse_requirements()` results,
+    keyed by a hash of the description text and the parser version. Results
+    are stored on disk in an SQLite database so they persist between runs,
+    with an in-memory LRU cache of up to `memory_size` entries in front of it.
+
+    When the cache is opened with a different parser version than the one it
+    was written with, all stored entries are discarded, so results from an
+    older parser are never reused. New entries are written to disk when
+    `flush()` or `close()` is called.
+    """
+
+    def __init__(self, path: str, memory_size: int = 4096) -> None:
+        super().__init__()
+        self.logger = logging.getLogger('parsecache')
+        self.version = parser_version()
+        self.memory_size = memory_size
+        self.memory: OrderedDict[str, ReqsPair] = OrderedDict()
+        self.pending: dict[str, str] = {}
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT)')
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != self.version:
+            if row is not None:
+                self.logger.info('Parser has changed, clearing parse cache')
+            self.connection.execute('DELETE FROM entries')
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                (self.version,))
+        self.connection.commit()
+
+    def get(self, description: str) -> ReqsPair | None:
+        """
+        Returns the cached result for `description`, or `None` if there is
+        none.
+        """
+        key = self._key(description)
+        result = self.memory.get(key)
+        if result is not None:
+            self.memory.move_to_end(key)
+            return result
+        value = self.pending.get(key)
+        if value is None:
+            row = self.connection.execute(
+                'SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            value = row[0]
+        prereqs, coreqs = json.loads(value)
+        result = (reqs_from_dict(prereqs), reqs_from_dict(coreqs))
+        self._remember(key, result)
+        return result
+
+    def put(self, description: str, result: ReqsPair) -> None:
+        """
+        Caches `result` as the parse result for `description`.
+        """
+        key = self._key(description)
+        prereqs, coreqs = result
+        self.pending[key] = f'[{reqs_to_json(prereqs)}, {reqs_to_json(coreqs)}]'
+        self._remember(key, result)
+
+    def flush(self) -> None:
+        """
+        Writes new entries to disk.
+        """
+        if len(self.pending) == 0:
+            return
+        try:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?)',
+                self.pending.items())
+            self.connection.commit()
+        except sqlite3.Error as error:
+            self.logger.error(
+                'Error while writing parse cache:\n%s: %s', type(error), error)
+            return
+        self.pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+    def _key(self, description: str) -> str:
+        digest = hashlib.sha256(self.version.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(description.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _remember(self, key: str, result: ReqsPair) -> None:
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
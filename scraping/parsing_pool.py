@@ -0,0 +1,122 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from course_parser import CourseInfoParser, ListingText, ParseResult
+from instrumentation import instrument_parser
+import logging
+from metrics import ScrapingMetrics
+from parse_cache import ParseCache
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+# number of listings sent to a worker at once
+CHUNK_SIZE = 64
+
+# parser used by a worker process, set up by `_init_worker()`
+_worker_parser: CourseInfoParser | None = None
+
+
+def _init_worker(logger_name: str, parse_cache_path: str | None,
+                 timings: bool) -> None:
+    global _worker_parser
+    parse_cache = None
+    if parse_cache_path is not None:
+        parse_cache = ParseCache(parse_cache_path)
+    _worker_parser = CourseInfoParser(
+        logging.getLogger(logger_name), _new_metrics(timings), parse_cache)
+    if timings:
+        instrument_parser(_worker_parser)
+
+
+def _new_metrics(timings: bool) -> ScrapingMetrics:
+    metrics = ScrapingMetrics()
+    if timings:
+        metrics.enable_stage_timings()
+    return metrics
+
+
+# (results, metrics) of a chunk of listings parsed by a worker
+ChunkResult = tuple[list[ParseResult], ScrapingMetrics]
+
+
+def _parse_chunk(listings: list[ListingText]) -> ChunkResult:
+    """
+    Parses a chunk of listings in a worker process. Returns the results along
+    with the metrics recorded while parsing them.
+    """
+    timings = _worker_parser.metrics.stage_timings is not None
+    _worker_parser.metrics = _new_metrics(timings)
+    results = list(_worker_parser.parse_many(listings))
+    if _worker_parser.parse_cache is not None:
+        _worker_parser.parse_cache.flush()
+    return (results, _worker_parser.metrics)
+
+
+class ParsingPool:
+    """
+    Parses course listings in a pool of worker processes, so that the
+    regex-heavy requirements parsing does not block the Twisted reactor and can
+    use more than one core. Metrics counted by the workers are added to
+    `metrics` as results come back (including stage timings, if `metrics` has
+    them enabled). If `parse_cache_path` is given, each worker
+    opens its own `ParseCache` there.
+
+    Usage: call `parse()` from a spider callback and await the result, then
+    call `close()` when the spider closes.
+    """
+
+    def __init__(self, workers: int, metrics: ScrapingMetrics,
+                 logger_name: str = 'catalogspider',
+                 parse_cache_path: str | None = None) -> None:
+        super().__init__()
+        self.metrics = metrics
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(
+                logger_name,
+                parse_cache_path,
+                metrics.stage_timings is not None
+            )
+        )
+
+    def parse(self, listings: list[ListingText]) -> defer.Deferred:
+        """
+        Parses `listings` in the worker processes. Returns a `Deferred` which
+        fires with the list of results, in the same order as `listings`.
+        """
+        deferreds = []
+        for i in range(0, len(listings), CHUNK_SIZE):
+            future = self.executor.submit(
+                _parse_chunk, listings[i:i + CHUNK_SIZE])
+            deferreds.append(self._deferred_from_future(future))
+        d = defer.gatherResults(deferreds, consumeErrors=True)
+        d.addCallback(self._join_chunks)
+        return d
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def _join_chunks(self, chunks: list[ChunkResult]) -> list[ParseResult]:
+        results: list[ParseResult] = []
+        for chunk_results, chunk_metrics in chunks:
+            results.extend(chunk_results)
+            self.metrics.merge(chunk_metrics)
+        return results
+
+    def _deferred_from_future(self, future: Future) -> defer.Deferred:
+        """
+        Returns a `Deferred` which fires in the reactor thread when `future`
+        completes.
+        """
+        # imported here so that importing this module does not install a
+        # reactor before Scrapy chooses one
+        from twisted.internet import reactor
+        d = defer.Deferred()
+
+        def on_done(future: Future) -> None:
+            error = future.exception()
+            if error is None:
+                reactor.callFromThread(d.callback, future.result())
+            else:
+                reactor.callFromThread(d.errback, Failure(error))
+        future.add_done_callback(on_done)
+        return d
@@ -1,9 +1,32 @@
 from io import BufferedWriter
 from itemadapter import ItemAdapter
+from prerequisites_tree import PrerequisitesNode
 from scrapy.exporters import JsonLinesItemExporter
+from scrapy.utils.python import to_bytes
 
 
-ExporterMap = dict[str, tuple[JsonLinesItemExporter, BufferedWriter]]
+class ReqsJsonLinesItemExporter(JsonLinesItemExporter):
+    """
+    JSON Lines exporter for course items whose requirements may be
+    `PrerequisitesNode` trees. Fields are chosen and serialized as by
+    `JsonLinesItemExporter`, but trees are then written directly with
+    `PrerequisitesNode.to_json()` instead of being converted to dictionaries
+    first.
+    """
+
+    def export_item(self, item):
+        fields = []
+        for name, value in self.get_serialized_fields(item):
+            if isinstance(value, PrerequisitesNode):
+                value_json = value.to_json()
+            else:
+                value_json = self.encoder.encode(value)
+            fields.append(f'{self.encoder.encode(name)}: {value_json}')
+        data = '{' + ', '.join(fields) + '}\n'
+        self.file.write(to_bytes(data, self.encoding))
+
+
+ExporterMap = dict[str, tuple[ReqsJsonLinesItemExporter, BufferedWriter]]
 
 
 class PerDepartmentExportPipeline:
@@ -34,7 +57,7 @@ class PerDepartmentExportPipeline:
         filename = item['file']
         if filename not in self.exporter_map:
             file = open(f'intermediate/{filename}.jsonl', 'wb')
-            exporter = JsonLinesItemExporter(file)
+            exporter = ReqsJsonLinesItemExporter(file)
             exporter.start_exporting()
             self.exporter_map[filename] = (exporter, file)
         return self.exporter_map[filename][0]
@@ -1,9 +1,42 @@
+from course_bundle import BundleWriter, CourseBundle, write_bundle
+from course_store import CourseStore, DEFAULT_MEMORY_BUDGET
 from datetime import datetime
+import hashlib
 import json
 import jsonlines
 import logging
 from metrics import ScrapingMetrics
-from prerequisites_tree import ReqsDict
+import os
+from prerequisite_solver import PrerequisiteSolver, parse_units
+from prerequisites_evaluator import PrerequisitesEvaluator
+import queue
+import shutil
+from subtree_table import SubtreeRef, SubtreeTable
+from term_planner import DEFAULT_MAX_UNITS, TermPlanner
+import threading
+from typing import Final
+from utils import (ALL_SIDECAR_EXTENSIONS, link_if_unchanged,
+                   replace_if_changed, SIDECAR_EXTENSIONS, write_if_changed,
+                   write_sidecars)
+
+# files in the output directory which do not hold individual courses
+INDEX_FILES: Final[set[str]] = {
+    'departments.json', 'statistics.json', 'manifest.json'}
+# subdirectory of the output directory for copies of the output files named
+# by their content hashes
+HASHED_DIR: Final[str] = 'hashed'
+# subdirectory of the output directory for course bundles
+BUNDLE_DIR: Final[str] = 'bundle'
+# number of hexadecimal digits of the SHA-256 hash of each file's contents
+# to keep in the manifest
+HASH_LENGTH: Final[int] = 16
+# directory the output is written to in atomic mode, before it replaces the
+# output directory
+STAGING_DIR: Final[str] = 'data.staging'
+# where the previous output directory is moved while it is being replaced
+RETIRED_DIR: Final[str] = 'data.old'
+# number of files which may be waiting to be written per writer thread
+QUEUE_SIZE_PER_THREAD: Final[int] = 64
 
 
 class Postprocessor:
@@ -12,6 +45,45 @@ class Postprocessor:
     structure and format. The intermediate `.jsonl` files containing the
     original scraping output are left in place.
 
+    Each intermediate file is read and decoded only once: while reading, each
+    course is rendered to its output JSON and held in a `CourseStore` (which
+    spills to a temporary file past `memory_budget` bytes), and only a compact
+    record of it is kept for choosing the "authoritative" versions of courses
+    and joining successors before the rendered files are written.
+
+    The output directory is updated in place: each file's contents are hashed
+    and compared to the hashes in the manifest from the last run, so only
+    files which changed are written, and course files for courses which have
+    disappeared are deleted. Unchanged files keep their modification times.
+
+    The manifest, `manifest.json` in the output directory, maps the name of
+    each course file and `departments.json` to a hash of its contents, so
+    that clients can cache files for as long as their hashes are unchanged.
+    It only depends on the contents of the files, so identical data always
+    yields an identical manifest. If `hashed_copies` is set, a copy of each
+    file named by its hash is also kept in `HASHED_DIR`, for serving with
+    immutable caching.
+
+    If `bundle` is set, all courses are also packed into a single bundle file,
+    `courses.bin` in `BUNDLE_DIR` (see `BundleWriter`), and if `bundle_shards`
+    is also set, the courses listed by each department are packed into a
+    bundle of their own in `BUNDLE_DIR/departments`.
+
+    If `publish` is set, every output file is written as minified JSON with
+    its keys in sorted order, and each file (and bundle) gets precompressed
+    copies next to it, `.gz` and, if the `brotli` module is installed, `.br`,
+    so that static hosts can serve compressed files without compressing them
+    on each request. The total size of the output files, and of their
+    smallest precompressed copies, is reported in the metrics either way.
+
+    Files are written on `write_threads` threads, if any. In atomic mode, the
+    output is written to a staging directory which then replaces the output
+    directory, so that readers never see a half-written data set; if any
+    file fails to be written, the previous output is kept instead. If a run
+    was interrupted after moving the previous output aside but before moving
+    the new output in, the next run (in any mode) moves the previous output
+    back first.
+
     Usage: Initialize, then call `run()`:
     ```
     postprocessor = Postprocessor()
@@ -19,10 +91,73 @@ class Postprocessor:
     ```
     """
 
-    def __init__(self, metrics: ScrapingMetrics) -> None:
+    def __init__(self, metrics: ScrapingMetrics,
+                 subtrees_path: str | None = None,
+                 min_courses_path: str | None = None,
+                 min_units: bool = False,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 write_threads: int = 0, atomic: bool = False,
+                 hashed_copies: bool = False, bundle: bool = False,
+                 bundle_shards: bool = False, publish: bool = False) -> None:
         super().__init__()
         self.logger = logging.getLogger('postprocessor')
         self.metrics = metrics
+        # if set, the requirements of all courses are also written to this
+        # file in shared-subtree form (see `_write_shared_subtrees()`)
+        self.subtrees_path = subtrees_path
+        # if set, the fewest additional courses needed to take each course are
+        # precomputed and written to this file (see `_write_min_courses()`)
+        self.min_courses_path = min_courses_path
+        # if set, the fewest additional units needed to take each course are
+        # also precomputed, which takes a second solve of the whole catalog
+        self.min_units = min_units
+        # number of bytes of rendered course files to hold in memory before
+        # spilling them to a temporary file
+        self.memory_budget = memory_budget
+        # number of threads to write output files on; if 0, files are written
+        # on the calling thread
+        self.write_threads = write_threads
+        # if set, the output is written to `STAGING_DIR`, which replaces the
+        # output directory once everything has been written
+        self.atomic = atomic
+        # directory output files are written to
+        self.output_dir = STAGING_DIR if atomic else 'data'
+        # if set, a copy of each output file named by its content hash is
+        # written to `HASHED_DIR`
+        self.hashed_copies = hashed_copies
+        # if set, all courses are also packed into a bundle, and if
+        # `bundle_shards` is also set, each department's courses too
+        self.bundle = bundle
+        self.bundle_shards = bundle_shards
+        # writer of the bundle of all courses, while it is being written
+        self.bundle_writer: BundleWriter | None = None
+        # if set, output files are minified, with their keys sorted, and
+        # precompressed copies are written next to them
+        self.publish = publish
+        # writer of output files, while they are being written
+        self.writer: CourseWriter | None = None
+        # whether creating or writing any output file failed
+        self.write_failed = False
+        # maps the name of each output file written by the last run to the
+        # hash of its contents, as read from its manifest
+        self.manifest: dict[str, str] = {}
+        # rendered output file of every course read
+        self.course_store: CourseStore | None = None
+        # (course code, department code, index in `self.course_store`, whether
+        # it has prerequisites, whether it has corequisites) of every course
+        # read, in the order read
+        self.course_records: list[tuple[str, str, int, bool, bool]] = []
+        # whether reading any department's courses failed, other than because
+        # the department has no courses
+        self.read_failed = False
+        # every distinct requirements subtree in the catalog
+        self.subtrees = SubtreeTable()
+        # maps (course code, department code) to the interned requirements of
+        # that version of the course
+        self.course_reqs: dict[tuple[str, str], dict[str, SubtreeRef]] = {}
+        # maps (course code, department code) to the number of units of that
+        # version of the course
+        self.course_units: dict[tuple[str, str], float] = {}
         # maps department codes to department objects
         self.department_index: dict[str, dict] = {}
         # maps course codes to department codes
@@ -33,13 +168,109 @@ class Postprocessor:
 
     def run(self) -> None:
         self.logger.info('Starting postprocessing step')
+        recover_output_dir(self.logger)
         self._read_departments()
-        self._read_courses()
-        self._write_department_index()
-        self._rewrite_courses()
+        self.course_store = CourseStore(self.memory_budget)
+        self.write_failed = False
+        try:
+            self._read_courses()
+            self._read_manifest()
+            if self.atomic:
+                self._prepare_staging_dir()
+            self.writer = CourseWriter(
+                self.course_successors,
+                self.metrics,
+                self.manifest,
+                output_dir=self.output_dir,
+                previous_dir='data' if self.atomic else None,
+                threads=self.write_threads,
+                publish=self.publish
+            )
+            if self.bundle:
+                self._open_bundle()
+            try:
+                self._write_department_index()
+                self._write_courses()
+            finally:
+                self.writer.close()
+                self.write_failed |= len(self.writer.failed_files) > 0
+        finally:
+            self.course_store.close()
+        self.metrics.set_written_files(self.writer.written)
+        self.metrics.set_skipped_files(self.writer.skipped)
+        self.logger.info(
+            'Wrote %d output files, skipped %d unchanged, deleted %d stale',
+            self.metrics.get_written_files(),
+            self.metrics.get_skipped_files(),
+            self.metrics.get_deleted_files()
+        )
+        self._write_manifest()
+        self._write_hashed_copies()
+        self._write_bundles()
+        if self.subtrees_path is not None:
+            self._write_shared_subtrees()
+        if self.min_courses_path is not None:
+            self._write_min_courses()
+        self.logger.info(
+            'Output files take %d bytes, %d bytes precompressed',
+            self.metrics.get_output_bytes(),
+            self.metrics.get_compressed_bytes()
+        )
         self._write_statistics()
+        self._remove_sidecars(self.output_dir, self.writer.hashes.keys()
+                              | {'manifest.json', 'statistics.json'})
+        if self.atomic:
+            self._swap_output_dir()
         self.logger.info('Postprocessing finished')
 
+    def build_evaluator(self) -> PrerequisitesEvaluator:
+        """
+        Compiles the prerequisites of the "authoritative" version of each
+        course into a `PrerequisitesEvaluator`, for answering which courses a
+        set of completed courses unlocks. Must be called after `run()`.
+        """
+        prereqs = {}
+        for code, dept in self.course_index.items():
+            ref = self.course_reqs.get((code, dept), {}).get('prereqs')
+            if ref is not None:
+                prereqs[code] = self.subtrees.to_dict(ref)
+        return PrerequisitesEvaluator(prereqs, self.course_successors)
+
+    def build_solver(self, weighted: bool = False) -> PrerequisiteSolver:
+        """
+        Returns a `PrerequisiteSolver` over the prerequisites of the
+        "authoritative" version of each course, for finding the fewest
+        additional courses needed to take a course. If `weighted` is set,
+        courses are weighted by their units. Must be called after `run()`.
+        """
+        prereqs = {}
+        units = {}
+        for code, dept in self.course_index.items():
+            ref = self.course_reqs.get((code, dept), {}).get('prereqs')
+            if ref is not None:
+                prereqs[code] = ref
+            units[code] = self.course_units[(code, dept)]
+        return PrerequisiteSolver(
+            self.subtrees, prereqs, units if weighted else None)
+
+    def build_planner(self, max_units: float = DEFAULT_MAX_UNITS) -> TermPlanner:
+        """
+        Returns a `TermPlanner` over the requirements of the "authoritative"
+        version of each course, for planning terms of at most `max_units`
+        units. Must be called after `run()`.
+        """
+        prereqs = {}
+        coreqs = {}
+        units = {}
+        for code, dept in self.course_index.items():
+            reqs = self.course_reqs.get((code, dept), {})
+            if 'prereqs' in reqs:
+                prereqs[code] = reqs['prereqs']
+            if 'coreqs' in reqs:
+                coreqs[code] = reqs['coreqs']
+            units[code] = self.course_units[(code, dept)]
+        return TermPlanner(self.subtrees, prereqs, coreqs, units, max_units)
+
     def _read_departments(self):
         """
         Reads department information from `departments.jsonl` and populates
@@ -63,12 +294,16 @@ class Postprocessor:
         Reads course information from each department `.jsonl` file and
         populates `self.course_index`. In order to avoid large diffs, the
         entries are made in alphabetical order. Also sets the `numCourses` field
-        on each department dictionary in `self.department_index` and updates
-        `self.course_successors`.
+        on each department dictionary in `self.department_index`, interns each
+        course's requirements in `self.subtrees`, updates
+        `self.course_successors`, and renders each course's output file into
+        `self.course_store`.
         """
         self.logger.info('Reading courses')
         course_entries = []
         self.course_successors = {}
+        self.course_records = []
+        self.read_failed = False
         for dept in self.department_index.keys():
             dept_courses = []
             try:
@@ -78,8 +313,25 @@ class Postprocessor:
                         has_anchor = 'anchor' in course_obj
                         course_entries.append((code, dept, has_anchor))
                         dept_courses.append(code)
-                        self._process_successor(course_obj)
+                        reqs = self._intern_requirements(course_obj)
+                        self.course_reqs[(code, dept)] = reqs
+                        self.course_units[(code, dept)] = parse_units(
+                            course_obj.get('units'))
+                        if 'prereqs' in reqs:
+                            self._process_successor(code, reqs['prereqs'])
+                        index = self.course_store.add(
+                            render_json(course_obj, self.publish))
+                        self.course_records.append((
+                            code,
+                            course_obj['dept'],
+                            index,
+                            'prereqs' in course_obj,
+                            'coreqs' in course_obj
+                        ))
             except OSError as error:
+                # departments without any courses have no file at all
+                if not isinstance(error, FileNotFoundError):
+                    self.read_failed = True
                 self.logger.error(
                     'Error while reading %s courses:\n%s: %s',
                     dept,
@@ -92,42 +344,395 @@ class Postprocessor:
         for code, dept, has_anchor in course_entries:
             if has_anchor or code not in self.course_index:
                 self.course_index[code] = dept
+        stats = self.subtrees.stats()
+        self.metrics.set_requirement_nodes(stats['nodes'])
+        self.metrics.set_unique_requirement_nodes(stats['uniqueNodes'])
+        self.logger.info('Requirements have %d nodes, %d distinct',
+                         stats['nodes'], stats['uniqueNodes'])
+        if self.course_store.spilled > 0:
+            self.logger.info(
+                'Spilled %d rendered courses (%d bytes) to a temporary file',
+                self.course_store.spilled,
+                self.course_store.spill_size
+            )
 
     def _write_department_index(self):
         """
         Writes `self.department_index` to `departments.json`.
         """
         self.logger.info('Writing department index')
-        try:
-            with open('data/departments.json', mode='w') as file:
-                json.dump(self.department_index, file, indent=2)
-        except OSError as error:
-            self.logger.error(
-                'Error while writing departments:\n%s: %s', type(error), error)
+        self.writer.write_file(
+            'departments.json',
+            render_json(self.department_index, self.publish))
 
-    def _rewrite_courses(self):
+    def _write_courses(self):
         """
-        Reads all course information again and rewrites it to the output
+        Writes the courses rendered by `_read_courses()` to the output
         directory as individual JSON files. If the same course code appears in
         multiple departments, the version from the department mapped to in
         `self.course_index` is considered the "authoritative" one, and only that
-        version is written to JSON.
+        version is written to JSON. Course files which were not written by
+        this run are removed afterwards (in atomic mode, by leaving them out of
+        the staging directory). If the authoritative department lists a
+        course more than once, only its last listing is written, as it would
+        overwrite the others anyway.
         """
         self.logger.info('Writing courses')
-        writer = CourseWriter(self.course_successors, self.metrics)
-        for dept in self.department_index.keys():
+        # if a department lists a course more than once, the last listing wins
+        last_index = {code: index for code, dept, index, _, _
+                      in self.course_records if dept == self.course_index[code]}
+        for code, dept, index, has_prereqs, has_coreqs in self.course_records:
+            if dept != self.course_index[code] or index != last_index[code]:
+                # skip if not the "authoritative" version
+                continue
+            contents = self.writer.write_rendered(
+                code, self.course_store.get(index), has_prereqs, has_coreqs)
+            if self.bundle_writer is not None:
+                self.bundle_writer.add(code, contents.encode('utf-8'))
+        stale_files = self._find_stale_courses(self.writer.written_files)
+        if self.read_failed:
+            # courses missing because of a read error are not actually stale
+            self._keep_courses(stale_files)
+        elif self.atomic:
+            self.metrics.set_deleted_files(len(stale_files))
+        else:
+            self._remove_courses(stale_files)
+
+    def _prepare_staging_dir(self):
+        """
+        Creates an empty `STAGING_DIR`, removing any left over from an earlier
+        run.
+        """
+        try:
+            shutil.rmtree(STAGING_DIR, ignore_errors=True)
+            os.makedirs(STAGING_DIR)
+        except OSError as error:
+            self.write_failed = True
+            self.logger.error(
+                'Error while preparing staging directory:\n%s: %s',
+                type(error),
+                error
+            )
+
+    def _keep_courses(self, filenames: list[str]):
+        """
+        Keeps the given course files from the previous output as they are (in
+        atomic mode, by linking them into the staging directory, so that they
+        survive the swap).
+        """
+        for filename in filenames:
+            self.writer.keep_file(filename)
+            if self.bundle_writer is None:
+                continue
             try:
-                with jsonlines.open(f'intermediate/{dept}.jsonl', mode='r') as reader:
-                    for course_obj in reader:
-                        code = course_obj['code']
-                        if course_obj['dept'] != self.course_index[code]:
-                            # skip if not the "authoritative" version
-                            continue
-                        writer.write(course_obj)
+                with open(f'data/{filename}', mode='rb') as file:
+                    contents = file.read()
+                self.bundle_writer.add(json.loads(contents)['code'], contents)
+            except (OSError, ValueError, KeyError) as error:
+                self.write_failed = True
+                self.logger.error(
+                    'Error while bundling %s:\n%s: %s',
+                    filename,
+                    type(error),
+                    error
+                )
+
+    def _swap_output_dir(self):
+        """
+        Replaces the output directory with `STAGING_DIR`, unless writing any
+        file failed, in which case the previous output is left in place. Each
+        rename is atomic, so readers see either the complete previous output
+        or the complete new one, except between the two renames, when there is
+        no output directory. The output directory is tracked by git, so it
+        can't be a symbolic link to swap in a single rename; instead, if the
+        process stops between the renames, `recover_output_dir()` restores
+        the previous output on the next run.
+        """
+        if self.write_failed:
+            self.logger.error(
+                'Some output files could not be written; keeping the previous '
+                'output, and leaving the new output in %s', STAGING_DIR)
+            return
+        self.logger.info('Swapping in new output')
+        shutil.rmtree(RETIRED_DIR, ignore_errors=True)
+        try:
+            if os.path.exists('data'):
+                os.rename('data', RETIRED_DIR)
+            os.rename(STAGING_DIR, 'data')
+        except OSError as error:
+            self.logger.error(
+                'Error while swapping in new output:\n%s: %s',
+                type(error),
+                error
+            )
+            if not os.path.exists('data') and os.path.exists(RETIRED_DIR):
+                os.rename(RETIRED_DIR, 'data')
+            return
+        shutil.rmtree(RETIRED_DIR, ignore_errors=True)
+
+    def _find_stale_courses(self, written_files: set[str]) -> list[str]:
+        """
+        Returns the names of course files in the output directory which are
+        not in `written_files`, i.e. courses which have disappeared from the
+        catalog.
+        """
+        try:
+            existing_files = os.listdir('data')
+        except OSError as error:
+            self.logger.error(
+                'Error while listing output files:\n%s: %s', type(error), error)
+            return []
+        return [
+            filename for filename in sorted(existing_files)
+            if filename.endswith('.json') and filename not in INDEX_FILES
+            and filename not in written_files
+        ]
+
+    def _remove_courses(self, filenames: list[str]):
+        """
+        Deletes the given course files from the output directory.
+        """
+        deleted = 0
+        for filename in filenames:
+            self.logger.info('Removing stale course file %s', filename)
+            try:
+                os.remove(f'data/{filename}')
+                deleted += 1
             except OSError as error:
                 self.logger.error(
-                    'Error while rewriting %s courses:\n%s: %s',
-                    dept,
+                    'Error while removing %s:\n%s: %s',
+                    filename,
+                    type(error),
+                    error
+                )
+        self.metrics.set_deleted_files(deleted)
+
+    def _read_manifest(self):
+        """
+        Reads the content hashes of the files written by the last run from
+        its manifest into `self.manifest`, if there is one.
+        """
+        self.manifest = {}
+        try:
+            with open('data/manifest.json', mode='r') as file:
+                self.manifest = json.load(file)['files']
+        except FileNotFoundError:
+            self.logger.info('No manifest found; comparing file contents')
+        except (OSError, ValueError, KeyError) as error:
+            self.logger.error(
+                'Error while reading manifest:\n%s: %s', type(error), error)
+
+    def _write_manifest(self):
+        """
+        Writes the content hashes of the output files to `manifest.json` in
+        the output directory, with the files in sorted order. Files which
+        could not be written are left out, so that they are written again
+        next time.
+        """
+        self.logger.info('Writing manifest')
+        contents = render_json(
+            {'files': self.writer.hashes}, self.publish, sort_keys=True)
+        path = f'{self.output_dir}/manifest.json'
+        try:
+            if self.atomic:
+                changed = link_if_unchanged(
+                    path, contents, 'data/manifest.json')
+            else:
+                changed = write_if_changed(path, contents)
+            self._count_output(path, changed, contents.encode('utf-8'))
+        except OSError as error:
+            self.write_failed = True
+            self.logger.error(
+                'Error while writing manifest:\n%s: %s', type(error), error)
+
+    def _open_bundle(self):
+        """
+        Starts writing the bundle of all courses, to a temporary file which
+        `_write_bundles()` moves into place.
+        """
+        path = f'{self.output_dir}/{BUNDLE_DIR}/courses.bin'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.bundle_writer = BundleWriter(path + '.tmp')
+        except OSError as error:
+            self.write_failed = True
+            self.logger.error(
+                'Error while opening bundle:\n%s: %s', type(error), error)
+
+    def _write_bundles(self):
+        """
+        Finishes the bundle of all courses, and writes the department bundles
+        from it if `self.bundle_shards` is set. Bundles are only replaced if
+        their contents change, and bundles for departments which no longer
+        exist are removed. If `self.bundle` is not set, `BUNDLE_DIR` is
+        removed instead.
+        """
+        bundle_dir = f'{self.output_dir}/{BUNDLE_DIR}'
+        if self.bundle_writer is None:
+            if not self.bundle and not self.atomic:
+                shutil.rmtree(bundle_dir, ignore_errors=True)
+            return
+        self.logger.info('Writing bundles')
+        path = f'{bundle_dir}/courses.bin'
+        shard_dir = f'{bundle_dir}/departments'
+        try:
+            self.bundle_writer.close()
+            self.bundle_writer = None
+            self._replace_bundle(path)
+            self._remove_sidecars(bundle_dir, {'courses.bin'})
+            if not self.bundle_shards:
+                if not self.atomic:
+                    shutil.rmtree(shard_dir, ignore_errors=True)
+                return
+            os.makedirs(shard_dir, exist_ok=True)
+            with CourseBundle(path) as bundle:
+                for dept, dept_obj in self.department_index.items():
+                    write_bundle(f'{shard_dir}/{dept}.bin.tmp', (
+                        (code, bundle.get_bytes(code))
+                        for code in sorted(set(dept_obj['courses']))
+                        if code in bundle
+                    ))
+                    self._replace_bundle(f'{shard_dir}/{dept}.bin')
+            for filename in sorted(os.listdir(shard_dir)):
+                if filename.endswith('.bin') \
+                        and filename[:-len('.bin')] not in self.department_index:
+                    os.remove(f'{shard_dir}/{filename}')
+            self._remove_sidecars(shard_dir, {
+                f'{dept}.bin' for dept in self.department_index})
+        except (OSError, ValueError) as error:
+            self.write_failed = True
+            self.logger.error(
+                'Error while writing bundles:\n%s: %s', type(error), error)
+
+    def _replace_bundle(self, path: str):
+        """
+        Moves a newly written bundle from its temporary file to `path`, unless
+        the previous output has an identical one.
+        """
+        changed = replace_if_changed(
+            path + '.tmp', path, self._previous_path(path))
+        self._count_output(path, changed)
+
+    def _previous_path(self, path: str) -> str | None:
+        """
+        Returns the path of the previous version of an output file, which in
+        atomic mode is in the output directory being replaced.
+        """
+        if self.atomic:
+            return 'data' + path[len(self.output_dir):]
+        return None
+
+    def _count_output(self, path: str, changed: bool,
+                      contents: bytes | None = None):
+        """
+        Adds an output file written outside of `self.writer` to the byte
+        counts in the metrics, writing its precompressed copies first if
+        `self.publish` is set. If the file's `contents` are not given, they
+        are read back from `path` when needed.
+        """
+        if not self.publish:
+            self.metrics.add_output_bytes(
+                len(contents) if contents is not None else os.stat(path).st_size)
+            return
+        if contents is None:
+            with open(path, mode='rb') as file:
+                contents = file.read()
+        sizes = write_sidecars(
+            path, contents, self._previous_path(path), changed)
+        self.metrics.add_output_bytes(len(contents))
+        self.metrics.add_compressed_bytes(min(sizes))
+
+    def _remove_sidecars(self, directory: str, filenames: set[str]):
+        """
+        Removes the precompressed copies in `directory` which are out of
+        date: all of them if `self.publish` is not set, and otherwise those
+        of files not in `filenames` or of a kind no longer written. In atomic
+        mode, the output directory starts out empty, so there are none.
+        """
+        if self.atomic:
+            return
+        try:
+            existing = os.listdir(directory)
+        except OSError:
+            return
+        for name in sorted(existing):
+            base, extension = os.path.splitext(name)
+            if extension not in ALL_SIDECAR_EXTENSIONS:
+                continue
+            if self.publish and extension in SIDECAR_EXTENSIONS \
+                    and base in filenames:
+                continue
+            try:
+                os.remove(f'{directory}/{name}')
+            except OSError as error:
+                self.logger.error(
+                    'Error while removing %s:\n%s: %s',
+                    name,
+                    type(error),
+                    error
+                )
+
+    def _write_hashed_copies(self):
+        """
+        Copies each file in the manifest to `HASHED_DIR`, named by its content
+        hash (`AAS_10.json` becomes `AAS_10.<hash>.json`), and removes copies
+        which are no longer in the manifest. Copies are never modified once
+        written, so existing ones are kept (in atomic mode, by linking them).
+        If `self.hashed_copies` is not set, `HASHED_DIR` is removed instead.
+        """
+        hashed_dir = f'{self.output_dir}/{HASHED_DIR}'
+        if not self.hashed_copies:
+            if not self.atomic:
+                shutil.rmtree(hashed_dir, ignore_errors=True)
+            return
+        self.logger.info('Writing hashed copies')
+        copies = {
+            f'{filename[:-len(".json")]}.{digest}.json': filename
+            for filename, digest in self.writer.hashes.items()
+        }
+        if self.publish:
+            # precompressed copies of the copies
+            copies.update({
+                name + extension: filename + extension
+                for name, filename in list(copies.items())
+                for extension in SIDECAR_EXTENSIONS
+            })
+        try:
+            os.makedirs(hashed_dir, exist_ok=True)
+            existing = set(os.listdir(hashed_dir))
+        except OSError as error:
+            self.write_failed = True
+            self.logger.error(
+                'Error while preparing hashed copies:\n%s: %s',
+                type(error),
+                error
+            )
+            return
+        previous_dir = f'data/{HASHED_DIR}'
+        for name, filename in sorted(copies.items()):
+            if name in existing:
+                continue
+            try:
+                if self.atomic and os.path.exists(f'{previous_dir}/{name}'):
+                    os.link(f'{previous_dir}/{name}', f'{hashed_dir}/{name}')
+                else:
+                    shutil.copyfile(f'{self.output_dir}/{filename}',
+                                    f'{hashed_dir}/{name}')
+            except OSError as error:
+                self.write_failed = True
+                self.logger.error(
+                    'Error while copying %s:\n%s: %s',
+                    filename,
+                    type(error),
+                    error
+                )
+        for name in sorted(existing - copies.keys()):
+            try:
+                os.remove(f'{hashed_dir}/{name}')
+            except OSError as error:
+                self.logger.error(
+                    'Error while removing %s:\n%s: %s',
+                    name,
                     type(error),
                     error
                 )
@@ -137,80 +742,332 @@ class Postprocessor:
         Writes `statistics.json` to the output directory.
         """
         self.logger.info('Writing statistics')
+        statistics = {
+            'timestamp': datetime.now().isoformat(timespec='minutes'),
+            'deptCount': self.metrics.get_departments(),
+            'courseCount': self.metrics.get_courses(),
+            'withPrereqsCount': self.metrics.get_with_prerequisites(),
+            'withCoreqsCount': self.metrics.get_with_corequisites(),
+            'withSuccessorsCount': self.metrics.get_with_successors(),
+            'writtenCount': self.metrics.get_written_files(),
+            'skippedCount': self.metrics.get_skipped_files(),
+            'deletedCount': self.metrics.get_deleted_files(),
+            'outputBytes': self.metrics.get_output_bytes(),
+            'compressedBytes': self.metrics.get_compressed_bytes(),
+            'allStats': self.metrics.get_all()
+        }
+        timings = self.metrics.get_stage_timings()
+        if timings is not None:
+            statistics['parserTimings'] = timings
+        quarantine = self.metrics.get_quarantine()
+        if len(quarantine) > 0:
+            statistics['quarantine'] = quarantine
         try:
-            with open('data/statistics.json', mode='w') as file:
-                json.dump({
-                    'timestamp': datetime.now().isoformat(timespec='minutes'),
-                    'deptCount': self.metrics.get_departments(),
-                    'courseCount': self.metrics.get_courses(),
-                    'withPrereqsCount': self.metrics.get_with_prerequisites(),
-                    'withCoreqsCount': self.metrics.get_with_corequisites(),
-                    'withSuccessorsCount': self.metrics.get_with_successors(),
-                    'allStats': self.metrics.get_all()
-                }, file, indent=2)
+            contents = render_json(statistics, self.publish)
+            path = f'{self.output_dir}/statistics.json'
+            with open(path, mode='w') as file:
+                file.write(contents)
+            if self.publish:
+                write_sidecars(path, contents.encode('utf-8'))
         except OSError as error:
+            self.write_failed = True
             self.logger.error(
                 'Error while writing statistics:\n%s: %s', type(error), error)
 
-    def _process_successor(self, course: dict):
+    def _intern_requirements(self, course: dict) -> dict[str, SubtreeRef]:
+        """
+        Interns the given course's prerequisite and corequisite trees in
+        `self.subtrees`. Returns a dictionary with references to the interned
+        trees under the same keys as in the course. Trees which the table
+        rejects as malformed are logged and left out.
+        """
+        reqs = {}
+        for key in ('prereqs', 'coreqs'):
+            if key not in course:
+                continue
+            try:
+                reqs[key] = self.subtrees.intern(course[key])
+            except ValueError as error:
+                self.logger.error(
+                    'Error while interning %s of %s:\n%s: %s',
+                    key,
+                    course['code'],
+                    type(error),
+                    error
+                )
+        return reqs
+
+    def _process_successor(self, code: str, prereqs: SubtreeRef):
         """
         Appends the given course's code to the successors list of each of its
         prerequisite courses in `self.course_successors`.
         """
-        if 'prereqs' not in course:
-            return None
-        prereqs = course['prereqs']
-        prereqs_list = self._course_tree_to_list(prereqs)
-        for prereq_code in prereqs_list:
+        for prereq_code in self.subtrees.course_codes(prereqs):
             if prereq_code not in self.course_successors:
                 self.course_successors[prereq_code] = []
-            self.course_successors[prereq_code].append(course['code'])
+            self.course_successors[prereq_code].append(code)
 
-    def _course_tree_to_list(self, tree: ReqsDict | str) -> list[str]:
+    def _write_shared_subtrees(self):
         """
-        Flattens the given prerequisite tree into a list of course codes.
+        Writes the requirements of every course to `self.subtrees_path`, with
+        each distinct subtree stored once. The file holds a `subtrees` list of
+        canonical nodes, where child nodes are referred to by their index in
+        the list, and a `courses` object mapping each course code to its
+        `prereqs` and `coreqs`, each a course code or a subtree index. Only
+        the "authoritative" version of each course is included.
         """
-        if isinstance(tree, str):
-            return [tree]
-        result = []
-        self._course_tree_to_list_helper(tree, result)
-        return result
+        self.logger.info('Writing shared subtrees')
+        courses = {}
+        for code, dept in self.course_index.items():
+            reqs = self.course_reqs.get((code, dept))
+            if reqs:
+                courses[code] = reqs
+        try:
+            with open(self.subtrees_path, mode='w') as file:
+                json.dump({
+                    'subtrees': self.subtrees.to_list(),
+                    'courses': courses
+                }, file)
+        except OSError as error:
+            self.logger.error(
+                'Error while writing shared subtrees:\n%s: %s',
+                type(error),
+                error
+            )
 
-    def _course_tree_to_list_helper(
-            self, tree: ReqsDict, result: list[str]) -> list[str]:
-        for child in tree['courses']:
-            if isinstance(child, str):
-                result.append(child)
-            else:
-                self._course_tree_to_list_helper(child, result)
+    def _write_min_courses(self):
+        """
+        Solves for the fewest additional courses needed to take each course
+        with prerequisites, starting from no completed courses, and writes the
+        results to `self.min_courses_path`. Each course code maps to an object
+        with a `fewest` solution, counting courses, and if `self.min_units` is
+        set, a `fewestUnits` solution, counting units (see
+        `PrerequisiteSolver`); either is `null` if the course's prerequisites
+        can't be satisfied.
+        """
+        self.logger.info('Precomputing fewest additional courses')
+        fewest = self.build_solver().solve_all()
+        solutions = {
+            code: {'fewest': solution} for code, solution in fewest.items()}
+        results = [fewest]
+        if self.min_units:
+            fewest_units = self.build_solver(weighted=True).solve_all()
+            for code, solution in fewest_units.items():
+                solutions[code]['fewestUnits'] = solution
+            results.append(fewest_units)
+        unsolvable = sum(solution is None for solution in fewest.values())
+        approximate = sum(
+            not solution['optimal']
+            for result in results
+            for solution in result.values() if solution is not None)
+        self.logger.info(
+            'Solved %d courses: %d unsolvable, %d solutions not proven minimal',
+            len(solutions),
+            unsolvable,
+            approximate
+        )
+        try:
+            with open(self.min_courses_path, mode='w') as file:
+                json.dump(solutions, file)
+        except OSError as error:
+            self.logger.error(
+                'Error while writing fewest additional courses:\n%s: %s',
+                type(error),
+                error
+            )
 
 
 class CourseWriter:
-    def __init__(self, successor_map: dict[str, list[str]], metrics: ScrapingMetrics) -> None:
+    """
+    Writes output files to `output_dir`, leaving files untouched if their
+    contents would not change. Whether they would is decided by comparing the
+    hash of the new contents to `manifest`, the hashes of the files written
+    by the last run, or for files missing from it by comparing the contents
+    themselves. If `previous_dir` is set, `output_dir` is a staging directory
+    which will replace it, and unchanged files are linked from it instead.
+    If `threads` is positive, files are written on that many threads, fed
+    through a bounded queue, and `close()` must be called to wait for them.
+
+    If `publish` is set, courses are written as minified JSON with sorted
+    keys, and precompressed copies of each file are written next to it (see
+    `write_sidecars()`).
+
+    The hashes of the files written or left unchanged are kept in `hashes`,
+    and their numbers in `written` and `skipped`. Their sizes are added to
+    the metrics.
+
+    Errors while writing files are logged, and the names of the files which
+    could not be written are kept in `failed_files`.
+    """
+
+    def __init__(self, successor_map: dict[str, list[str]], metrics: ScrapingMetrics,
+                 manifest: dict[str, str] | None = None,
+                 output_dir: str = 'data', previous_dir: str | None = None,
+                 threads: int = 0, publish: bool = False) -> None:
         super().__init__()
         self.logger = logging.getLogger('postprocessor.writer')
         self.metrics = metrics
         self.successor_map = successor_map
+        self.manifest = manifest or {}
+        self.output_dir = output_dir
+        self.previous_dir = previous_dir
+        # if set, files are minified and precompressed copies are written
+        self.publish = publish
+        # names of all files written (or left unchanged) so far
+        self.written_files: set[str] = set()
+        # names of files which could not be written
+        self.failed_files: set[str] = set()
+        # content hashes of files written or left unchanged, and how many of
+        # each there were; updated under `lock` by the writer threads
+        self.hashes: dict[str, str] = {}
+        self.written = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+        # (file name, contents) of files waiting to be written, and the
+        # threads writing them; a `None` tells a thread to stop
+        self.queue: queue.Queue[tuple[str, str] | None] = queue.Queue(
+            maxsize=threads * QUEUE_SIZE_PER_THREAD)
+        self.threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(threads)
+        ]
+        for thread in self.threads:
+            thread.start()
 
     def write(self, course: dict) -> None:
         """
         Writes the given course object to output as JSON, slugifying the course
-        code to use as the file name. This method throws an exception if it
-        encounters an error while writing files.
+        code to use as the file name.
+        """
+        self.write_rendered(course['code'], render_json(course, self.publish),
+                            'prereqs' in course, 'coreqs' in course)
+
+    def write_rendered(self, code: str, contents: str, has_prereqs: bool,
+                       has_coreqs: bool) -> str:
+        """
+        Like `write()`, but takes the course already rendered as JSON with
+        `render_json()`. The course's successors are spliced in as its last
+        field, exactly as if they had been set on the course object before
+        rendering it (when publishing, keys are sorted, so the course is
+        rendered again instead). Returns the contents of the course file.
         """
-        code: str = course['code']
         self.metrics.inc_courses()
-        if 'prereqs' in course:
+        if has_prereqs:
             self.metrics.inc_with_prerequisites()
-        if 'coreqs' in course:
+        if has_coreqs:
             self.metrics.inc_with_corequisites()
-        if code in self.successor_map:
-            course['successors'] = self._sorted_unique(
-                self.successor_map[code])
+        if code in self.successor_map and self.publish:
+            course = json.loads(contents)
+            course['successors'] = self._sorted_unique(self.successor_map[code])
+            contents = render_json(course, compact=True)
             self.metrics.inc_with_successors()
-        filename = code.replace(' ', '_').replace('\u2013', '-')
-        with open(f'data/{filename}.json', mode='w') as file:
-            json.dump(course, file, indent=2)
+        elif code in self.successor_map:
+            successors = json.dumps(
+                {'successors': self._sorted_unique(self.successor_map[code])},
+                indent=2)
+            # `{\n  "successors": [...]\n}` appended as a field of the course
+            contents = contents[:-2] + ',' + successors[1:-2] + '\n}'
+            self.metrics.inc_with_successors()
+        filename = code.replace(' ', '_').replace('\u2013', '-') + '.json'
+        self.written_files.add(filename)
+        if self.threads:
+            self.queue.put((filename, contents))
+        else:
+            self.write_file(filename, contents)
+        return contents
+
+    def write_file(self, filename: str, contents: str) -> None:
+        """
+        Writes a file to the output directory right away, on the calling
+        thread.
+        """
+        encoded = contents.encode('utf-8')
+        digest = content_hash(encoded)
+        path = f'{self.output_dir}/{filename}'
+        previous_path = f'{self.previous_dir or self.output_dir}/{filename}'
+        try:
+            if self.manifest.get(filename) == digest \
+                    and _file_size(previous_path) == len(encoded):
+                if self.previous_dir is not None:
+                    os.link(previous_path, path)
+                written = False
+            elif filename in self.manifest:
+                # known to have changed
+                with open(path, mode='w') as file:
+                    file.write(contents)
+                written = True
+            elif self.previous_dir is not None:
+                written = link_if_unchanged(path, contents, previous_path)
+            else:
+                written = write_if_changed(path, contents)
+            sizes = write_sidecars(path, encoded, previous_path, written) \
+                if self.publish else []
+        except OSError as error:
+            self.failed_files.add(filename)
+            self.logger.error(
+                'Error while writing %s:\n%s: %s',
+                filename,
+                type(error),
+                error
+            )
+            return
+        with self.lock:
+            self.hashes[filename] = digest
+            if written:
+                self.written += 1
+            else:
+                self.skipped += 1
+            self.metrics.add_output_bytes(len(encoded))
+            if sizes:
+                self.metrics.add_compressed_bytes(min(sizes))
+
+    def keep_file(self, filename: str) -> None:
+        """
+        Keeps a file from the previous output as it is, for a file which
+        could not be generated again. Must be called on the calling thread.
+        """
+        previous_path = f'{self.previous_dir or self.output_dir}/{filename}'
+        path = f'{self.output_dir}/{filename}'
+        try:
+            with open(previous_path, mode='rb') as file:
+                contents = file.read()
+            digest = content_hash(contents)
+            if self.previous_dir is not None:
+                os.link(previous_path, path)
+            sizes = write_sidecars(path, contents, previous_path, False) \
+                if self.publish else []
+        except OSError as error:
+            self.failed_files.add(filename)
+            self.logger.error(
+                'Error while keeping %s:\n%s: %s',
+                filename,
+                type(error),
+                error
+            )
+            return
+        with self.lock:
+            self.hashes[filename] = digest
+            self.skipped += 1
+            self.metrics.add_output_bytes(len(contents))
+            if sizes:
+                self.metrics.add_compressed_bytes(min(sizes))
+
+    def close(self) -> None:
+        """
+        Waits for all queued files to be written, and stops the threads.
+        """
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _work(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self.write_file(*item)
 
     def _sorted_unique(self, l: list) -> list:
         """
@@ -225,3 +1082,58 @@ class CourseWriter:
             else:
                 i += 1
         return l
+
+
+def recover_output_dir(logger: logging.Logger) -> None:
+    """
+    Moves `RETIRED_DIR` back to the output directory if a swap was
+    interrupted between its two renames, leaving no output directory (or an
+    empty one, created since). Must be called before anything else creates
+    the output directory, as `scrape.py` does.
+    """
+    if not os.path.isdir(RETIRED_DIR):
+        return
+    try:
+        if os.path.isdir('data'):
+            if os.listdir('data'):
+                return
+            os.rmdir('data')
+        logger.warning(
+            'Output directory is missing; restoring the previous output from '
+            '%s', RETIRED_DIR)
+        os.rename(RETIRED_DIR, 'data')
+    except OSError as error:
+        logger.error(
+            'Error while restoring previous output:\n%s: %s',
+            type(error),
+            error
+        )
+
+
+def _file_size(path: str) -> int | None:
+    """
+    Returns the size of the file at `path` in bytes, or `None` if it can't be
+    found.
+    """
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def render_json(obj, compact: bool = False, sort_keys: bool = False) -> str:
+    """
+    Renders an output file's contents: indented, or if `compact` is set,
+    minified with its keys in sorted order.
+    """
+    if compact:
+        return json.dumps(obj, separators=(',', ':'), sort_keys=True)
+    return json.dumps(obj, indent=2, sort_keys=sort_keys)
+
+
+def content_hash(contents: bytes) -> str:
+    """
+    Returns the hash of a file's contents used in the manifest: the first
+    `HASH_LENGTH` hexadecimal digits of its SHA-256 hash.
+    """
+    return hashlib.sha256(contents).hexdigest()[:HASH_LENGTH]
@@ -0,0 +1,415 @@
+from __future__ import annotations
+import math
+from prerequisites_tree import ReqsDict
+import re
+from subtree_table import SubtreeRef, SubtreeTable
+from typing import Final, Iterable, TypedDict
+
+# maximum number of search steps to spend on one target before settling for
+# the best solution found so far
+DEFAULT_BUDGET: Final[int] = 100000
+# units assumed for courses whose unit count is missing or not a number
+DEFAULT_UNITS: Final[float] = 4
+
+# matches the first number in a unit count like "4", "2.5", or "1–4"
+_units_matcher = re.compile(r'[0-9]+(?:\.[0-9]+)?')
+
+
+class Solution(TypedDict):
+    # the additional courses, in an order in which they can be taken
+    courses: list[str]
+    # the number of courses, or their total units if weighted
+    cost: float
+    # whether the search finished within its budget, so `cost` is minimal
+    optimal: bool
+
+
+def parse_units(units: str | None) -> float:
+    """
+    Returns the (lowest) number of units in a course's unit count string, or
+    `DEFAULT_UNITS` if it has none.
+    """
+    match = _units_matcher.search(units or '')
+    if match is None:
+        return DEFAULT_UNITS
+    return float(match.group())
+
+
+class PrerequisiteSolver:
+    """
+    Finds the smallest set of additional courses which lets a student with a
+    given transcript take a target course: the set must satisfy the target's
+    prerequisites, and each course in it must have its own prerequisites
+    satisfied by the transcript and the courses before it, all the way down.
+    A course never counts towards its own prerequisites, so cycles are
+    stopped. If `units` is given, courses are weighted by their number of
+    units (see `parse_units()`) instead of counting one each.
+
+    Prerequisites are given as references into a `SubtreeTable`, so that
+    work on subtrees shared between courses is memoized across the search.
+    The search is a depth-first branch and bound over the alternatives of
+    `'one'` and `'two'` nodes, tried cheapest first by an estimate which
+    ignores courses shared between branches. Branches are pruned when their
+    cost plus a lower bound, the total weight of the courses which every
+    solution must still include, can't beat the best solution so far.
+    Finding the true minimum is NP-hard in general, so each search is limited
+    to `budget` steps, after which the best solution found is returned and
+    marked as not optimal.
+    """
+
+    def __init__(self, subtrees: SubtreeTable, prereqs: dict[str, SubtreeRef],
+                 units: dict[str, float] | None = None) -> None:
+        super().__init__()
+        self.subtrees = subtrees
+        self.prereqs = prereqs
+        self.units = units
+
+    @classmethod
+    def from_trees(cls, prereqs: dict[str, ReqsDict | str],
+                   units: dict[str, float] | None = None) -> PrerequisiteSolver:
+        """
+        Returns a solver for prerequisites in `ReqsDict` form, as in
+        `data/*.json`.
+        """
+        subtrees = SubtreeTable()
+        refs = {code: subtrees.intern(tree) for code, tree in prereqs.items()}
+        return cls(subtrees, refs, units)
+
+    def solve(self, target: str, completed: Iterable[str] = (),
+              budget: int = DEFAULT_BUDGET) -> Solution | None:
+        """
+        Returns the smallest set of additional courses needed to take
+        `target` after the courses in `completed`, or `None` if there is no
+        such set (because of a cycle).
+        """
+        return _Search(self, set(completed), budget).solve(target)
+
+    def solve_all(self, completed: Iterable[str] = (),
+                  budget: int = DEFAULT_BUDGET) -> dict[str, Solution | None]:
+        """
+        Solves for every course with prerequisites, in order of course code,
+        sharing memoized work between them.
+        """
+        search = _Search(self, set(completed), budget)
+        return {code: search.solve(code) for code in sorted(self.prereqs)}
+
+    def weight(self, code: str) -> float:
+        if self.units is None:
+            return 1
+        return self.units.get(code, DEFAULT_UNITS)
+
+
+class _Search:
+    """
+    State of the search for one transcript. Memoized estimates and lower
+    bounds depend only on the transcript, so they are kept between targets.
+    """
+
+    def __init__(self, solver: PrerequisiteSolver, completed: set[str],
+                 budget: int) -> None:
+        super().__init__()
+        self.solver = solver
+        self.nodes = solver.subtrees.nodes
+        self.completed = completed
+        self.budget = budget
+        # cached results of `_estimate()`, `_mandatory()`, and `_choices()`
+        self.estimates: dict[SubtreeRef, float] = {}
+        self.mandatory: dict[SubtreeRef, frozenset[str]] = {}
+        self.choices: dict[SubtreeRef, frozenset[int]] = {}
+        # references being computed by one of those methods, to stop on
+        # cycles
+        self.visiting: set[SubtreeRef] = set()
+
+    def solve(self, target: str) -> Solution | None:
+        prereqs = self.solver.prereqs.get(target)
+        if prereqs is None:
+            return {'courses': [], 'cost': 0, 'optimal': True}
+        # courses completed or added, with their prerequisites satisfied
+        self.have = set(self.completed)
+        # courses added whose prerequisites are not yet satisfied; always
+        # includes the target, so that nothing can depend on it
+        self.pending = {target}
+        # added courses, in the order their prerequisites were satisfied
+        self.order: list[str] = []
+        self.cost = 0.0
+        # requirements still to satisfy, as a stack of subtree references;
+        # a tuple `(code,)` marks where the prerequisites of an added course
+        # have all been satisfied
+        self.agenda: list[SubtreeRef | tuple[str]] = [prereqs]
+        # changes made to the state since the last branch, for undoing them
+        self.trail: list[tuple] = []
+        self.best_cost = math.inf
+        self.best_order: list[str] | None = None
+        self.steps = 0
+        self._search()
+        if self.best_order is None:
+            return None
+        return {
+            'courses': self.best_order,
+            'cost': self.best_cost,
+            'optimal': self.steps <= self.budget
+        }
+
+    def _search(self) -> None:
+        """
+        Satisfies requirements from the agenda until it reaches a `'one'` or
+        `'two'` node, then tries each of its alternatives recursively. The
+        state is restored before returning.
+        """
+        mark = len(self.trail)
+        agenda = self.agenda
+        while True:
+            self.steps += 1
+            if self.steps > self.budget or self.cost >= self.best_cost:
+                break
+            if not agenda:
+                self.best_cost = self.cost
+                self.best_order = list(self.order)
+                break
+            item = agenda.pop()
+            self.trail.append(('pop', item))
+            if isinstance(item, tuple):
+                code = item[0]
+                self.pending.remove(code)
+                self.have.add(code)
+                self.order.append(code)
+                self.trail.append(('resolve', code))
+            elif isinstance(item, str):
+                if item in self.have:
+                    continue
+                if item in self.pending:
+                    # a cycle
+                    break
+                self._add(item)
+            elif self._satisfied(item):
+                continue
+            else:
+                reqs_type, children = self.nodes[item]
+                if reqs_type == 'all':
+                    agenda.extend(reversed(children))
+                    self.trail.append(('push', len(children)))
+                    continue
+                if self.cost + self._lower_bound() >= self.best_cost:
+                    break
+                for option in self._options(reqs_type, children):
+                    agenda.extend(option)
+                    self._search()
+                    del agenda[-len(option):]
+                    if self.steps > self.budget:
+                        break
+                break
+        self._undo(mark)
+
+    def _add(self, code: str) -> None:
+        """
+        Adds a course, and puts its prerequisites on the agenda.
+        """
+        self.cost += self.solver.weight(code)
+        self.pending.add(code)
+        self.agenda.append((code,))
+        pushed = 1
+        prereqs = self.solver.prereqs.get(code)
+        if prereqs is not None:
+            self.agenda.append(prereqs)
+            pushed += 1
+        self.trail.append(('add', code))
+        self.trail.append(('push', pushed))
+
+    def _undo(self, mark: int) -> None:
+        trail = self.trail
+        while len(trail) > mark:
+            change = trail.pop()
+            match change[0]:
+                case 'pop':
+                    self.agenda.append(change[1])
+                case 'push':
+                    del self.agenda[-change[1]:]
+                case 'add':
+                    self.cost -= self.solver.weight(change[1])
+                    self.pending.remove(change[1])
+                case 'resolve':
+                    self.order.pop()
+                    self.have.remove(change[1])
+                    self.pending.add(change[1])
+
+    def _options(self, reqs_type: str,
+                 children: tuple[SubtreeRef, ...]) -> list[tuple[SubtreeRef, ...]]:
+        """
+        Returns the ways to satisfy a `'one'` or `'two'` node, cheapest first
+        by estimate. Children which are already satisfied cost nothing, so
+        they are always chosen.
+        """
+        satisfied = [child for child in children if self._satisfied(child)]
+        if reqs_type == 'one':
+            options = [(child,) for child in children]
+        else:
+            if len(satisfied) == 1:
+                options = [(satisfied[0], child) for child in children
+                           if child != satisfied[0]]
+            else:
+                options = [(a, b) for i, a in enumerate(children)
+                           for b in children[i + 1:]]
+        options.sort(key=lambda option: sum(
+            self._estimate(child) for child in option))
+        return options
+
+    def _satisfied(self, ref: SubtreeRef) -> bool:
+        if isinstance(ref, str):
+            return ref in self.have
+        reqs_type, children = self.nodes[ref]
+        if reqs_type == 'all':
+            return all(self._satisfied(child) for child in children)
+        if reqs_type == 'one':
+            return any(self._satisfied(child) for child in children)
+        return sum(self._satisfied(child) for child in children) >= 2
+
+    def _lower_bound(self) -> float:
+        """
+        Returns a lower bound on the cost of satisfying the rest of the
+        agenda: the total weight of the courses which every way of doing so
+        must still add, plus, for unsatisfied `'one'` and `'two'` nodes which
+        must also be satisfied, the cheapest set of further courses mandatory
+        for one of their alternatives. Nodes are only counted if the courses
+        of their alternatives don't overlap those of nodes already counted.
+        """
+        required: set[str] = set()
+        choices: set[int] = set()
+        for item in self.agenda:
+            if not isinstance(item, tuple):
+                required |= self._mandatory(item)
+                choices |= self._choices(item)
+        for code in required:
+            choices |= self._choices(code)
+        required -= self.have
+        required -= self.pending
+        weight = self.solver.weight
+        bound = sum(weight(code) for code in required)
+
+        known = required | self.have | self.pending
+        extras = []
+        for ref in choices:
+            if self._satisfied(ref):
+                continue
+            reqs_type, children = self.nodes[ref]
+            sets = [self._mandatory(child) - known for child in children]
+            if reqs_type == 'one':
+                options = sets
+            else:
+                options = [a | b for i, a in enumerate(sets)
+                           for b in sets[i + 1:]]
+            if not options:
+                continue
+            cheapest = min(sum(weight(code) for code in option)
+                           for option in options)
+            if cheapest > 0:
+                extras.append((cheapest, set().union(*sets)))
+        extras.sort(key=lambda extra: extra[0], reverse=True)
+        counted: set[str] = set()
+        for cheapest, candidates in extras:
+            if counted.isdisjoint(candidates):
+                bound += cheapest
+                counted |= candidates
+        return bound
+
+    def _choices(self, ref: SubtreeRef) -> frozenset[int]:
+        """
+        Returns the `'one'` and `'two'` nodes which must be satisfied to
+        satisfy `ref`, found through `'all'` nodes and the prerequisites of
+        courses not in the transcript. May leave some out on cycles.
+        """
+        result = self.choices.get(ref)
+        if result is not None:
+            return result
+        if ref in self.visiting:
+            return frozenset()
+        self.visiting.add(ref)
+        if isinstance(ref, str):
+            prereqs = self.solver.prereqs.get(ref)
+            if ref in self.completed or prereqs is None:
+                result = frozenset()
+            else:
+                result = self._choices(prereqs)
+        else:
+            reqs_type, children = self.nodes[ref]
+            if reqs_type == 'all':
+                result = frozenset().union(
+                    *(self._choices(child) for child in children))
+            else:
+                result = frozenset((ref,))
+        self.visiting.remove(ref)
+        self.choices[ref] = result
+        return result
+
+    def _mandatory(self, ref: SubtreeRef) -> frozenset[str]:
+        """
+        Returns courses not in the transcript which must be added to satisfy
+        `ref`: a course and its own mandatory prerequisites, everything
+        mandatory for any child of an `'all'` node, and for a `'one'` or
+        `'two'` node, courses mandatory for every child but at most one less
+        than needed. May leave some out on cycles, which keeps it a lower
+        bound.
+        """
+        result = self.mandatory.get(ref)
+        if result is not None:
+            return result
+        if ref in self.visiting:
+            return frozenset()
+        self.visiting.add(ref)
+        if isinstance(ref, str):
+            if ref in self.completed:
+                result = frozenset()
+            else:
+                prereqs = self.solver.prereqs.get(ref)
+                result = frozenset((ref,)) if prereqs is None \
+                    else self._mandatory(prereqs) | {ref}
+        else:
+            reqs_type, children = self.nodes[ref]
+            sets = [self._mandatory(child) for child in children]
+            if reqs_type == 'all' or len(sets) < 2:
+                result = frozenset().union(*sets)
+            else:
+                # a course is needed if at most `needed - 1` children lack it
+                allowed = 0 if reqs_type == 'one' else 1
+                counts: dict[str, int] = {}
+                for mandatory in sets:
+                    for code in mandatory:
+                        counts[code] = counts.get(code, 0) + 1
+                result = frozenset(
+                    code for code, count in counts.items()
+                    if count >= len(sets) - allowed)
+        self.visiting.remove(ref)
+        self.mandatory[ref] = result
+        return result
+
+    def _estimate(self, ref: SubtreeRef) -> float:
+        """
+        Returns the cost of satisfying `ref` from the transcript alone if no
+        courses were shared between branches, which is used to try cheaper
+        alternatives first. Infinite if a cycle was found on the way, which
+        only means the alternative is tried last.
+        """
+        result = self.estimates.get(ref)
+        if result is not None:
+            return result
+        if ref in self.visiting:
+            return math.inf
+        self.visiting.add(ref)
+        if isinstance(ref, str):
+            if ref in self.completed:
+                result = 0.0
+            else:
+                prereqs = self.solver.prereqs.get(ref)
+                result = self.solver.weight(ref) + (
+                    0.0 if prereqs is None else self._estimate(prereqs))
+        else:
+            reqs_type, children = self.nodes[ref]
+            costs = sorted(self._estimate(child) for child in children)
+            if reqs_type == 'all':
+                result = sum(costs)
+            elif reqs_type == 'one':
+                result = costs[0]
+            else:
+                result = sum(costs[:2]) if len(costs) >= 2 else math.inf
+        self.visiting.remove(ref)
+        self.estimates[ref] = result
+        return result
@@ -0,0 +1,215 @@
+from __future__ import annotations
+from prerequisites_tree import PrerequisitesNode, ReqsDict, ReqsTree
+from tree_simplifier import TreeKey, tree_key
+from typing import Final, Iterable
+
+# instruction opcodes, one per node type
+OP_ALL, OP_ONE, OP_TWO = range(3)
+_OPCODES: Final[dict[str, int]] = {'all': OP_ALL, 'one': OP_ONE, 'two': OP_TWO}
+
+# an instruction evaluating one node of a tree: (opcode, number of child node
+# results to pop from the stack, bitmask of the node's child courses)
+Instruction = tuple[int, int, int]
+# the instructions for a whole tree, in postfix order
+Program = tuple[Instruction, ...]
+
+
+class PrerequisitesEvaluator:
+    """
+    Answers which courses have their prerequisites satisfied by a set of
+    completed courses. Every course code in the catalog or in a prerequisites
+    tree is given an integer ID, so a set of completed courses can be held as
+    a bitset (a Python integer with bit `i` set if course `i` is completed).
+    Each prerequisites tree is compiled into a flat program of instructions
+    over that bitset, one per node: a node's child courses are tested all at
+    once against a bitmask, and only its child nodes need separate
+    instructions. Most trees compile to a single instruction.
+
+    `successors` maps each course code to the codes of the courses which have
+    it as a prerequisite (as built by the postprocessor; duplicates are
+    allowed), and is used by `Transcript` to re-evaluate only the courses
+    affected when a course is completed.
+
+    Children of a `'two'` node with the same `tree_key()` only count once,
+    while children which are equivalent but written differently count
+    separately, as in `tree_simplifier`.
+    """
+
+    def __init__(self, prereqs: dict[str, ReqsTree | ReqsDict],
+                 successors: dict[str, Iterable[str]]) -> None:
+        super().__init__()
+        codes: set[str] = set(prereqs)
+        for tree in prereqs.values():
+            _collect_codes(tree, codes)
+        # course codes by ID, and IDs by course code
+        self.codes: list[str] = sorted(codes)
+        self.ids: dict[str, int] = {
+            code: i for i, code in enumerate(self.codes)}
+        # compiled prerequisites of each course which has any
+        self.programs: dict[str, Program] = {}
+        for code, tree in prereqs.items():
+            program: list[Instruction] = []
+            self._compile(tree, program)
+            self.programs[code] = tuple(program)
+        # (code, mask) of courses whose programs are a single instruction, by
+        # opcode, and (code, program) of the rest, so that `unlocked()` can
+        # test most courses without a function call
+        self.single: tuple[list[tuple[str, int]], ...] = ([], [], [])
+        self.nested: list[tuple[str, Program]] = []
+        for code, program in self.programs.items():
+            if len(program) == 1:
+                opcode, _, mask = program[0]
+                self.single[opcode].append((code, mask))
+            else:
+                self.nested.append((code, program))
+        self.successors: dict[str, tuple[str, ...]] = {
+            code: tuple(sorted(set(dependents) & self.programs.keys()))
+            for code, dependents in successors.items()
+        }
+
+    def bitset(self, codes: Iterable[str]) -> int:
+        """
+        Returns the bitset of the given course codes. Codes which appear
+        nowhere in the catalog's prerequisites are ignored.
+        """
+        completed = 0
+        for code in codes:
+            i = self.ids.get(code)
+            if i is not None:
+                completed |= 1 << i
+        return completed
+
+    def is_satisfied(self, code: str, completed: int) -> bool:
+        """
+        Returns whether the prerequisites of the given course are satisfied
+        by the bitset `completed`. Courses without prerequisites always are.
+        """
+        program = self.programs.get(code)
+        if program is None:
+            return True
+        return _run(program, completed)
+
+    def unlocked(self, completed: int) -> set[str]:
+        """
+        Returns the codes of all courses with prerequisites which are
+        satisfied by the bitset `completed`.
+        """
+        all_masks, one_masks, two_masks = self.single
+        unlocked = {
+            code for code, mask in all_masks if completed & mask == mask}
+        unlocked.update(code for code, mask in one_masks if completed & mask)
+        unlocked.update(code for code, mask in two_masks
+                        if (completed & mask).bit_count() >= 2)
+        unlocked.update(code for code, program in self.nested
+                        if _run(program, completed))
+        return unlocked
+
+    def _compile(self, tree: ReqsTree | ReqsDict, program: list[Instruction]) -> None:
+        """
+        Appends the instructions evaluating `tree` to `program`.
+        """
+        if isinstance(tree, str):
+            program.append((OP_ALL, 0, 1 << self.ids[tree]))
+            return
+        if isinstance(tree, PrerequisitesNode):
+            reqs_type, reqs = tree.type, tree.reqs
+        else:
+            reqs_type, reqs = tree['type'], tree['courses']
+        mask = 0
+        nodes = 0
+        seen: set[TreeKey] = set()
+        for child in reqs:
+            if isinstance(child, str):
+                mask |= 1 << self.ids[child]
+                continue
+            child_program: list[Instruction] = []
+            self._compile(child, child_program)
+            opcode, _, child_mask = child_program[0]
+            if len(child_program) == 1 and opcode != OP_TWO \
+                    and child_mask & (child_mask - 1) == 0:
+                # a node of a single course, such as `A and A`
+                mask |= child_mask
+                continue
+            if reqs_type == 'two':
+                # child nodes with the same key only count once
+                key = tree_key(child)
+                if key in seen:
+                    continue
+                seen.add(key)
+            program.extend(child_program)
+            nodes += 1
+        program.append((_OPCODES[reqs_type], nodes, mask))
+
+
+class Transcript:
+    """
+    A set of completed courses, and the courses whose prerequisites they
+    satisfy, which can be updated incrementally with `add()`.
+    """
+
+    def __init__(self, evaluator: PrerequisitesEvaluator,
+                 completed: Iterable[str] = ()) -> None:
+        super().__init__()
+        self.evaluator = evaluator
+        # bitset of completed courses
+        self.completed = evaluator.bitset(completed)
+        # codes of the courses with prerequisites which are satisfied
+        self.unlocked = evaluator.unlocked(self.completed)
+
+    def add(self, code: str) -> list[str]:
+        """
+        Marks a course as completed, and returns the codes of the courses
+        which it unlocks. Since completing a course can never make
+        prerequisites unsatisfied, only the course's successors are
+        re-evaluated.
+        """
+        i = self.evaluator.ids.get(code)
+        if i is None or self.completed >> i & 1:
+            return []
+        self.completed |= 1 << i
+        newly_unlocked = []
+        for successor in self.evaluator.successors.get(code, ()):
+            if successor not in self.unlocked and _run(
+                    self.evaluator.programs[successor], self.completed):
+                self.unlocked.add(successor)
+                newly_unlocked.append(successor)
+        return newly_unlocked
+
+
+def _collect_codes(tree: ReqsTree | ReqsDict, codes: set[str]) -> None:
+    if isinstance(tree, str):
+        codes.add(tree)
+        return
+    reqs = tree.reqs if isinstance(tree, PrerequisitesNode) else tree['courses']
+    for child in reqs:
+        _collect_codes(child, codes)
+
+
+def _run(program: Program, completed: int) -> bool:
+    """
+    Evaluates a compiled tree against the bitset `completed`.
+    """
+    if len(program) == 1:
+        opcode, _, mask = program[0]
+        hits = completed & mask
+        if opcode == OP_ALL:
+            return hits == mask
+        if opcode == OP_ONE:
+            return hits != 0
+        return hits.bit_count() >= 2
+    stack: list[bool] = []
+    for opcode, nodes, mask in program:
+        hits = completed & mask
+        if nodes:
+            children = stack[-nodes:]
+            del stack[-nodes:]
+        else:
+            children = ()
+        if opcode == OP_ALL:
+            value = hits == mask and all(children)
+        elif opcode == OP_ONE:
+            value = hits != 0 or any(children)
+        else:
+            value = hits.bit_count() + sum(children) >= 2
+        stack.append(value)
+    return stack[0]
@@ -1,7 +1,9 @@
 from __future__ import annotations
+import json
+from json.encoder import encode_basestring_ascii
 from logging import Logger
 import re
-from typing import Literal, TypeVar, TypedDict
+from typing import Final, Literal, TypeVar, TypedDict
 
 Node = TypeVar('Node', bound='PrerequisitesNode')
 ReqsType = Literal['all', 'one', 'two']
@@ -23,8 +25,14 @@ class PrerequisitesNode:
     replaced by that child, and if it has zero children, then it is invalid.
     The user of the class should maintain this condition while generating the
     tree.
+
+    Nodes are slotted to keep trees small, and can be serialized to JSON
+    directly with `to_json()`; `to_dict()` gives the equivalent `ReqsDict` for
+    code which needs plain data.
     """
 
+    __slots__ = ('type', 'reqs')
+
     def __init__(self, type: ReqsType, reqs: ReqsList) -> None:
         super().__init__()
         self.type = type
@@ -84,12 +92,111 @@ class PrerequisitesNode:
             'courses': [mapping(x) for x in self.reqs]
         }
 
+    def to_json(self) -> str:
+        """
+        Returns the JSON representation of this `PrerequisitesNode`, which is
+        the same as `json.dumps(self.to_dict())` but is written without
+        building the dictionary first.
+        """
+        pieces: list[str] = []
+        self._append_json(pieces)
+        return ''.join(pieces)
+
+    def _append_json(self, pieces: list[str]) -> None:
+        pieces.append(f'{{"type": "{self.type}", "courses": [')
+        for i, x in enumerate(self.reqs):
+            if i > 0:
+                pieces.append(', ')
+            if isinstance(x, str):
+                pieces.append(encode_basestring_ascii(x))
+            else:
+                x._append_json(pieces)
+        pieces.append(']}')
+
+
+# a parsed requirements tree: a single course code, or a node
+ReqsTree = PrerequisitesNode | str
 
-_expr_1_matcher = re.compile(r'\band\b|(?P<end>(?=\)))')
-_expr_2_matcher = re.compile(r'\bor\b|(?P<end>(?=\band\b|\)))')
-_expr_3_matcher = re.compile(
-    r'(?P<code>[A-Z]{2,} [0-9]+[A-Z]*)|(?P<paren>\()|(?P<one_of>\b[Oo]ne\b)|(?P<two_of>\b[Tt]wo\b)|(?P<end>(?=\bor\b|\band\b|\)))')
-ExprParseResult = tuple[PrerequisitesNode | str | None, int]
+
+def reqs_to_json(reqs: ReqsTree | None) -> str:
+    """
+    Returns the JSON representation of a requirements tree, the same as
+    `json.dumps()` of its `ReqsDict` form.
+    """
+    if isinstance(reqs, PrerequisitesNode):
+        return reqs.to_json()
+    return json.dumps(reqs)
+
+
+def reqs_from_dict(reqs: ReqsDict | str | None) -> ReqsTree | None:
+    """
+    Returns the tree for a requirements tree in its `ReqsDict` form, the
+    inverse of `PrerequisitesNode.to_dict()`.
+    """
+    if reqs is None or isinstance(reqs, str):
+        return reqs
+    return PrerequisitesNode(
+        reqs['type'], [reqs_from_dict(child) for child in reqs['courses']])
+
+
+# token kinds in a tokenized requirements string
+_CODE, _OPEN, _CLOSE, _ONE_OF, _TWO_OF, _OR, _AND = range(7)
+_TOKEN_KINDS: Final[dict[str, int]] = {
+    'code': _CODE,
+    'open': _OPEN,
+    'close': _CLOSE,
+    'one_of': _ONE_OF,
+    'two_of': _TWO_OF,
+    'or': _OR,
+    'and': _AND
+}
+# matches any token in a requirements string
+_token_matcher = re.compile(
+    r'(?P<code>[A-Z]{2,} [0-9]+[A-Z]*)|(?P<open>\()|(?P<close>\))|(?P<one_of>\b[Oo]ne\b)|(?P<two_of>\b[Tt]wo\b)|(?P<or>\bor\b)|(?P<and>\band\b)')
+
+
+class _Tokens:
+    """
+    A requirements string split into tokens, stored as an array of token kinds
+    alongside the matches themselves (for their positions in the string and,
+    for `_CODE` tokens, their text). Anything between tokens is extraneous
+    text. Also holds lookup tables giving, for each token index, the index of
+    the next token which ends an `<expr1>`, `<expr2>`, or parenthesized
+    expression, so the parser never has to scan forward for them.
+    """
+
+    def __init__(self, reqs_str: str) -> None:
+        super().__init__()
+        self.length = len(reqs_str)
+        self.matches = list(_token_matcher.finditer(reqs_str))
+        self.kinds = [_TOKEN_KINDS[match.lastgroup] for match in self.matches]
+        count = self.count = len(self.kinds)
+        # next_close[k] is the index of the first `)` at or after index k,
+        # next_and[k] the first `and` or `)`, and next_or[k] the first `or`,
+        # `and`, or `)`; each is `self.count` if there is none
+        next_close = [count] * (count + 1)
+        next_and = [count] * (count + 1)
+        next_or = [count] * (count + 1)
+        close_index = and_index = or_index = count
+        for k in range(count - 1, -1, -1):
+            kind = self.kinds[k]
+            if kind == _CLOSE:
+                close_index = and_index = or_index = k
+            elif kind == _AND:
+                and_index = or_index = k
+            elif kind == _OR:
+                or_index = k
+            next_close[k] = close_index
+            next_and[k] = and_index
+            next_or[k] = or_index
+        self.next_close = next_close
+        self.next_and = next_and
+        self.next_or = next_or
+
+
+# (node, index of the next unparsed token, index in the string after the end
+# of the parsed expression)
+ExprParseResult = tuple[PrerequisitesNode | str | None, int, int]
 
 
 class PrerequisitesTreeGenerator:
@@ -122,7 +229,18 @@ class PrerequisitesTreeGenerator:
         `None` if no valid expression was found. `reqs_str` should be in normal
         form, satisfying the grammar described in this class' doc comment.
         """
-        root, i = self._parse_expr_1(reqs_str, 0)
+        root = self.parse_tree(reqs_str)
+        if isinstance(root, PrerequisitesNode):
+            return root.to_dict()
+        return root
+
+    def parse_tree(self, reqs_str: str) -> ReqsTree | None:
+        """
+        Parses `reqs_str` like `from_string()`, but returns the consolidated
+        `PrerequisitesNode` tree itself instead of its `ReqsDict` form.
+        """
+        tokens = _Tokens(reqs_str)
+        root, _, i = self._parse_expr_1(tokens, 0, 0)
         if i < len(reqs_str):
             self.logger.warn(
                 'Expression does not span entire string: "%s|%s"',
@@ -138,95 +256,96 @@ class PrerequisitesTreeGenerator:
             return root
         root.consolidate()
         self.logger.info('FINAL     : %s', str(root))
-        return root.to_dict()
+        return root
 
-    def _parse_expr_1(self, reqs_str: str, start: int) -> ExprParseResult:
+    def _parse_expr_1(self, tokens: _Tokens, k: int, i: int) -> ExprParseResult:
         """
-        Parses the `<expr1>` rule of the requirements string grammar. Returns
-        a tuple `(n, i)` where `n` is the resulting node and `i` is the first
-        index in `reqs_str` after the end of the parsed expression.
+        Parses the `<expr1>` rule of the requirements string grammar, starting
+        from token `k` at string index `i`. Returns a tuple `(n, k, i)` where
+        `n` is the resulting node, `k` is the index of the next token to parse,
+        and `i` is the first index in the string after the end of the parsed
+        expression.
         """
         reqs: ReqsList = []
-        i = start
-        while i < len(reqs_str):
-            child, i = self._parse_expr_2(reqs_str, i)
+        while k < tokens.count:
+            child, k, i = self._parse_expr_2(tokens, k, i)
             if child is not None:
                 reqs.append(child)
-            match = _expr_1_matcher.search(reqs_str, i)
-            if match is None:
+            # skip ahead to the next "and", or stop before a ")"
+            j = tokens.next_and[k]
+            if j == tokens.count:
                 break
-            i = match.end()
-            if match.group('end') is not None:
+            if tokens.kinds[j] == _CLOSE:
+                k, i = j, tokens.matches[j].start()
                 break
+            k, i = j + 1, tokens.matches[j].end()
         if len(reqs) == 0:
-            return (None, i)
+            return (None, k, i)
         elif len(reqs) == 1:
-            return (reqs[0], i)
-        return (PrerequisitesNode('all', reqs), i)
+            return (reqs[0], k, i)
+        return (PrerequisitesNode('all', reqs), k, i)
 
-    def _parse_expr_2(self, reqs_str: str, start: int) -> ExprParseResult:
+    def _parse_expr_2(self, tokens: _Tokens, k: int, i: int) -> ExprParseResult:
         """
         Parses the `<expr2>` rule of the requirements string grammar. Returns
-        a tuple `(n, i)` where `n` is the resulting node and `i` is the first
-        index in `reqs_str` after the end of the parsed expression.
+        a tuple `(n, k, i)` as in `_parse_expr_1()`.
         """
         reqs: ReqsList = []
-        i = start
-        while i < len(reqs_str):
-            child, i = self._parse_expr_3(reqs_str, i)
+        while k < tokens.count:
+            child, k, i = self._parse_expr_3(tokens, k, i)
             if child is not None:
                 reqs.append(child)
-            match = _expr_2_matcher.search(reqs_str, i)
-            if match is None:
+            # skip ahead to the next "or", or stop before an "and" or ")"
+            j = tokens.next_or[k]
+            if j == tokens.count:
                 break
-            i = match.end()
-            if match.group('end') is not None:
+            if tokens.kinds[j] != _OR:
+                k, i = j, tokens.matches[j].start()
                 break
+            k, i = j + 1, tokens.matches[j].end()
         if len(reqs) == 0:
-            return (None, i)
+            return (None, k, i)
         elif len(reqs) == 1:
-            return (reqs[0], i)
-        return (PrerequisitesNode('one', reqs), i)
+            return (reqs[0], k, i)
+        return (PrerequisitesNode('one', reqs), k, i)
 
-    def _parse_expr_3(self, reqs_str: str, start: int) -> ExprParseResult:
+    def _parse_expr_3(self, tokens: _Tokens, k: int, i: int) -> ExprParseResult:
         """
         Parses the `<expr3>` rule of the requirements string grammar. Returns
-        a tuple `(n, i)` where `n` is the resulting node and `i` is the first
-        index in `reqs_str` after the end of the parsed expression.
-        """
-        i = start
-        match = _expr_3_matcher.search(reqs_str, i)
-        if match is None or match.group('end') is not None:
-            return (None, i)
-        i = match.end()
-        code = match.group('code')
-        if code:
-            return (code, i)
-        elif match.group('paren'):
-            child, i = self._parse_expr_1(reqs_str, i)
-            while i < len(reqs_str) and reqs_str[i] != ')':
-                i += 1
-            return (child, i + 1)
+        a tuple `(n, k, i)` as in `_parse_expr_1()`.
+        """
+        if k == tokens.count:
+            return (None, k, i)
+        kind = tokens.kinds[k]
+        if kind == _CLOSE or kind == _AND or kind == _OR:
+            return (None, k, i)
+        i = tokens.matches[k].end()
+        k += 1
+        if kind == _CODE:
+            return (tokens.matches[k - 1].group(), k, i)
+        elif kind == _OPEN:
+            child, k, i = self._parse_expr_1(tokens, k, i)
+            # skip past the closing parenthesis, ignoring anything before it
+            j = tokens.next_close[k]
+            if j == tokens.count:
+                return (child, j, max(i, tokens.length) + 1)
+            return (child, j + 1, tokens.matches[j].end())
         else:
             # "one/two of the following" - assume it takes up the entire rest of
             # the string, with no sub-expressions
             reqs: ReqsList = []
-            reqs_type: ReqsType = 'one'
-            if match.group('two_of'):
-                reqs_type = 'two'
-            while i < len(reqs_str):
-                match = _expr_3_matcher.search(reqs_str, i)
-                if match is None:
-                    break
-                code = match.group('code')
-                if code:
-                    reqs.append(code)
-                if match.group('end') is not None:
-                    i += 1
+            reqs_type: ReqsType = 'two' if kind == _TWO_OF else 'one'
+            while k < tokens.count:
+                kind = tokens.kinds[k]
+                if kind == _CODE:
+                    reqs.append(tokens.matches[k].group())
+                if kind == _CLOSE or kind == _AND or kind == _OR:
+                    i = tokens.matches[k].start() + 1
                 else:
-                    i = match.end()
+                    i = tokens.matches[k].end()
+                k += 1
             if len(reqs) == 0:
-                return (None, i)
+                return (None, k, i)
             elif len(reqs) == 1:
-                return (reqs[0], i)
-            return (PrerequisitesNode(reqs_type, reqs), i)
+                return (reqs[0], k, i)
+            return (PrerequisitesNode(reqs_type, reqs), k, i)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+import os
+from scrapy.http import HtmlResponse
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    body: bytes
+    encoding: str | None
+    etag: str | None
+    last_modified: str | None
+
+
+class ResponseCache:
+    """
+    Persistent on-disk store of HTTP responses, keyed by URL. Each entry keeps
+    the response body along with the `ETag` and `Last-Modified` validators so
+    that later crawls can make conditional requests. Entries are stored as a
+    pair of files in `directory`: `<key>.json` holding the metadata and
+    `<key>.body` holding the raw body, where `<key>` is a hash of the URL.
+    """
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.logger = logging.getLogger('responsecache')
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str) -> CachedResponse | None:
+        """
+        Returns the stored response for `url`, or `None` if there is no entry
+        or it could not be read.
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, mode='r') as file:
+                meta = json.load(file)
+            with open(body_path, mode='rb') as file:
+                body = file.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            self.logger.warning(
+                'Error while reading cached response for %s:\n%s: %s',
+                url,
+                type(error),
+                error
+            )
+            return None
+        return CachedResponse(
+            url,
+            body,
+            meta.get('encoding'),
+            meta.get('etag'),
+            meta.get('last_modified')
+        )
+
+    def store(self, url: str, body: bytes, encoding: str | None,
+              etag: str | None, last_modified: str | None) -> None:
+        """
+        Stores a response for `url`, replacing any existing entry. The old
+        metadata is removed first, and each file is written to a temporary
+        file which then replaces it, with the body before the metadata, so a
+        partially written entry is never mistaken for a complete one: without
+        metadata, an entry is treated as missing.
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            with open(body_path + '.tmp', mode='wb') as file:
+                file.write(body)
+            os.replace(body_path + '.tmp', body_path)
+            with open(meta_path + '.tmp', mode='w') as file:
+                json.dump({
+                    'url': url,
+                    'encoding': encoding,
+                    'etag': etag,
+                    'last_modified': last_modified
+                }, file, indent=2)
+            os.replace(meta_path + '.tmp', meta_path)
+        except OSError as error:
+            self.logger.error(
+                'Error while caching response for %s:\n%s: %s',
+                url,
+                type(error),
+                error
+            )
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return (f'{base}.json', f'{base}.body')
+
+
+class ConditionalRequestMiddleware:
+    """
+    Downloader middleware which revalidates pages against the spider's
+    `response_cache`. Requests for cached URLs are sent with `If-None-Match`
+    and `If-Modified-Since` headers, and a `304 Not Modified` response is
+    replaced with the stored body so the spider parses it as usual. Fresh
+    `200` responses are written back to the cache. Does nothing if the spider
+    has no cache.
+    """
+
+    def process_request(self, request, spider):
+        cache: ResponseCache | None = getattr(spider, 'response_cache', None)
+        if cache is None:
+            return None
+        cached = cache.get(request.url)
+        if cached is None:
+            return None
+        if cached.etag is not None:
+            request.headers.setdefault('If-None-Match', cached.etag)
+        if cached.last_modified is not None:
+            request.headers.setdefault(
+                'If-Modified-Since', cached.last_modified)
+        return None
+
+    def process_response(self, request, response, spider):
+        cache: ResponseCache | None = getattr(spider, 'response_cache', None)
+        if cache is None:
+            return response
+        if response.status == 304:
+            cached = cache.get(request.url)
+            if cached is None:
+                spider.logger.warning(
+                    'Got 304 for %s but it is not cached', request.url)
+                return response
+            spider.logger.debug('Not modified: %s', request.url)
+            spider.metrics.inc_not_modified_pages()
+            return HtmlResponse(
+                url=response.url,
+                body=cached.body,
+                encoding=cached.encoding,
+                request=request,
+                flags=['cached']
+            )
+        if response.status == 200:
+            cache.store(
+                request.url,
+                response.body,
+                getattr(response, 'encoding', None),
+                self._header(response, 'ETag'),
+                self._header(response, 'Last-Modified')
+            )
+        return response
+
+    def _header(self, response, name: str) -> str | None:
+        value = response.headers.get(name)
+        if value is None:
+            return None
+        return value.decode('latin-1')
@@ -1,12 +1,17 @@
 import argparse
+from catalog_archive import CatalogArchive
 from catalog_spider import CatalogSpider
+from course_store import DEFAULT_MEMORY_BUDGET
+import logging
 from metrics import ScrapingMetrics
 import os
-from postprocessor import Postprocessor
+from postprocessor import Postprocessor, RETIRED_DIR, recover_output_dir
+from response_cache import ResponseCache
 from scrapy.crawler import CrawlerProcess
 import shutil
 import sys
 from typing import Final
+import zipfile
 
 
 LOG_LEVELS: Final[list[str]] = [
@@ -25,6 +30,42 @@ def _get_args() -> argparse.Namespace:
                         help='silence logs entirely')
     parser.add_argument('--dryrun', action='store_true', dest='dry_run',
                         help='run program without writing any scraped data')
+    parser.add_argument('--workers', action='store', type=int, default=0,
+                        metavar='N', dest='workers', help='number of worker processes to parse course listings in; defaults to 0, which parses them in the crawler process')
+    parser.add_argument('--parsecache', action='store', metavar='path/to/file',
+                        dest='parse_cache_path', help='database file in which to cache parsed course requirements between runs; the cache is cleared automatically whenever the parser changes')
+    parser.add_argument('--timings', action='store_true', dest='timings',
+                        help='time each stage of the requirements parser and report latency percentiles and the slowest descriptions in the statistics; adds some overhead')
+    parser.add_argument('--incremental', action='store_true', dest='incremental',
+                        help='keep the results of the last run and only reparse departments whose listings have changed')
+    parser.add_argument('--cache', action='store', metavar='path/to/dir',
+                        dest='cache_dir', help='directory of cached catalog pages to revalidate with conditional requests, so unchanged pages are not downloaded again; created if missing')
+    parser.add_argument('--subtrees', action='store', metavar='path/to/file',
+                        dest='subtrees_path', help='also write the requirements of all courses to this file, with each distinct requirements subtree stored only once')
+    parser.add_argument('--min-courses', action='store', metavar='path/to/file',
+                        dest='min_courses_path', help='also precompute the fewest additional courses needed to take each course from scratch, and write them to this file')
+    parser.add_argument('--min-units', action='store_true', dest='min_units',
+                        help='with --min-courses, also precompute the fewest additional units needed to take each course; solves the whole catalog a second time')
+    parser.add_argument('--memory-budget', action='store', type=int,
+                        default=DEFAULT_MEMORY_BUDGET // (1024 * 1024), metavar='MB',
+                        dest='memory_budget', help='megabytes of rendered course files the postprocessor holds in memory before spilling the rest to a temporary file; defaults to %d' % (DEFAULT_MEMORY_BUDGET // (1024 * 1024)))
+    parser.add_argument('--write-threads', action='store', type=int, default=0,
+                        metavar='N', dest='write_threads', help='number of threads to write output files on; defaults to 0, which writes them in the main thread')
+    parser.add_argument('--atomic', action='store_true', dest='atomic',
+                        help='write the output to a staging directory which replaces the data directory only once everything has been written, so the data directory is never left half-written')
+    parser.add_argument('--hashed-copies', action='store_true', dest='hashed_copies',
+                        help='also write a copy of each output file named by its content hash to data/hashed, for serving with immutable caching')
+    parser.add_argument('--bundle', action='store_true', dest='bundle',
+                        help='also pack all courses into a single bundle file with a sorted index, data/bundle/courses.bin')
+    parser.add_argument('--bundle-shards', action='store_true', dest='bundle_shards',
+                        help='with --bundle, also pack the courses listed by each department into a bundle of their own in data/bundle/departments')
+    parser.add_argument('--publish', action='store_true', dest='publish',
+                        help='write output files as minified JSON with sorted keys, with precompressed .gz copies (and .br copies, if the brotli module is installed) next to each file and bundle')
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument('--archive', action='store', metavar='path/to/archive',
+                               dest='archive_path', help='read catalog pages from a saved archive (a directory, or a file ending in .zip) instead of the network')
+    archive_group.add_argument('--record', action='store', metavar='path/to/archive',
+                               dest='record_path', help='save the crawled catalog pages to an archive (a directory, or a file ending in .zip) which can later be read with --archive')
     return parser.parse_args()
 
 
@@ -33,11 +74,16 @@ if __name__ == '__main__':
 
     if not args.dry_run:
         # prepare output directories
-        shutil.rmtree("intermediate", ignore_errors=True)
-        shutil.rmtree("data", ignore_errors=True)
+        # the data directory is kept, so that unchanged files aren't rewritten;
+        # if a swap of the data directory was interrupted, the previous one is
+        # restored first
+        recover_output_dir(logging.getLogger('postprocessor'))
+        if not args.incremental:
+            shutil.rmtree("intermediate", ignore_errors=True)
         try:
-            os.mkdir("intermediate")
-            os.mkdir("data")
+            os.makedirs("intermediate", exist_ok=True)
+            if not os.path.exists(RETIRED_DIR):
+                os.makedirs("data", exist_ok=True)
         except OSError as error:
             print('Error while preparing directories:\n%s: %s' %
                   (type(error), error), file=sys.stderr)
@@ -52,12 +98,44 @@ if __name__ == '__main__':
         'LOG_LEVEL': args.log_level,
         'LOG_STDOUT': True,
     })
-    process.crawl(CatalogSpider, dry_run=args.dry_run, metrics=metrics)
+    response_cache = None
+    if args.cache_dir is not None:
+        response_cache = ResponseCache(args.cache_dir)
+    archive = archive_recorder = None
+    try:
+        if args.archive_path is not None:
+            archive = CatalogArchive(args.archive_path, mode='r')
+        if args.record_path is not None:
+            archive_recorder = CatalogArchive(args.record_path, mode='w')
+    except (OSError, zipfile.BadZipFile) as error:
+        print('Error while opening archive:\n%s: %s' %
+              (type(error), error), file=sys.stderr)
+        sys.exit(1)
+    process.crawl(CatalogSpider, dry_run=args.dry_run, metrics=metrics,
+                  response_cache=response_cache, incremental=args.incremental,
+                  archive=archive, archive_recorder=archive_recorder,
+                  workers=args.workers, parse_cache_path=args.parse_cache_path,
+                  timings=args.timings)
     process.start()  # blocks until finished
+    for opened_archive in (archive, archive_recorder):
+        if opened_archive is not None:
+            opened_archive.close()
 
     if not args.dry_run:
         # do postprocessing
-        postprocessor = Postprocessor(metrics)
+        postprocessor = Postprocessor(
+            metrics,
+            subtrees_path=args.subtrees_path,
+            min_courses_path=args.min_courses_path,
+            min_units=args.min_units,
+            memory_budget=args.memory_budget * 1024 * 1024,
+            write_threads=args.write_threads,
+            atomic=args.atomic,
+            hashed_copies=args.hashed_copies,
+            bundle=args.bundle,
+            bundle_shards=args.bundle_shards,
+            publish=args.publish
+        )
         postprocessor.run()
 
     metrics.pretty_print()
@@ -0,0 +1,147 @@
+from prerequisites_tree import PrerequisitesNode, ReqsDict, ReqsType
+
+# a reference to an interned requirements tree: a course code string for a
+# single course, or the ID of a node in a `SubtreeTable`
+SubtreeRef = str | int
+
+
+class SubtreeTable:
+    """
+    Hash-consing table of requirements trees. Each tree added with `intern()`
+    is put into a canonical form, and every distinct subtree is stored exactly
+    once, so identical requirements shared by many courses (for example,
+    "MATH 20C or MATH 31BH") take up the space of one.
+
+    In canonical form, the children of each node are deduplicated and sorted
+    (course codes first, then nodes in order of ID), since every node type is
+    commutative. Children of `'all'` and `'one'` nodes which have the same
+    type as their parent are merged into it, and such nodes left with a single
+    child are replaced by that child. `'two'` nodes are never merged or
+    replaced, but duplicate children are still removed, as they must be two
+    different courses; a `'two'` node left with fewer than two children could
+    never be satisfied, so it is rejected with a `ValueError`.
+
+    Nodes are given IDs in the order they are first seen, and a node's
+    children always have smaller IDs than the node itself.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # (type, children) of each interned node, indexed by ID
+        self.nodes: list[tuple[ReqsType, tuple[SubtreeRef, ...]]] = []
+        # maps (type, children) to node IDs
+        self.ids: dict[tuple[ReqsType, tuple[SubtreeRef, ...]], int] = {}
+        # number of trees and of nodes in them passed to `intern()`
+        self.tree_count = 0
+        self.node_count = 0
+        # IDs of the nodes returned by `intern()`
+        self.roots: set[int] = set()
+        # cached results of `course_codes()`
+        self.codes_cache: dict[int, tuple[str, ...]] = {}
+
+    def intern(self, tree: ReqsDict | PrerequisitesNode | str) -> SubtreeRef:
+        """
+        Adds `tree` to the table if an identical tree is not already present,
+        and returns a reference to its canonical form.
+        """
+        self.tree_count += 1
+        ref = self._intern(tree)
+        if not isinstance(ref, str):
+            self.roots.add(ref)
+        return ref
+
+    def course_codes(self, ref: SubtreeRef) -> tuple[str, ...]:
+        """
+        Returns all the course codes in the referenced tree, in sorted order
+        and without duplicates. Results are cached for each node.
+        """
+        if isinstance(ref, str):
+            return (ref,)
+        codes = self.codes_cache.get(ref)
+        if codes is None:
+            found = set()
+            for child in self.nodes[ref][1]:
+                found.update(self.course_codes(child))
+            codes = self.codes_cache[ref] = tuple(sorted(found))
+        return codes
+
+    def to_dict(self, ref: SubtreeRef) -> ReqsDict | str:
+        """
+        Returns the `ReqsDict` representation of the referenced tree (or its
+        course code, for a single course).
+        """
+        if isinstance(ref, str):
+            return ref
+        reqs_type, children = self.nodes[ref]
+        return {
+            'type': reqs_type,
+            'courses': [self.to_dict(child) for child in children]
+        }
+
+    def to_list(self) -> list[dict]:
+        """
+        Returns every interned node, indexed by ID, in a form which can be
+        written to output as JSON. Each node is like a `ReqsDict`, except that
+        child nodes are given by their (integer) IDs.
+        """
+        return [
+            {'type': reqs_type, 'courses': list(children)}
+            for reqs_type, children in self.nodes
+        ]
+
+    def stats(self) -> dict:
+        """
+        Returns the number of trees and nodes interned and the number of
+        distinct nodes in the interned trees. Nodes which were only stored on
+        the way to being merged into their parents aren't counted.
+        """
+        reachable: set[int] = set()
+        stack = list(self.roots)
+        while stack:
+            node_id = stack.pop()
+            if node_id in reachable:
+                continue
+            reachable.add(node_id)
+            stack.extend(child for child in self.nodes[node_id][1]
+                         if not isinstance(child, str))
+        return {
+            'trees': self.tree_count,
+            'nodes': self.node_count,
+            'uniqueNodes': len(reachable)
+        }
+
+    def _intern(self, tree: ReqsDict | PrerequisitesNode | str) -> SubtreeRef:
+        if isinstance(tree, str):
+            return tree
+        self.node_count += 1
+        if isinstance(tree, PrerequisitesNode):
+            reqs_type, reqs = tree.type, tree.reqs
+        else:
+            reqs_type, reqs = tree['type'], tree['courses']
+        codes: set[str] = set()
+        ids: set[int] = set()
+        for child in reqs:
+            ref = self._intern(child)
+            if isinstance(ref, str):
+                codes.add(ref)
+            elif reqs_type != 'two' and self.nodes[ref][0] == reqs_type:
+                # merge a child of the same type into this node
+                for grandchild in self.nodes[ref][1]:
+                    if isinstance(grandchild, str):
+                        codes.add(grandchild)
+                    else:
+                        ids.add(grandchild)
+            else:
+                ids.add(ref)
+        children = (*sorted(codes), *sorted(ids))
+        if reqs_type == 'two' and len(children) < 2:
+            raise ValueError(
+                "'two' node has fewer than two distinct children: %r" % (tree,))
+        if len(children) == 1:
+            return children[0]
+        key = (reqs_type, children)
+        node_id = self.ids.get(key)
+        if node_id is None:
+            node_id = self.ids[key] = len(self.nodes)
+            self.nodes.append(key)
+        return node_id
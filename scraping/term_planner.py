@@ -0,0 +1,381 @@
+from __future__ import annotations
+import math
+from prerequisite_solver import DEFAULT_UNITS
+from prerequisites_tree import ReqsDict
+from subtree_table import SubtreeRef, SubtreeTable
+from typing import Final, Iterable, TypedDict
+
+# default cap on the units taken in one term, a typical full-time quarter
+DEFAULT_MAX_UNITS: Final[float] = 16
+
+
+class Plan(TypedDict):
+    # the courses to take in each term, in order
+    terms: list[list[str]]
+    # the total units taken in each term
+    units: list[float]
+    # a lower bound on the number of terms any plan needs
+    minimum: int
+    # whether the plan is known to use the fewest terms possible
+    optimal: bool
+
+
+class TermPlanner:
+    """
+    Plans a schedule of terms for taking a set of goal courses: each course is
+    taken in a term after the courses which satisfy its prerequisites, and no
+    earlier than the courses which satisfy its corequisites (which may be
+    taken in the same term). The total units of each term are capped, except
+    that a course (with the corequisites it needs) with more units than the
+    cap may be taken alone.
+
+    The earliest term in which each course can be taken, ignoring the cap, is
+    computed for the whole catalog when the planner is created and kept in
+    `earliest` (a course with no prerequisites has term 1, and one which can
+    never be taken, because of a cycle, has `math.inf`). It is the length of
+    the shortest chain of prerequisites leading up to the course, and a lower
+    bound on the terms needed for it.
+
+    Planning has two steps. The courses to take are chosen first, following
+    the alternatives of `'one'` and `'two'` nodes which can be satisfied
+    earliest, so that goals can be planned by their earliest terms when the
+    cap allows. Alternatives which need a course that can't be taken before
+    the course requiring them, because it has the course among its
+    corequisites (directly or through other corequisites), are tried last.
+    The chosen courses are then placed term by term with list scheduling: of
+    the courses whose prerequisites are satisfied, those with the longest
+    chain of chosen courses depending on them are placed first, together
+    with the corequisites they need, as long as the cap allows.
+    Minimizing the number of terms under a cap is NP-hard, so the plan is
+    compared against a lower bound, the larger of the goals' earliest terms
+    and the units of the courses every plan must include divided by the cap,
+    and marked optimal if it meets it.
+    """
+
+    def __init__(self, subtrees: SubtreeTable,
+                 prereqs: dict[str, SubtreeRef],
+                 coreqs: dict[str, SubtreeRef],
+                 units: dict[str, float] | None = None,
+                 max_units: float = DEFAULT_MAX_UNITS) -> None:
+        super().__init__()
+        self.subtrees = subtrees
+        self.nodes = subtrees.nodes
+        self.prereqs = prereqs
+        self.coreqs = coreqs
+        self.units = units or {}
+        self.max_units = max_units
+        # courses whose prerequisites (or corequisites) mention each course,
+        # to propagate changes to earliest terms
+        self.dependents: dict[str, set[str]] = {}
+        for reqs in (prereqs, coreqs):
+            for code, ref in reqs.items():
+                for required in subtrees.course_codes(ref):
+                    self.dependents.setdefault(required, set()).add(code)
+        # courses whose prerequisites mention each course
+        self.successors: dict[str, set[str]] = {}
+        for code, ref in prereqs.items():
+            for required in subtrees.course_codes(ref):
+                self.successors.setdefault(required, set()).add(code)
+        # courses whose corequisites mention each course
+        self.corequired_by: dict[str, set[str]] = {}
+        for code, ref in coreqs.items():
+            for required in subtrees.course_codes(ref):
+                self.corequired_by.setdefault(required, set()).add(code)
+        # earliest term of each course, starting from no completed courses
+        self.earliest: dict[str, float] = self.earliest_terms()
+
+    @classmethod
+    def from_trees(cls, prereqs: dict[str, ReqsDict | str],
+                   coreqs: dict[str, ReqsDict | str],
+                   units: dict[str, float] | None = None,
+                   max_units: float = DEFAULT_MAX_UNITS) -> TermPlanner:
+        """
+        Returns a planner for requirements in `ReqsDict` form, as in
+        `data/*.json`.
+        """
+        subtrees = SubtreeTable()
+        return cls(
+            subtrees,
+            {code: subtrees.intern(tree) for code, tree in prereqs.items()},
+            {code: subtrees.intern(tree) for code, tree in coreqs.items()},
+            units,
+            max_units
+        )
+
+    def weight(self, code: str) -> float:
+        return self.units.get(code, DEFAULT_UNITS)
+
+    def earliest_terms(self, completed: Iterable[str] = ()) -> dict[str, float]:
+        """
+        Returns the earliest term in which each course can be taken after the
+        courses in `completed`, which have term 0. Courses which appear in no
+        requirements and have none are left out, as they have term 1.
+
+        Terms only ever decrease from `math.inf` as they are found, so they
+        are computed like shortest paths: whenever a course's term decreases,
+        the courses which depend on it are re-evaluated, until nothing
+        changes. Corequisites are bounded by the terms of their courses by
+        prerequisites alone, so that courses which are corequisites of each
+        other don't wait on each other forever; corequisites of
+        corequisites are not followed.
+        """
+        earliest: dict[str, float] = dict.fromkeys(
+            self.prereqs.keys() | self.coreqs.keys() | self.dependents.keys(),
+            math.inf)
+        # earliest term of each course by its prerequisites alone
+        after = dict(earliest)
+        done = set(completed)
+        for code in done:
+            earliest[code] = after[code] = 0
+        queue = [code for code in earliest if code not in done]
+        queued = set(queue)
+        while queue:
+            code = queue.pop()
+            queued.remove(code)
+            prereqs = self.prereqs.get(code)
+            prereqs_term = 1 + self._ready(prereqs, earliest) \
+                if prereqs is not None else 1
+            coreqs = self.coreqs.get(code)
+            term = max(prereqs_term, self._ready(coreqs, after)) \
+                if coreqs is not None else prereqs_term
+            if prereqs_term >= after[code] and term >= earliest[code]:
+                continue
+            after[code] = prereqs_term
+            earliest[code] = term
+            for dependent in self.dependents.get(code, ()):
+                if dependent not in queued and dependent not in done:
+                    queue.append(dependent)
+                    queued.add(dependent)
+        return earliest
+
+    def plan(self, goals: Iterable[str], completed: Iterable[str] = (),
+             max_units: float | None = None) -> Plan | None:
+        """
+        Returns a plan for taking every course in `goals` after the courses
+        in `completed`, with at most `max_units` units per term (defaulting
+        to the planner's cap), or `None` if some goal can never be taken.
+        Raises `ValueError` if the goals can be taken but the courses chosen
+        for them can't be placed into terms, which only happens when every
+        alternative left is tied up in corequisites with the courses it is
+        required for.
+        """
+        if max_units is None:
+            max_units = self.max_units
+        done = set(completed)
+        earliest = self.earliest_terms(done) if done else self.earliest
+        goals = [code for code in dict.fromkeys(goals) if code not in done]
+        if any(earliest.get(code, 1) == math.inf for code in goals):
+            return None
+        chosen = self._choose(goals, earliest, done)
+        terms = self._schedule(chosen, earliest, done, max_units)
+        if terms is None:
+            raise ValueError(
+                'No plan found for the courses chosen for goals %s' % goals)
+        minimum = max(
+            max((earliest.get(code, 1) for code in goals), default=0),
+            math.ceil(sum(min(self.weight(code), max_units)
+                          for code in self._mandatory(goals, done))
+                      / max_units)
+        )
+        return {
+            'terms': terms,
+            'units': [sum(self.weight(code) for code in term)
+                      for term in terms],
+            'minimum': int(minimum),
+            'optimal': len(terms) <= minimum
+        }
+
+    def _ready(self, ref: SubtreeRef, earliest: dict[str, float]) -> float:
+        """
+        Returns the earliest term by the end of which a requirement can be
+        satisfied.
+        """
+        if isinstance(ref, str):
+            return earliest.get(ref, 1)
+        reqs_type, children = self.nodes[ref]
+        terms = [self._ready(child, earliest) for child in children]
+        if reqs_type == 'all':
+            return max(terms, default=0)
+        if reqs_type == 'one':
+            return min(terms, default=math.inf)
+        terms.sort()
+        return terms[1] if len(terms) >= 2 else math.inf
+
+    def _mandatory(self, goals: list[str], done: set[str]) -> set[str]:
+        """
+        Returns the goals and the courses which every plan for them must
+        include: those required through `'all'` nodes alone.
+        """
+        mandatory: set[str] = set()
+
+        def require(ref: SubtreeRef) -> None:
+            if isinstance(ref, str):
+                if ref not in done and ref not in mandatory:
+                    take(ref)
+                return
+            reqs_type, children = self.nodes[ref]
+            if reqs_type == 'all':
+                for child in children:
+                    require(child)
+
+        def take(code: str) -> None:
+            mandatory.add(code)
+            for reqs in (self.prereqs, self.coreqs):
+                ref = reqs.get(code)
+                if ref is not None:
+                    require(ref)
+
+        for code in goals:
+            take(code)
+        return mandatory
+
+    def _choose(self, goals: list[str], earliest: dict[str, float],
+                done: set[str]) -> list[str]:
+        """
+        Returns the goals and the courses chosen to satisfy their
+        requirements, taking the alternatives which can be satisfied earliest
+        and preferring ones already satisfied, then ones with fewer courses.
+        Alternatives for a course's prerequisites which can't be satisfied
+        without courses that must be taken no earlier than the course itself
+        (see `_corequired_by()`) come last.
+        """
+        chosen: dict[str, None] = {}
+
+        def key(ref: SubtreeRef,
+                blocked: set[str]) -> tuple[bool, float, bool, int]:
+            codes = self.subtrees.course_codes(ref)
+            return (not self._satisfied(ref, done,
+                                        set(codes).difference(blocked)),
+                    self._ready(ref, earliest),
+                    not self._satisfied(ref, done, chosen),
+                    len(codes))
+
+        def require(ref: SubtreeRef, blocked: set[str]) -> None:
+            if isinstance(ref, str):
+                if ref not in done and ref not in chosen:
+                    take(ref)
+                return
+            reqs_type, children = self.nodes[ref]
+            if reqs_type == 'all':
+                for child in children:
+                    require(child, blocked)
+                return
+            ranked = sorted(children, key=lambda child: key(child, blocked))
+            for child in ranked[:1 if reqs_type == 'one' else 2]:
+                require(child, blocked)
+
+        def take(code: str) -> None:
+            # added before its requirements, since corequisites may refer
+            # back to it
+            chosen[code] = None
+            prereqs = self.prereqs.get(code)
+            if prereqs is not None:
+                require(prereqs, self._corequired_by(code) - done)
+            coreqs = self.coreqs.get(code)
+            if coreqs is not None:
+                require(coreqs, set())
+
+        for code in goals:
+            if code not in chosen:
+                take(code)
+        return list(chosen)
+
+    def _corequired_by(self, code: str) -> set[str]:
+        """
+        Returns the course and the courses whose corequisites mention it,
+        directly or through other corequisites. None of them can be taken
+        before the course, so none can satisfy its prerequisites.
+        """
+        found = {code}
+        stack = [code]
+        while stack:
+            for dependent in self.corequired_by.get(stack.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    stack.append(dependent)
+        return found
+
+    def _schedule(self, chosen: list[str], earliest: dict[str, float],
+                  done: set[str], max_units: float) -> list[list[str]] | None:
+        """
+        Places the chosen courses into terms by list scheduling, or returns
+        `None` if some course can never be placed.
+        """
+        remaining = set(chosen)
+        # length of the longest chain of chosen courses which depend on each
+        # course through their prerequisites, counting the course itself;
+        # only dependents with a later earliest term count, so that chains
+        # follow the alternatives which were chosen and never loop
+        height: dict[str, int] = {}
+        for code in sorted(chosen, key=lambda code: -earliest.get(code, 1)):
+            height[code] = 1 + max((
+                height[dependent]
+                for dependent in self.successors.get(code, ())
+                if dependent in height
+                and earliest.get(dependent, 1) > earliest.get(code, 1)
+            ), default=0)
+        taken = set(done)
+        terms: list[list[str]] = []
+        while remaining:
+            available = {code for code in remaining
+                         if self._satisfied(self.prereqs.get(code), taken)}
+            term: list[str] = []
+            placed: set[str] = set()
+            units = 0.0
+            for code in sorted(available, key=lambda code: (
+                    -height[code], earliest.get(code, 1), code)):
+                if code in placed:
+                    continue
+                bundle = self._bundle(code, available, placed)
+                this_term = taken | placed | bundle
+                if not all(self._satisfied(self.coreqs.get(member), this_term)
+                           for member in bundle):
+                    continue
+                bundle_units = sum(self.weight(member) for member in bundle)
+                if term and units + bundle_units > max_units:
+                    continue
+                units += bundle_units
+                term.extend(sorted(bundle))
+                placed |= bundle
+                if units >= max_units:
+                    break
+            if not term:
+                return None
+            terms.append(term)
+            taken |= placed
+            remaining -= placed
+        return terms
+
+    def _bundle(self, code: str, available: set[str],
+                placed: set[str]) -> set[str]:
+        """
+        Returns a course together with the available courses its
+        corequisites mention, transitively, which haven't been placed in the
+        current term yet.
+        """
+        bundle = {code}
+        stack = [code]
+        while stack:
+            ref = self.coreqs.get(stack.pop())
+            if ref is None:
+                continue
+            for required in self.subtrees.course_codes(ref):
+                if required in available and required not in placed \
+                        and required not in bundle:
+                    bundle.add(required)
+                    stack.append(required)
+        return bundle
+
+    def _satisfied(self, ref: SubtreeRef | None,
+                   *taken: set[str] | dict[str, None]) -> bool:
+        if ref is None:
+            return True
+        if isinstance(ref, str):
+            return any(ref in courses for courses in taken)
+        reqs_type, children = self.nodes[ref]
+        satisfied = [self._satisfied(child, *taken) for child in children]
+        if reqs_type == 'all':
+            return all(satisfied)
+        if reqs_type == 'one':
+            return any(satisfied)
+        return sum(satisfied) >= 2
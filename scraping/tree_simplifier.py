@@ -0,0 +1,288 @@
+from __future__ import annotations
+from prerequisites_tree import PrerequisitesNode, ReqsDict, ReqsTree, ReqsType
+import random
+from typing import Final
+
+# trees with at most this many distinct courses are checked for equivalence
+# against every assignment of courses; larger ones against a random sample
+EXACT_VARIABLES: Final[int] = 16
+# number of random assignments checked for larger trees
+SAMPLED_ASSIGNMENTS: Final[int] = 1 << EXACT_VARIABLES
+
+# a tree with its children's order erased, so that trees which are equal up to
+# reordering have equal keys: a course code, or (type, frozenset of child keys)
+TreeKey = str | tuple[ReqsType, frozenset]
+
+
+def tree_key(tree: ReqsTree | ReqsDict) -> TreeKey:
+    """
+    Returns the key of a tree, in the same canonical form as `SubtreeTable`:
+    children of an `'all'` or `'one'` node with the same type are merged into
+    it, duplicate children are removed, and such a node left with a single
+    child has that child's key.
+
+    Children of a `'two'` node with equal keys are the same requirement, and
+    only count once towards the two; children which are equivalent but have
+    different keys count separately. Every module which evaluates trees
+    (`equivalent()` here, and `PrerequisitesEvaluator`) follows this rule.
+    """
+    if isinstance(tree, str):
+        return tree
+    if isinstance(tree, PrerequisitesNode):
+        reqs_type, reqs = tree.type, tree.reqs
+    else:
+        reqs_type, reqs = tree['type'], tree['courses']
+    keys: set[TreeKey] = set()
+    for child in reqs:
+        key = tree_key(child)
+        if reqs_type != 'two' and isinstance(key, tuple) \
+                and key[0] == reqs_type:
+            keys.update(key[1])
+        else:
+            keys.add(key)
+    if reqs_type != 'two' and len(keys) == 1:
+        return next(iter(keys))
+    return (reqs_type, frozenset(keys))
+
+
+def simplify(tree: ReqsTree) -> ReqsTree:
+    """
+    Returns a tree equivalent to `tree` with redundant requirements removed,
+    or `tree` itself if it can't be simplified. The original tree is not
+    modified. The following rules are applied bottom-up:
+
+    - flattening: a child of an `'all'` or `'one'` node with the same type is
+      replaced by its own children, and a node left with a single child is
+      replaced by that child;
+    - idempotence: children which are equal up to the order of their own
+      children are removed after the first (`A and A` is `A`);
+    - absorption: a child of an `'all'` node is removed if a sibling implies
+      it (`A and (A or B)` is `A`), and a child of a `'one'` node is removed
+      if it implies a sibling (`A or (A and B)` is `A`).
+
+    `'two'` nodes require two different children to be satisfied, where
+    children with the same `tree_key()` count as one, so their duplicate
+    children are removed, but they are never flattened, replaced, or absorbed
+    into. Their children are left unsimplified if simplifying them would make
+    different children the same, as that would change how many count.
+    Children otherwise keep their original order.
+    """
+    return _Simplifier().simplify(tree)
+
+
+def equivalent(a: ReqsTree, b: ReqsTree) -> bool:
+    """
+    Returns whether trees `a` and `b` are satisfied by exactly the same sets
+    of courses, by comparing their truth tables (with `'two'` nodes counting
+    children as described in `tree_key()`). Each table is evaluated over
+    all assignments at once by treating big integers as bit vectors, with one
+    bit per assignment. Trees with more than `EXACT_VARIABLES` distinct
+    courses are compared over `SAMPLED_ASSIGNMENTS` random (but fixed)
+    assignments instead, so a `True` result for them is very likely but not
+    certain.
+    """
+    codes = sorted(_course_codes(a) | _course_codes(b))
+    columns: dict[str, int] = {}
+    if len(codes) <= EXACT_VARIABLES:
+        width = 1 << len(codes)
+        for i, code in enumerate(codes):
+            # bit j of the column is bit i of j: runs of 2^i zeros then ones
+            period = 2 << i
+            run = ((1 << (1 << i)) - 1) << (1 << i)
+            columns[code] = run * (((1 << width) - 1) // ((1 << period) - 1))
+    else:
+        width = SAMPLED_ASSIGNMENTS
+        rng = random.Random(0)
+        for code in codes:
+            columns[code] = rng.getrandbits(width)
+    mask = (1 << width) - 1
+    return _truth_table(a, columns, mask) == _truth_table(b, columns, mask)
+
+
+def _course_codes(tree: ReqsTree) -> set[str]:
+    if isinstance(tree, str):
+        return {tree}
+    codes = set()
+    for child in tree.reqs:
+        codes |= _course_codes(child)
+    return codes
+
+
+def _truth_table(tree: ReqsTree, columns: dict[str, int], mask: int) -> int:
+    """
+    Returns the truth table of `tree` as a bit vector, given the column of
+    each course.
+    """
+    if isinstance(tree, str):
+        return columns[tree]
+    values = [_truth_table(child, columns, mask) for child in tree.reqs]
+    match tree.type:
+        case 'all':
+            result = mask
+            for value in values:
+                result &= value
+        case 'one':
+            result = 0
+            for value in values:
+                result |= value
+        case 'two':
+            # bits set in at least one and at least two of the children, where
+            # children with the same key only count once
+            ones = 0
+            result = 0
+            seen: set[TreeKey] = set()
+            for child, value in zip(tree.reqs, values):
+                key = tree_key(child)
+                if key in seen:
+                    continue
+                seen.add(key)
+                result |= ones & value
+                ones |= value
+        case _:
+            raise ValueError('Unrecognized ReqsType value: ' + tree.type)
+    return result
+
+
+class _Simplifier:
+    def __init__(self) -> None:
+        super().__init__()
+        self.changed = False
+        # keys of the children of each node built by `_simplify()`, by node ID
+        self.child_keys: dict[int, list[TreeKey]] = {}
+        # course codes in each node built by `_simplify()`, by key
+        self.codes: dict[TreeKey, frozenset[str]] = {}
+        # cached results of `_implies()`
+        self.implications: dict[tuple[TreeKey, TreeKey], bool] = {}
+
+    def simplify(self, tree: ReqsTree) -> ReqsTree:
+        simplified, _ = self._simplify(tree)
+        return simplified if self.changed else tree
+
+    def _simplify(self, tree: ReqsTree) -> tuple[ReqsTree, TreeKey]:
+        if isinstance(tree, str):
+            return (tree, tree)
+        flatten = tree.type != 'two'
+        changed = self.changed
+        reqs: list[ReqsTree] = []
+        keys: list[TreeKey] = []
+        seen: set[TreeKey] = set()
+
+        def add(child: ReqsTree, key: TreeKey) -> None:
+            if key in seen:
+                self.changed = True
+                return
+            seen.add(key)
+            reqs.append(child)
+            keys.append(key)
+
+        for child in tree.reqs:
+            child, key = self._simplify(child)
+            if flatten and isinstance(child, PrerequisitesNode) \
+                    and child.type == tree.type:
+                self.changed = True
+                for grandchild, grandchild_key in zip(
+                        child.reqs, self.child_keys[id(child)]):
+                    add(grandchild, grandchild_key)
+            else:
+                add(child, key)
+
+        if flatten:
+            reqs, keys = self._absorb(tree.type, reqs, keys)
+            if len(reqs) == 1:
+                self.changed = True
+                return (reqs[0], keys[0])
+        else:
+            original: dict[TreeKey, ReqsTree] = {}
+            for child in tree.reqs:
+                original.setdefault(tree_key(child), child)
+            if len(original) > len(reqs):
+                # simplifying made different children the same, so keep the
+                # original children, only without duplicates
+                self.changed = changed or len(original) < len(tree.reqs)
+                reqs = list(original.values())
+                keys = list(original.keys())
+                node = PrerequisitesNode(tree.type, reqs)
+                key = (tree.type, frozenset(keys))
+                self.child_keys[id(node)] = keys
+                self.codes.setdefault(key, frozenset(_course_codes(tree)))
+                return (node, key)
+        node = PrerequisitesNode(tree.type, reqs)
+        key = (tree.type, frozenset(keys))
+        self.child_keys[id(node)] = keys
+        if key not in self.codes:
+            self.codes[key] = frozenset().union(*(
+                self._codes(child_key) for child_key in keys))
+        return (node, key)
+
+    def _codes(self, key: TreeKey) -> frozenset[str]:
+        if isinstance(key, str):
+            return frozenset((key,))
+        return self.codes[key]
+
+    def _absorb(self, reqs_type: ReqsType, reqs: list[ReqsTree],
+                keys: list[TreeKey]) -> tuple[list[ReqsTree], list[TreeKey]]:
+        """
+        Removes children of an `'all'` node which are implied by a sibling, or
+        children of a `'one'` node which imply a sibling.
+        """
+        kept = [True] * len(reqs)
+        codes = [self._codes(key) for key in keys]
+        # distinct course codes never imply each other, so each pair compared
+        # includes at least one node
+        nodes = [j for j, key in enumerate(keys) if not isinstance(key, str)]
+        everything = range(len(keys))
+        for i, key in enumerate(keys):
+            for j in nodes if isinstance(key, str) else everything:
+                # requirements with no courses in common can't imply each
+                # other (apart from unsatisfiable ones, which are left alone)
+                if i == j or not kept[j] or codes[i].isdisjoint(codes[j]):
+                    continue
+                other = keys[j]
+                if self._implies(other, key) if reqs_type == 'all' \
+                        else self._implies(key, other):
+                    kept[i] = False
+                    self.changed = True
+                    break
+        if all(kept):
+            return (reqs, keys)
+        return (
+            [child for child, keep in zip(reqs, kept) if keep],
+            [key for key, keep in zip(keys, kept) if keep]
+        )
+
+    def _implies(self, x: TreeKey, y: TreeKey) -> bool:
+        """
+        Returns whether every set of courses satisfying `x` also satisfies
+        `y`. May return `False` for some implications it can't prove, but
+        never returns `True` wrongly.
+        """
+        if x == y:
+            return True
+        if isinstance(x, str) and isinstance(y, str):
+            return False
+        pair = (x, y)
+        result = self.implications.get(pair)
+        if result is not None:
+            return result
+        x_type, x_children = (None, None) if isinstance(x, str) else x
+        y_type, y_children = (None, None) if isinstance(y, str) else y
+        if y_type == 'one' and any(self._implies(x, c) for c in y_children):
+            result = True
+        elif x_type == 'all' and any(self._implies(c, y) for c in x_children):
+            result = True
+        elif x_type == 'one' and all(self._implies(c, y) for c in x_children):
+            result = True
+        elif y_type == 'all' and all(self._implies(x, c) for c in y_children):
+            result = True
+        elif x_type == 'two':
+            # two of x's children are satisfied, so at least one of them is
+            # one which implies y
+            result = sum(not self._implies(c, y) for c in x_children) <= 1
+        elif y_type == 'two':
+            # only distinct course codes are certain not to be equivalent
+            result = sum(isinstance(c, str) and self._implies(x, c)
+                         for c in y_children) >= 2
+        else:
+            result = False
+        self.implications[pair] = result
+        return result
@@ -1,9 +1,117 @@
-def splice(str1: str, str2: str, start: int, end: int | None = None) -> str:
+import filecmp
+import gzip
+import os
+from typing import Final
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# extensions of the precompressed copies written next to published files:
+# gzip always, and brotli if the `brotli` module is installed
+SIDECAR_EXTENSIONS: Final[tuple[str, ...]] = \
+    ('.gz', '.br') if brotli is not None else ('.gz',)
+# extensions of every kind of precompressed copy, installed or not
+ALL_SIDECAR_EXTENSIONS: Final[tuple[str, ...]] = ('.gz', '.br')
+
+
+def write_if_changed(path: str, contents: str) -> bool:
     """
-    Returns a copy of `str1` with `str2` replacing the portion between `start`
-    and `end` indices. `start` and `end` are interpreted as in slice notation.
-    If `end` is not provided, then it defaults to `start`.
+    Writes `contents` to the file at `path` unless the file already contains
+    exactly that text, so that unchanged files keep their modification times.
+    Returns whether the file was written.
     """
-    if end is None:
-        end = start
-    return str1[:start] + str2 + str1[end:]
+    try:
+        with open(path, mode='r') as file:
+            if file.read() == contents:
+                return False
+    except (OSError, ValueError):
+        pass
+    with open(path, mode='w') as file:
+        file.write(contents)
+    return True
+
+
+def link_if_unchanged(path: str, contents: str, previous_path: str) -> bool:
+    """
+    Creates the file at `path` with `contents`, for when it is staged to
+    replace the file at `previous_path`. If that file already contains
+    exactly that text, it is hard-linked to `path` instead of written again,
+    so that unchanged files keep their modification times once the staged
+    files are swapped in. Returns whether the file was written.
+    """
+    try:
+        with open(previous_path, mode='r') as file:
+            if file.read() == contents:
+                os.link(previous_path, path)
+                return False
+    except (OSError, ValueError):
+        pass
+    with open(path, mode='w') as file:
+        file.write(contents)
+    return True
+
+
+def replace_if_changed(new_path: str, path: str,
+                       previous_path: str | None = None) -> bool:
+    """
+    Moves the file at `new_path` to `path`, unless the file at
+    `previous_path` (by default, `path` itself) already has exactly the same
+    contents. In that case, `new_path` is removed instead, and if
+    `previous_path` is a different file, it is hard-linked to `path`, so that
+    unchanged files keep their modification times. Returns whether the file
+    was replaced.
+    """
+    if previous_path is None:
+        previous_path = path
+    try:
+        if filecmp.cmp(new_path, previous_path, shallow=False):
+            if previous_path != path:
+                os.link(previous_path, path)
+            os.remove(new_path)
+            return False
+    except OSError:
+        pass
+    os.replace(new_path, path)
+    return True
+
+
+def compress(contents: bytes, extension: str) -> bytes:
+    """
+    Compresses a file's contents for the sidecar with the given extension,
+    at the highest compression level. The output only depends on the
+    contents (gzip's timestamp is left at 0), so unchanged files always have
+    identical sidecars.
+    """
+    if extension == '.gz':
+        return gzip.compress(contents, compresslevel=9, mtime=0)
+    return brotli.compress(contents, quality=11)
+
+
+def write_sidecars(path: str, contents: bytes,
+                   previous_path: str | None = None,
+                   changed: bool = True) -> list[int]:
+    """
+    Writes a precompressed copy of the file at `path`, with `contents`, next
+    to it for each of `SIDECAR_EXTENSIONS`, for static hosts to serve as is.
+    If the file is not `changed`, existing copies are kept instead (or, if
+    `previous_path` is a different file, linked from next to it) and only
+    missing ones are written. Returns the size of each copy in bytes.
+    """
+    sizes = []
+    for extension in SIDECAR_EXTENSIONS:
+        sidecar = path + extension
+        if not changed:
+            try:
+                if previous_path is not None and previous_path != path:
+                    os.link(previous_path + extension, sidecar)
+                sizes.append(os.stat(sidecar).st_size)
+                continue
+            except OSError:
+                pass
+        compressed = compress(contents, extension)
+        with open(sidecar, mode='wb') as file:
+            file.write(compressed)
+        sizes.append(len(compressed))
+    return sizes
@@ -23,6 +23,9 @@ export const readDataFile: (filePath: string) => Promise<string> = async (
   return await fs.readFile(filePath, "utf-8");
 };
 
+// files in the data directory which aren't courses
+const INDEX_FILES = ["departments.json", "statistics.json", "manifest.json"];
+
 /**
  * Reads the data directory and extracts all course codes
  *
@@ -31,15 +34,12 @@ export const readDataFile: (filePath: string) => Promise<string> = async (
  */
 export const getCourseCodeSlugs: () => Promise<string[]> = async () => {
   const slugs = await readDataDirectory();
-  let index = slugs.indexOf("departments.json");
-  if (index != -1) {
-    slugs.splice(index, 1);
-  }
-  index = slugs.indexOf("statistics.json");
-  if (index != -1) {
-    slugs.splice(index, 1);
-  }
-  return slugs.map((slug) => slug.slice(0, -5)); // remove ".json"
+  return slugs
+    .filter(
+      // skip index files, subdirectories, and precompressed copies
+      (slug) => slug.endsWith(".json") && !INDEX_FILES.includes(slug)
+    )
+    .map((slug) => slug.slice(0, -5)); // remove ".json"
 };
 
 /**
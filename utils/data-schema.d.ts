@@ -17,6 +17,10 @@ export interface Course {
   successors?: string[];
 }
 
+export interface Manifest {
+  files: Record<string, string>;
+}
+
 export interface PrerequisitesSet {
   type: "all" | "one" | "two";
   courses: Array<string | PrerequisitesSet>;